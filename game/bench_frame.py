@@ -0,0 +1,259 @@
+"""
+Frame-loop benchmark. Runs the simulation headless over a grid of world
+sizes and reports frame-time percentiles per phase:
+
+    cpu_decide   scripted bots choosing a state (decide_cpu_state)
+    ai_infer     AI observation + batched ONNX inference
+    move_merge   steering, Blob.move and merge_blobs (PlayerController.update)
+    collisions   Engine._handle_collisions
+    draw         rendering the whole world (what draw_elements does per frame)
+    other        everything else in the frame (grid sync, mass decay, ...)
+
+By default each axis is swept on its own around a base configuration;
+--full runs the whole cartesian product. --decision-interval N lets every
+policy decide only every N frames (Config.DECISION_INTERVALS), which
+divides ai_infer by about N. Results go to JSON, and --compare
+flags phases that got slower between two result files:
+
+    python bench_frame.py --out before.json
+    python bench_frame.py --out after.json
+    python bench_frame.py --compare before.json after.json --threshold 0.15
+
+--hotspots N runs only the base configuration, under cProfile, and lists
+the N functions with the most time of their own.
+"""
+import argparse
+import cProfile
+import itertools
+import json
+import os
+import platform
+import pstats
+import sys
+import time
+
+import numpy as np
+
+from engine import Engine, PlayerController, cfg, load_ai_models
+
+PHASES = ('cpu_decide', 'ai_infer', 'move_merge', 'collisions', 'draw', 'other')
+AXES = {
+    'food': [200, 2000, 20000],
+    'cpu': [5, 50, 200],
+    'viruses': [5, 30, 100],
+    'ai': [0, 6, 15],
+}
+BASE = {'food': 2000, 'cpu': 50, 'viruses': 30, 'ai': 0}
+
+
+class PhaseClock:
+    """
+    Attributes time spent in the wrapped methods to phases. The wrappers are
+    installed on the classes for the duration of a run and removed after.
+    """
+    def __init__(self):
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self._patched = []
+
+    def wrap(self, owner, name, phase):
+        original = getattr(owner, name)
+        current, clock = self.current, time.perf_counter
+        def timed(*args, **kwargs):
+            start = clock()
+            try: return original(*args, **kwargs)
+            finally: current[phase] += clock() - start
+        setattr(owner, name, timed)
+        self._patched.append((owner, name, original))
+
+    def install(self, engine):
+        self.wrap(PlayerController, 'decide_cpu_state', 'cpu_decide')
+        self.wrap(PlayerController, 'update', 'move_merge')
+        self.wrap(Engine, '_observe', 'ai_infer')
+        self.wrap(engine.policy_batcher, 'run', 'ai_infer')
+        self.wrap(Engine, '_handle_collisions', 'collisions')
+        self.wrap(Engine, 'render', 'draw')
+
+    def remove(self):
+        for owner, name, original in reversed(self._patched):
+            if isinstance(owner, type): setattr(owner, name, original)
+            else: delattr(owner, name)
+        self._patched.clear()
+
+    def start_frame(self):
+        for phase in PHASES: self.current[phase] = 0.0
+
+
+def settings_for(config):
+    per_model, extra = divmod(config['ai'], 3)
+    ai_opponents = {name: per_model + (i < extra) for i, name in enumerate(('aggressor', 'farmer', 'survivor'))}
+    return {'num_cpu': config['cpu'], 'num_food': config['food'],
+            'num_viruses': config['viruses'], 'ai_opponents': ai_opponents}
+
+
+def config_key(config):
+    return ','.join(f"{axis}={config[axis]}" for axis in AXES)
+
+
+def configurations(full, base):
+    if full:
+        for values in itertools.product(*AXES.values()):
+            yield dict(zip(AXES, values))
+        return
+    seen = set()
+    for axis, values in AXES.items():
+        for value in values:
+            config = dict(base, **{axis: value})
+            if config_key(config) not in seen:
+                seen.add(config_key(config))
+                yield config
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+    return {'mean': float(samples.mean()), 'p50': float(p50), 'p90': float(p90),
+            'p99': float(p99), 'max': float(samples.max())}
+
+
+def run_config(config, ai_models, frames, warmup, seed):
+    engine = Engine(ai_models=ai_models)
+    engine.reset(seed=seed, **settings_for(config))
+    missing = config['ai'] - (len(engine.agents) - 1)
+    rng = np.random.default_rng(seed)
+    mouse = (cfg.SCREEN_WIDTH / 2, cfg.SCREEN_HEIGHT / 2)
+    clock = PhaseClock()
+    clock.install(engine)
+    samples = {phase: [] for phase in PHASES + ('total',)}
+    try:
+        for frame in range(warmup + frames):
+            if frame % 60 == 0:
+                mouse = (float(rng.uniform(0, cfg.SCREEN_WIDTH)), float(rng.uniform(0, cfg.SCREEN_HEIGHT)))
+            clock.start_frame()
+            start = time.perf_counter()
+            engine.update_game_state(mouse_pos=mouse)
+            engine.render()
+            total = time.perf_counter() - start
+            if frame < warmup: continue
+            measured = clock.current
+            measured['other'] = max(0.0, total - sum(measured[p] for p in PHASES if p != 'other'))
+            for phase in PHASES: samples[phase].append(measured[phase] * 1000)
+            samples['total'].append(total * 1000)
+    finally:
+        clock.remove()
+    total = percentiles(samples['total'])
+    result = {'config': config, 'key': config_key(config), 'frames': frames,
+              'fps': 1000 / total['mean'], 'total': total,
+              'phases': {phase: percentiles(samples[phase]) for phase in PHASES}}
+    if missing > 0: result['missing_ai'] = missing
+    return result
+
+
+def hotspots(config, ai_models, frames, warmup, seed, top):
+    """Prints the functions with the most self time over frames of config."""
+    engine = Engine(ai_models=ai_models)
+    engine.reset(seed=seed, **settings_for(config))
+    rng = np.random.default_rng(seed)
+    def play(count):
+        for frame in range(count):
+            if frame % 60 == 0: mouse = (float(rng.uniform(0, cfg.SCREEN_WIDTH)), float(rng.uniform(0, cfg.SCREEN_HEIGHT)))
+            engine.update_game_state(mouse_pos=mouse)
+            engine.render()
+    play(warmup)
+    profile = cProfile.Profile()
+    profile.runcall(play, frames)
+    stats = pstats.Stats(profile)
+    total = sum(entry[2] for entry in stats.stats.values())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+    print(f"{config_key(config)}: {total / frames * 1000:.2f} ms/frame profiled")
+    print(f"{'self ms/frame':>13} {'share':>6} {'calls/frame':>11}  function")
+    for (path, line, name), (_, calls, self_time, _, _) in rows:
+        where = f"{os.path.basename(path)}:{line}({name})" if line else name
+        print(f"{self_time / frames * 1000:13.3f} {self_time / total:6.1%} {calls / frames:11.1f}  {where}")
+
+
+def environment():
+    try:
+        import onnxruntime
+        ort_version = onnxruntime.__version__
+    except ImportError:
+        ort_version = None
+    import pygame
+    return {'python': sys.version.split()[0], 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'numpy': np.__version__, 'pygame': pygame.version.ver,
+            'onnxruntime': ort_version, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def print_result(result):
+    phases = result['phases']
+    cells = ' '.join(f"{phases[p]['p50']:7.2f}/{phases[p]['p99']:<7.2f}" for p in PHASES)
+    print(f"{result['key']:<38} {result['fps']:7.1f} {cells}", flush=True)
+
+
+def compare(before_path, after_path, threshold, min_ms, stat):
+    """Prints per-config deltas and returns the number of regressions found."""
+    with open(before_path) as f: before = {r['key']: r for r in json.load(f)['results']}
+    with open(after_path) as f: after = {r['key']: r for r in json.load(f)['results']}
+    regressions = 0
+    for key in [k for k in after if k in before]:
+        old, new = before[key], after[key]
+        flagged = []
+        for phase in PHASES + ('total',):
+            a = (old['total'] if phase == 'total' else old['phases'][phase])[stat]
+            b = (new['total'] if phase == 'total' else new['phases'][phase])[stat]
+            if b - a > min_ms and b > a * (1 + threshold):
+                flagged.append(f"{phase} {a:.2f} -> {b:.2f} ms (+{(b / a - 1) * 100 if a else float('inf'):.0f}%)")
+        change = (new['total'][stat] / old['total'][stat] - 1) * 100
+        print(f"{'REGRESSION' if flagged else 'ok':<10} {key:<38} total {stat} {change:+6.1f}%")
+        for line in flagged: print(f"{'':<12}{line}")
+        regressions += bool(flagged)
+    for key in sorted(set(before) ^ set(after)):
+        print(f"{'skipped':<10} {key:<38} only in {'before' if key in before else 'after'}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--full', action='store_true', help="run every combination instead of one axis at a time")
+    for axis, values in AXES.items():
+        parser.add_argument(f'--{axis}', type=int, nargs='+', default=values, help=f"values to sweep (default {values})")
+        parser.add_argument(f'--base-{axis}', type=int, default=BASE[axis])
+    parser.add_argument('--decision-interval', type=int, default=None, help="frames between AI decisions for every policy")
+    parser.add_argument('--out', help="write results as JSON to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files instead of running")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative slowdown that counts as a regression")
+    parser.add_argument('--min-ms', type=float, default=0.05, help="ignore slowdowns smaller than this")
+    parser.add_argument('--stat', default='p50', choices=('mean', 'p50', 'p90', 'p99'))
+    parser.add_argument('--hotspots', type=int, metavar='N', help="profile the base configuration and list the top N functions")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold, args.min_ms, args.stat)
+        print(f"{regressions} regressed configuration(s)")
+        sys.exit(1 if regressions else 0)
+
+    for axis in AXES: AXES[axis] = getattr(args, axis)
+    if args.decision_interval: cfg.DECISION_INTERVALS = dict.fromkeys(('aggressor', 'farmer', 'survivor'), args.decision_interval)
+    base = {axis: getattr(args, f'base_{axis}') for axis in AXES}
+    ai_models = load_ai_models()
+    if args.hotspots:
+        hotspots(base, ai_models, args.frames, args.warmup, args.seed, args.hotspots)
+        return
+    header = ' '.join(f"{p + ' p50/p99':>15}" for p in PHASES)
+    print(f"{'configuration':<38} {'fps':>7} {header}")
+    results = []
+    for config in configurations(args.full, base):
+        result = run_config(config, ai_models, args.frames, args.warmup, args.seed)
+        results.append(result)
+        print_result(result)
+        if result.get('missing_ai'): print(f"{'':<38} ({result['missing_ai']} AI opponents skipped: model not loaded)")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'environment': environment(), 'args': vars(args), 'results': results}, f, indent=1)
+        print(f"wrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
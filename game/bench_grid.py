@@ -0,0 +1,103 @@
+"""
+Spatial index micro-benchmark: the old clear-and-reinsert SpatialHashGrid
+against the incremental ArrayLayer, per simulated frame. A frame respawns a
+small share of the entities and then runs one query per querying blob.
+
+    python bench_grid.py --sizes 1000 10000 50000 --queries 200 --frames 50
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from spatial import ArrayLayer
+from world import EntityArrays
+
+
+class LegacyGrid:
+    """The per-frame grid this index replaced, kept verbatim for comparison."""
+    def __init__(self, width, height, cell_size):
+        self.cell_size = cell_size
+        self.grid_width = math.ceil(width / cell_size)
+        self.grid_height = math.ceil(height / cell_size)
+        self.grid = [[] for _ in range(self.grid_width * self.grid_height)]
+
+    def clear(self):
+        for cell in self.grid: cell.clear()
+
+    def insert(self, obj, obj_data):
+        min_x = max(0, int((obj.x - obj.radius) / self.cell_size))
+        max_x = min(self.grid_width - 1, int((obj.x + obj.radius) / self.cell_size))
+        min_y = max(0, int((obj.y - obj.radius) / self.cell_size))
+        max_y = min(self.grid_height - 1, int((obj.y + obj.radius) / self.cell_size))
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                self.grid[x + y * self.grid_width].append((obj, obj_data))
+
+    def get_nearby(self, obj):
+        nearby_items_list = []; seen_obj_ids = set()
+        min_x = max(0, int((obj.x - obj.radius) / self.cell_size))
+        max_x = min(self.grid_width - 1, int((obj.x + obj.radius) / self.cell_size))
+        min_y = max(0, int((obj.y - obj.radius) / self.cell_size))
+        max_y = min(self.grid_height - 1, int((obj.y + obj.radius) / self.cell_size))
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                for item_tuple in self.grid[x + y * self.grid_width]:
+                    if id(item_tuple[0]) not in seen_obj_ids:
+                        seen_obj_ids.add(id(item_tuple[0]))
+                        nearby_items_list.append(item_tuple)
+        return nearby_items_list
+
+
+class _Point:
+    def __init__(self, x, y, radius): self.x, self.y, self.radius = x, y, radius
+
+
+def bench(size, queries, frames, respawn_share, world):
+    rng = np.random.default_rng(0)
+    store = EntityArrays(3, (0, 255, 0), capacity=size)
+    store.extend(rng.uniform(0, world, size), rng.uniform(0, world, size))
+    objects = [_Point(x, y, 3) for x, y in zip(store.xs.tolist(), store.ys.tolist())]
+    probes = [_Point(*xy, r) for xy, r in zip(rng.uniform(0, world, (queries, 2)).tolist(), rng.uniform(10, 60, queries).tolist())]
+    respawns = max(1, int(size * respawn_share))
+
+    legacy = LegacyGrid(world, world, 200)
+    start = time.perf_counter()
+    for _ in range(frames):
+        for i in rng.integers(0, size, respawns).tolist():
+            objects[i].x, objects[i].y = rng.uniform(0, world, 2).tolist()
+        legacy.clear()
+        for obj in objects: legacy.insert(obj, {'type': 'food'})
+        for probe in probes: legacy.get_nearby(probe)
+    legacy_ms = (time.perf_counter() - start) * 1000 / frames
+
+    layer = ArrayLayer(world, world, 50)
+    layer.rebuild(store)
+    start = time.perf_counter()
+    for _ in range(frames):
+        moved = rng.integers(0, size, respawns)
+        store.respawn(moved, rng.uniform(0, world, respawns), rng.uniform(0, world, respawns))
+        layer.update(store, moved)
+        for probe in probes: layer.query(probe.x, probe.y, probe.radius)
+    layer_ms = (time.perf_counter() - start) * 1000 / frames
+    return legacy_ms, layer_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--respawn-share', type=float, default=0.01)
+    parser.add_argument('--world', type=float, default=4000)
+    args = parser.parse_args()
+
+    print(f"{'entities':>8} | {'rebuild ms/frame':>16} | {'incremental ms/frame':>20} | speedup")
+    for size in args.sizes:
+        legacy_ms, layer_ms = bench(size, args.queries, args.frames, args.respawn_share, args.world)
+        print(f"{size:>8} | {legacy_ms:16.2f} | {layer_ms:20.2f} | {legacy_ms / layer_ms:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Per-frame inference latency: one run() per AI controller (the old path)
+against PolicyBatcher's one run() per shared session, as the number of AI
+opponents grows. Opponents are split evenly over aggressor/farmer/survivor.
+
+    python bench_inference.py --frames 200 --counts 3 6 9 15 30
+"""
+import argparse
+import statistics
+import time
+from collections import deque
+
+import numpy as np
+
+from engine import Engine, cfg
+from inference import PolicyBatcher
+
+
+class _Stub:
+    """Just enough of a PlayerController for inference."""
+    def __init__(self, ai_model, rng):
+        self.ai_model = ai_model
+        self.frame_stack = deque((rng.integers(0, 256, (cfg.OBS_SIZE, cfg.OBS_SIZE), dtype=np.uint8)
+                                  for _ in range(cfg.FRAME_STACK)), maxlen=cfg.FRAME_STACK)
+
+
+def per_agent(controllers):
+    actions = {}
+    for controller in controllers:
+        stacked_frames = np.array(list(controller.frame_stack), dtype=np.float32) / 255.0
+        obs = stacked_frames[np.newaxis, ...]
+        input_name = controller.ai_model.get_inputs()[0].name
+        actions[controller] = controller.ai_model.run(None, {input_name: obs})[0][0]
+    return actions
+
+
+def timed(fn, controllers, frames):
+    fn(controllers)  # warm-up
+    samples = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        fn(controllers)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.fmean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--counts', type=int, nargs='+', default=[1, 3, 6, 9, 15, 30])
+    args = parser.parse_args()
+
+    models = Engine(observe=False).ai_models
+    if not models:
+        raise SystemExit("No ONNX models could be loaded.")
+    sessions = list(models.values())
+    rng = np.random.default_rng(0)
+    batcher = PolicyBatcher()
+
+    print(f"{'agents':>6} | {'per-agent mean/p50/p95 ms':>27} | {'batched mean/p50/p95 ms':>25} | speedup | max |diff|")
+    for count in args.counts:
+        controllers = [_Stub(sessions[i % len(sessions)], rng) for i in range(count)]
+        reference, batched = per_agent(controllers), batcher.run(controllers)
+        drift = max(float(np.max(np.abs(reference[c] - batched[c]))) for c in controllers)
+        old = timed(per_agent, controllers, args.frames)
+        new = timed(batcher.run, controllers, args.frames)
+        print(f"{count:>6} | {old[0]:8.2f} {old[1]:8.2f} {old[2]:8.2f}  | {new[0]:7.2f} {new[1]:7.2f} {new[2]:7.2f}  | "
+              f"{old[0] / new[0]:6.2f}x | {drift:.2e}")
+
+
+if __name__ == '__main__':
+    main()
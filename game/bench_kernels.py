@@ -0,0 +1,66 @@
+"""
+Kernel backends (kernels.py) at large entity counts: whole headless
+frames per backend, on the same seeded game, with the profiler's
+per-section means. Reports ms per frame and the speedup over the NumPy
+backend for the frame, the collisions and the bots' updates, where the
+ArrayLayer queries are spent. Backends that are not available (numba
+without Numba installed) are skipped with a note; 'python' times the
+loops interpreted, which beats NumPy's per-call overhead on the small
+candidate sets of the collision pass but not on the bots' wider scans.
+Only the food and mass queries change with the backend; the blob work in
+both sections (moves, blob collisions, merges, threat and prey scans) is
+the same Python code under every backend.
+
+    python bench_kernels.py --sizes 200:20000 800:100000 --backends numpy numba
+"""
+import argparse
+import time
+
+import kernels
+from engine import Engine
+
+SECTIONS = ('collisions', 'controllers')
+
+
+def run(backend, cpu, food, args):
+    kernels.use(backend)
+    engine = Engine(observe=False, ai_models={}, world_size=tuple(args.world))
+    engine.reset(seed=args.seed, num_cpu=cpu, num_food=food, num_viruses=args.viruses)
+    for _ in range(args.warmup): engine.step()
+    profiler = engine.enable_profiling(window=args.frames)
+    start = time.perf_counter()
+    for _ in range(args.frames): engine.step()
+    frame_ms = (time.perf_counter() - start) * 1000 / args.frames
+    timings = profiler.summary()['timings_ms']
+    return [frame_ms] + [timings[name]['mean'] if name in timings else 0.0 for name in SECTIONS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['200:20000', '800:100000'], help="CPU bots:food")
+    parser.add_argument('--backends', nargs='+', default=['numpy', 'numba'], choices=kernels.BACKENDS)
+    parser.add_argument('--world', type=int, nargs=2, default=[8000, 6000])
+    parser.add_argument('--viruses', type=int, default=60)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10, help="frames before timing (and Numba's compilation)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    backends = ['numpy'] + [name for name in args.backends if name != 'numpy']
+    if 'numba' in backends and kernels.use('numba') != 'numba':
+        print("numba: not installed, skipped")
+        backends.remove('numba')
+
+    print(f"{'cpu':>5} | {'food':>6} | {'backend':>7} | {'frame ms':>8} | {'collisions ms':>13} | {'controllers ms':>14} | speedup")
+    for size in args.sizes:
+        cpu, food = map(int, size.split(':'))
+        reference = None
+        for backend in backends:
+            times = run(backend, cpu, food, args)
+            reference = reference or times
+            speedup = ' '.join(f"{r / t:4.1f}x" if t else '   -' for r, t in zip(reference, times))
+            print(f"{cpu:>5} | {food:>6} | {backend:>7} | {times[0]:8.2f} | {times[1]:13.2f} | {times[2]:14.2f} | {speedup}")
+
+
+if __name__ == '__main__':
+    main()
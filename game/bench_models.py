@@ -0,0 +1,115 @@
+"""
+Model loading and inference: the old eager loader (load_ai_models, default
+session options) against ModelManager. Every startup scenario runs in a
+fresh interpreter so nothing is shared between them:
+
+    legacy      load_ai_models(): three default sessions
+    cold        ModelManager.load_all() with an empty optimized-model cache
+    warm        ModelManager.load_all() with the cache filled
+    lazy game   Engine() + reset_game() with no AI opponents (nothing loads)
+
+Inference compares the legacy and tuned sessions on the same inputs.
+
+    python bench_models.py --runs 3 --iterations 300 --batches 1 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def scenario(name, cache_dir):
+    """Runs one startup scenario in this process and returns its timings."""
+    start = time.perf_counter()
+    from engine import Engine, load_ai_models
+    from models import ModelManager
+    imported = time.perf_counter()
+    if name == 'legacy':
+        load_ai_models()
+    elif name in ('cold', 'warm'):
+        ModelManager(cache_dir=cache_dir).load_all()
+    elif name == 'lazy game':
+        Engine(ai_models=ModelManager(cache_dir=cache_dir), observe=False).reset_game(ai_opponents={})
+    end = time.perf_counter()
+    return {'import': imported - start, 'load': end - imported}
+
+
+def run_scenario(name, cache_dir):
+    output = subprocess.run([sys.executable, __file__, '--scenario', name, '--cache-dir', cache_dir],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def inference(sessions, batches, iterations):
+    from engine import cfg
+    rng = np.random.default_rng(0)
+    rows = []
+    for batch in batches:
+        obs = rng.random((batch, cfg.FRAME_STACK, cfg.OBS_SIZE, cfg.OBS_SIZE), dtype=np.float32)
+        results = {}
+        for label, session in sessions.items():
+            feed = {session.get_inputs()[0].name: obs}
+            for _ in range(10): session.run(None, feed)
+            start = time.perf_counter()
+            for _ in range(iterations): out = session.run(None, feed)[0]
+            results[label] = ((time.perf_counter() - start) * 1000 / iterations, out)
+        drift = float(np.max(np.abs(results['legacy'][1] - results['tuned'][1])))
+        rows.append((batch, results['legacy'][0], results['tuned'][0], drift))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help="fresh processes per startup scenario")
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--cache-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(scenario(args.scenario, args.cache_dir)))
+        return
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        print(f"{'startup':<10} | {'import s':>8} | {'load s':>8} | total s (median of {args.runs})")
+        totals = {}
+        for name in ('legacy', 'cold', 'warm', 'lazy game'):
+            samples = []
+            for _ in range(args.runs):
+                if name == 'cold':
+                    for entry in os.listdir(cache_dir): os.remove(os.path.join(cache_dir, entry))
+                samples.append(run_scenario(name, cache_dir))
+            imports = statistics.median(s['import'] for s in samples)
+            loads = statistics.median(s['load'] for s in samples)
+            totals[name] = imports + loads
+            print(f"{name:<10} | {imports:8.3f} | {loads:8.3f} | {imports + loads:.3f}")
+        print(f"legacy/warm start-up {totals['legacy'] / totals['warm']:.2f}x, "
+              f"legacy/game without AI opponents {totals['legacy'] / totals['lazy game']:.2f}x")
+
+        from engine import Engine, load_ai_models
+        from models import ModelManager
+        # A new game in a process that already ran one: the old path reloads
+        # every model, the shared manager hands back the same sessions.
+        shared = ModelManager(cache_dir=cache_dir)
+        Engine(ai_models=shared, observe=False).reset_game()
+        start = time.perf_counter(); Engine(ai_models=load_ai_models(), observe=False).reset_game()
+        middle = time.perf_counter(); Engine(ai_models=shared, observe=False).reset_game()
+        end = time.perf_counter()
+        print(f"second game in the same process: legacy {(middle - start) * 1000:.1f} ms, shared {(end - middle) * 1000:.1f} ms")
+
+        legacy, tuned = load_ai_models(), ModelManager(cache_dir=cache_dir)
+        print(f"\n{'model':<10} {'batch':>5} | {'legacy ms':>9} | {'tuned ms':>8} | speedup | max |diff|")
+        for name in legacy:
+            for batch, old, new, drift in inference({'legacy': legacy[name], 'tuned': tuned[name]}, args.batches, args.iterations):
+                print(f"{name:<10} {batch:>5} | {old:9.3f} | {new:8.3f} | {old / new:6.2f}x | {drift:.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Observation cost and parity: the direct rasterizer against the original
+screen crop + PIL LANCZOS pipeline, measured on live headless frames.
+
+    python bench_raster.py --frames 300 --cpu 14 --food 850
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from engine import Engine, cfg
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--cpu', type=int, default=cfg.NUM_CPU)
+    parser.add_argument('--food', type=int, default=cfg.NUM_FOOD)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    engine = Engine(obs_mode='parity')
+    engine.reset(seed=args.seed, num_cpu=args.cpu, num_food=args.food)
+    frame = np.empty((cfg.OBS_SIZE, cfg.OBS_SIZE), dtype=np.uint8)
+    raster_ms, screen_ms = [], []
+    rng = np.random.default_rng(args.seed)
+    for _ in range(args.frames):
+        engine.step({0: rng.uniform(-1, 1, 3)})
+        for agent in engine.agents:
+            start = time.perf_counter()
+            engine.rasterizer.render(frame, *engine._viewport(agent))
+            raster_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            engine._get_processed_screen(center_on_controller=agent)
+            screen_ms.append((time.perf_counter() - start) * 1000)
+
+    print(f"agents: {len(engine.agents)}, frames: {args.frames}")
+    print(f"screen + PIL per observation: {statistics.fmean(screen_ms):.3f} ms (p95 {sorted(screen_ms)[int(len(screen_ms) * 0.95)]:.3f})")
+    print(f"rasterizer per observation:   {statistics.fmean(raster_ms):.3f} ms (p95 {sorted(raster_ms)[int(len(raster_ms) * 0.95)]:.3f})")
+    print("parity:", {k: round(v, 3) if isinstance(v, float) else v for k, v in engine.parity.summary().items()})
+
+
+if __name__ == '__main__':
+    main()
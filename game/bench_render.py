@@ -0,0 +1,73 @@
+"""
+Render benchmark: the old draw-every-circle renderer against Renderer, per
+frame, on a world that keeps playing between frames. Also checks that both
+produce the same pixels.
+
+    python bench_render.py --food 850 4800 --cpu 10 50 --frames 200
+"""
+import argparse
+import time
+
+import numpy as np
+import pygame
+
+from engine import Engine, cfg
+
+
+def legacy_render(engine, surface):
+    """The renderer this replaced, kept verbatim (minus Blob.draw) for comparison."""
+    surface.fill(cfg.BACKGROUND_COLOR)
+    for store in (engine.food, engine.viruses, engine.masses):
+        for x, y, r in zip(store.xs.tolist(), store.ys.tolist(), store.radii.tolist()):
+            pygame.draw.circle(surface, store.color, (int(x), int(y)), int(r))
+    all_blobs_sorted = sorted([b for c in engine.all_controllers for b in c.blobs], key=lambda b: b.radius)
+    for blob in all_blobs_sorted:
+        owner = next((c for c in engine.all_controllers if blob in c.blobs), None)
+        if owner:
+            pygame.draw.circle(surface, blob.color, (int(blob.x), int(blob.y)), int(blob.radius))
+            if len(owner.blobs) == 1:
+                font = pygame.font.SysFont(None, int(blob.radius / 1.5))
+                text = font.render(owner.name, True, cfg.FONT_COLOR)
+                surface.blit(text, text.get_rect(center=(int(blob.x), int(blob.y))))
+
+
+def bench(food, cpu, viruses, frames, seed):
+    pygame.font.init() # legacy_render's fonts; the Engine only initializes pygame for its own renderer
+    engine = Engine(ai_models={}, observe=False)
+    engine.reset(seed=seed, num_food=food, num_cpu=cpu, num_viruses=viruses)
+    old, new = pygame.Surface((cfg.SCREEN_WIDTH, cfg.SCREEN_HEIGHT)), pygame.Surface((cfg.SCREEN_WIDTH, cfg.SCREEN_HEIGHT))
+    legacy, fast, view, identical = [], [], [], True
+    quarter = (cfg.SCREEN_WIDTH // 4, cfg.SCREEN_HEIGHT // 4, cfg.SCREEN_WIDTH // 2, cfg.SCREEN_HEIGHT // 2)
+    for frame in range(frames):
+        engine.step()
+        start = time.perf_counter(); legacy_render(engine, old)
+        middle = time.perf_counter(); engine.render(new)
+        end = time.perf_counter(); engine.render(new, view=quarter)
+        view.append(time.perf_counter() - end)
+        legacy.append(middle - start); fast.append(end - middle)
+        if frame % 20 == 0:
+            engine.render(new)
+            identical &= bool((pygame.surfarray.pixels3d(old) == pygame.surfarray.pixels3d(new)).all())
+    entities = engine.food.count + engine.viruses.count + engine.masses.count + sum(len(c.blobs) for c in engine.all_controllers)
+    return entities, [np.percentile(np.array(t) * 1000, [50, 99]) for t in (legacy, fast, view)], identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--food', type=int, nargs='+', default=[850, 4800])
+    parser.add_argument('--cpu', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--viruses', type=int, default=100)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'food':>5} {'cpu':>4} {'entities':>8} | {'legacy p50/p99':>15} | {'renderer p50/p99':>16} | {'half view':>13} | same pixels")
+    for food in args.food:
+        for cpu in args.cpu:
+            entities, (legacy, fast, view), identical = bench(food, cpu, args.viruses, args.frames, args.seed)
+            print(f"{food:>5} {cpu:>4} {entities:>8} | {legacy[0]:6.2f}/{legacy[1]:<8.2f} | {fast[0]:6.2f}/{fast[1]:<9.2f} | "
+                  f"{view[0]:5.2f}/{view[1]:<7.2f} | {identical}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Frame time with and without the decision scheduler in the browser's
+worst case: CPU bots and AI opponents of every policy, the player steering
+towards a wandering mouse, every frame updated and rendered off-screen as
+Game does. Reports frame-time percentiles, the share of frames over the
+60 FPS budget, and the scheduler's decisions, deferrals and overruns.
+
+    python bench_scheduler.py --cpu 20 --ai 5 --budgets 2 4 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from engine import Engine, cfg
+
+FRAME_MS = 1000 / 60
+
+
+def run(budget, args):
+    engine = Engine()
+    if budget is not None: engine.enable_scheduling(budget)
+    engine.reset_game(num_cpu=args.cpu, ai_opponents={'aggressor': args.ai, 'farmer': args.ai, 'survivor': args.ai}, seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    mouse, times = np.array([cfg.SCREEN_WIDTH / 2, cfg.SCREEN_HEIGHT / 2]), []
+    for frame in range(args.warmup + args.frames):
+        mouse = np.clip(mouse + rng.normal(0, 20, 2), 0, (cfg.SCREEN_WIDTH, cfg.SCREEN_HEIGHT))
+        start = time.perf_counter()
+        engine.update_game_state(mouse_pos=engine.camera.to_world(mouse))
+        engine.render()
+        if frame >= args.warmup: times.append((time.perf_counter() - start) * 1000)
+    return np.array(times), engine.scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cpu', type=int, default=20)
+    parser.add_argument('--ai', type=int, default=5, help="AI opponents per policy")
+    parser.add_argument('--budgets', type=float, nargs='+', default=[2.0, cfg.DECISION_BUDGET_MS, 8.0], help="ms per frame")
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--warmup', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.cpu} CPU bots, {3 * args.ai} AI opponents, {args.frames} frames")
+    print(f"{'budget':>8} | {'p50 ms':>6} | {'p99 ms':>6} | {'max ms':>6} | {'>16.7 ms':>8} | scheduler")
+    for budget in [None] + args.budgets:
+        times, scheduler = run(budget, args)
+        p50, p99 = np.percentile(times, [50, 99])
+        print(f"{'off' if budget is None else f'{budget:g} ms':>8} | {p50:6.2f} | {p99:6.2f} | {times.max():6.2f} | "
+              f"{(times > FRAME_MS).mean():8.1%} | {scheduler.summary() if scheduler else '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+ShardedEngine against Engine on one large arena. Every run plays the same
+seeded game of scripted bots and reports frames/s, the collision pass per
+frame, the speedup of that pass over Engine, how evenly the regions share
+the blobs (largest region / mean) and whether the final state is
+identical to Engine's. Workers 0 runs the regions in-process.
+
+    python bench_shard.py --workers 0 1 2 4 --world 8000 6000 --cpu 800 --food 100000
+"""
+import argparse
+import os
+import time
+
+from engine import Engine
+from shard import ShardedEngine
+
+
+def play(engine, args):
+    settings = {'num_cpu': args.cpu, 'num_food': args.food, 'num_viruses': args.viruses, 'ai_opponents': {}}
+    engine.reset(seed=args.seed, **settings)
+    for _ in range(args.warmup): engine.step()
+    handle, spent = engine._handle_collisions, [0.0]
+    def timed():
+        start = time.perf_counter()
+        handle()
+        spent[0] += time.perf_counter() - start
+    engine._handle_collisions = timed
+    imbalance = []
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        engine.step()
+        counts = getattr(engine, 'region_blobs', None)
+        if counts and sum(counts): imbalance.append(max(counts) * len(counts) / sum(counts))
+    elapsed = time.perf_counter() - start
+    del engine._handle_collisions
+    return (args.frames / elapsed, spent[0] * 1000 / args.frames,
+            sum(imbalance) / len(imbalance) if imbalance else 1.0, engine.fingerprint())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({0, 1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--world', type=int, nargs=2, default=(8000, 6000), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--cpu', type=int, default=800)
+    parser.add_argument('--food', type=int, default=100000)
+    parser.add_argument('--viruses', type=int, default=200)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    kwargs = {'observe': False, 'ai_models': {}, 'world_size': args.world}
+    fps, collide_ms, _, reference = play(Engine(**kwargs), args)
+    print(f"{os.cpu_count()} cpus, world {args.world[0]}x{args.world[1]}, {args.cpu} bots, {args.food} food")
+    print(f"{'engine':>7} | {'frames/s':>8} | {'collide ms':>10} | speedup | imbalance | identical")
+    print(f"{'single':>7} | {fps:8.1f} | {collide_ms:10.2f} | {1.0:7.2f} | {'':>9} | ")
+    for workers in args.workers:
+        with ShardedEngine(workers=workers, **kwargs) as engine:
+            rate, ms, imbalance, result = play(engine, args)
+        print(f"{workers:>7} | {rate:8.1f} | {ms:10.2f} | {collide_ms / ms:7.2f} | {imbalance:9.2f} | {result == reference}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Snapshot/restore: cost of Engine.snapshot() and restore() against a
+deepcopy of the same state, short rollouts per second from one snapshot,
+and a check that a restored game replays its original continuation
+exactly (positions, timers, food, RNG and, with AI opponents, actions).
+
+    python bench_snapshot.py --warmup 300 --horizon 10 --rollouts 200
+"""
+import argparse
+import copy
+import time
+
+from engine import Engine
+
+
+def continuation(engine, horizon):
+    """Fingerprints of the next `horizon` frames."""
+    prints = []
+    for _ in range(horizon):
+        engine.step()
+        prints.append(engine.fingerprint())
+    return prints
+
+
+def deepcopy_state(engine):
+    # Sessions cannot be copied and are shared anyway.
+    memo = {id(c.ai_model): c.ai_model for c in engine.all_controllers if c.ai_model}
+    return copy.deepcopy((engine.all_controllers, engine.food, engine.viruses, engine.masses, engine.grid,
+                          engine.rng, engine.np_random), memo)
+
+
+def timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats): fn()
+    return (time.perf_counter() - start) * 1e6 / repeats
+
+
+def bench(label, ai_opponents, args):
+    engine = Engine(observe=False)
+    engine.reset(seed=args.seed, ai_opponents=ai_opponents)
+    for _ in range(args.warmup): engine.step()
+    snapshot = engine.snapshot()
+    original = continuation(engine, args.horizon * 3)
+    engine.restore(snapshot)
+    replayed = continuation(engine, args.horizon * 3)
+    engine.restore(snapshot)
+
+    snap_us = timed(engine.snapshot, args.repeats)
+    restore_us = timed(lambda: engine.restore(snapshot), args.repeats)
+    deep_us = timed(lambda: deepcopy_state(engine), max(1, args.repeats // 20))
+    start = time.perf_counter()
+    for _ in range(args.rollouts):
+        engine.restore(snapshot)
+        for _ in range(args.horizon): engine.step()
+    rollouts = args.rollouts / (time.perf_counter() - start)
+    blobs = sum(len(c.blobs) for c in engine.all_controllers)
+    print(f"{label:<12} {blobs:>5} | {snap_us:11.1f} | {restore_us:10.1f} | {deep_us:11.1f} | "
+          f"{rollouts:13.1f} | {original == replayed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--warmup', type=int, default=300, help="frames played before the snapshot")
+    parser.add_argument('--horizon', type=int, default=10, help="frames per rollout")
+    parser.add_argument('--rollouts', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'opponents':<12} {'blobs':>5} | {'snapshot us':>11} | {'restore us':>10} | {'deepcopy us':>11} | "
+          f"{f'rollouts/s @{args.horizon}':>13} | identical")
+    bench('scripted', {}, args)
+    bench('scripted+AI', None, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Long soak run for allocation churn: a crowded headless world played for
+many frames, with network-style players (Engine.add_player) steering
+towards wandering aim points every frame, scripted CPUs and, optionally,
+AI opponents. Reports what the garbage collector did and the process's
+memory:
+
+    gen0/1k     generation-0 collections per 1000 frames, which track how
+                many container objects the frames allocate and drop
+    pauses      count, total, p99 and longest collection pause (gc.callbacks)
+    rss         resident set after warmup and at the end, and the peak
+
+Run it on two trees to compare them; each run is its own process, so the
+peak is this run's.
+
+    SDL_VIDEODRIVER=dummy python bench_soak.py --frames 1500 --humans 300 --cpu 600 --food 60000
+"""
+import argparse
+import gc
+import resource
+import sys
+import time
+
+import numpy as np
+
+from engine import Engine
+from quantize import resident_mb
+
+
+class PauseClock:
+    """Times every collection through gc.callbacks."""
+    def __init__(self):
+        self.pauses, self.by_generation = [], [0, 0, 0]
+        self._start = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self._start = time.perf_counter()
+        elif self._start is not None:
+            self.pauses.append((time.perf_counter() - self._start) * 1000)
+            self.by_generation[info['generation']] += 1
+            self._start = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--warmup', type=int, default=500)
+    parser.add_argument('--humans', type=int, default=40, help="players steered through update_game_state(targets=...)")
+    parser.add_argument('--cpu', type=int, default=200)
+    parser.add_argument('--ai', type=int, default=0, help="AI opponents per policy")
+    parser.add_argument('--food', type=int, default=30000)
+    parser.add_argument('--viruses', type=int, default=80)
+    parser.add_argument('--world', type=int, nargs=2, default=[8000, 6000])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    engine = Engine(observe=False, ai_models=None if args.ai else {}, world_size=tuple(args.world))
+    engine.reset_game(num_cpu=args.cpu, num_food=args.food, num_viruses=args.viruses, seed=args.seed,
+                      ai_opponents={'aggressor': args.ai, 'farmer': args.ai, 'survivor': args.ai})
+    humans = [engine.add_player(f"Client {i}") for i in range(args.humans)]
+    rng = np.random.default_rng(args.seed)
+    world = np.array(args.world, dtype=float)
+    aims = rng.uniform(0, 1, (args.humans, 2)) * world
+
+    def frame():
+        nonlocal aims
+        aims = np.clip(aims + rng.normal(0, 40, aims.shape), 0, world)
+        engine.update_game_state(mouse_pos=tuple(aims[0]), targets=dict(zip(humans, map(tuple, aims.tolist()))))
+
+    for _ in range(args.warmup): frame()
+    gc.collect()
+    clock = PauseClock()
+    rss_start, collections = resident_mb(), [s['collections'] for s in gc.get_stats()]
+    gc.callbacks.append(clock)
+    start = time.perf_counter()
+    for _ in range(args.frames): frame()
+    elapsed = time.perf_counter() - start
+    gc.callbacks.remove(clock)
+    gen0 = gc.get_stats()[0]['collections'] - collections[0]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+    pauses = np.array(clock.pauses or [0.0])
+    blobs = sum(len(c.blobs) for c in engine.all_controllers)
+    print(f"{args.frames} frames, {len(engine.all_controllers)} controllers ({blobs} blobs at the end), "
+          f"{args.food} food: {elapsed / args.frames * 1000:.2f} ms/frame")
+    print(f"gen0/1k {gen0 / args.frames * 1000:.1f} | collections by generation {clock.by_generation} | "
+          f"pauses {len(clock.pauses)}, total {pauses.sum():.1f} ms, p99 {np.percentile(pauses, 99):.3f} ms, "
+          f"max {pauses.max():.3f} ms")
+    print(f"rss {rss_start:.1f} MB after warmup, {resident_mb():.1f} MB at the end, peak {peak:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
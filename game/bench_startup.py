@@ -0,0 +1,85 @@
+"""
+Cold start: import time and time to first frame, each scenario in a fresh
+interpreter (the optimized-model cache is whatever models.py left on disk):
+
+    import          import engine
+    headless        Engine(observe=False), no AI opponents, first step()
+    headless AI     Engine(observe=False), default AI opponents, first step()
+    game            Game() and its first drawn frame; policies load after it
+    game (eager)    every policy loaded before Game(), as startup used to
+
+Besides the times it reports which of pygame, PIL and onnxruntime each
+scenario had imported by its first frame, and how long after it the
+game's AI opponents joined.
+
+    SDL_VIDEODRIVER=dummy python bench_startup.py --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY = ('pygame', 'PIL', 'onnxruntime')
+SCENARIOS = ('import', 'headless', 'headless AI', 'game', 'game (eager)')
+
+
+def scenario(name):
+    """Runs one scenario in this process and returns its timings in seconds."""
+    start = time.perf_counter()
+    if name.startswith('game'):
+        from main import Game, cfg
+        from models import shared_models
+    else:
+        from engine import Engine
+    imported = time.perf_counter()
+    timings = {'import': imported - start}
+    if name.startswith('headless'):
+        engine = Engine(observe=False)
+        engine.reset_game(ai_opponents=None if name == 'headless AI' else {})
+        engine.step()
+    elif name.startswith('game'):
+        if name == 'game (eager)': shared_models(variants=cfg.POLICY_VARIANTS).load_all()
+        game = Game()
+        game.draw_elements()
+    first = time.perf_counter()
+    if name != 'import': timings['first_frame'] = first - start
+    timings['loaded'] = [module for module in HEAVY if module in sys.modules] # By the first frame
+    if name.startswith('game') and game.waiting_opponents:
+        while game.waiting_opponents:
+            game.load_waiting_models()
+            game.update_game_state(); game.draw_elements()
+        timings['models'] = time.perf_counter() - first
+    return timings
+
+
+def run_scenario(name):
+    output = subprocess.run([sys.executable, __file__, '--scenario', name], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="fresh processes per scenario")
+    parser.add_argument('--scenarios', nargs='+', default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(scenario(args.scenario)))
+        return
+
+    def median_ms(runs, key):
+        values = [run[key] for run in runs if run.get(key) is not None]
+        return f"{statistics.median(values) * 1000:9.1f}" if values else f"{'-':>9}"
+
+    print(f"{'scenario':<13} | {'import ms':>9} | {'first frame ms':>14} | {'AI join ms':>10} | imported")
+    for name in args.scenarios:
+        runs = [run_scenario(name) for _ in range(args.runs)]
+        print(f"{name:<13} | {median_ms(runs, 'import')} | {median_ms(runs, 'first_frame'):>14} | "
+              f"{median_ms(runs, 'models'):>10} | {', '.join(runs[0]['loaded']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
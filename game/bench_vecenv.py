@@ -0,0 +1,52 @@
+"""
+VecEnv throughput against worker count. Every run keeps the same number of
+envs per worker, so perfect scaling means steps/s grows linearly.
+
+    python bench_vecenv.py --workers 1 2 4 8 --envs-per-worker 2 --steps 200
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from vecenv import VecEnv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--envs-per-worker', type=int, default=2)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--cpu', type=int, default=10)
+    parser.add_argument('--food', type=int, default=850)
+    parser.add_argument('--ai', type=int, default=0, help="AI opponents of each kind per env")
+    parser.add_argument('--async', dest='use_async', action='store_true', help="overlap action sampling with stepping")
+    args = parser.parse_args()
+
+    settings = {'num_cpu': args.cpu, 'num_food': args.food,
+                'ai_opponents': {'aggressor': args.ai, 'farmer': args.ai, 'survivor': args.ai}}
+    baseline = None
+    print(f"{'workers':>7} | {'envs':>4} | {'env-steps/s':>11} | scaling")
+    for workers in args.workers:
+        num_envs = workers * args.envs_per_worker
+        with VecEnv(num_envs, settings, num_workers=workers) as env:
+            env.reset()
+            rng = np.random.default_rng(0)
+            actions = rng.uniform(-1, 1, (num_envs, env.max_agents, 3)).astype(np.float32)
+            mask = np.zeros((num_envs, env.max_agents), dtype=bool); mask[:, 0] = True
+            start = time.perf_counter()
+            for _ in range(args.steps):
+                if args.use_async:
+                    env.step_async(actions, mask)
+                    actions = rng.uniform(-1, 1, actions.shape).astype(np.float32)
+                    env.step_wait()
+                else:
+                    env.step(actions, mask)
+            rate = num_envs * args.steps / (time.perf_counter() - start)
+        baseline = baseline or rate / workers
+        print(f"{workers:>7} | {num_envs:>4} | {rate:11.1f} | {rate / (baseline * workers):6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+The screen-sized window onto the world. Kept apart from renderer.py so the
+simulation can follow the player without importing pygame.
+"""
+
+
+class Camera:
+    """
+    A screen-sized window onto the world. It centres on the point it
+    follows but stays inside the world; along an axis where the world is
+    smaller than the screen, the world is centred instead.
+    """
+    def __init__(self, width, height, world_width, world_height):
+        self.width, self.height = width, height
+        self.world_width, self.world_height = world_width, world_height
+        self.left = self.top = 0
+        self.follow(world_width / 2, world_height / 2)
+
+    @staticmethod
+    def _axis(centre, size, world):
+        if world <= size: return (world - size) // 2
+        return int(min(max(centre - size / 2, 0), world - size))
+
+    def follow(self, x, y):
+        self.left = self._axis(x, self.width, self.world_width)
+        self.top = self._axis(y, self.height, self.world_height)
+
+    @property
+    def view(self):
+        return (self.left, self.top, self.width, self.height)
+
+    def to_world(self, pos):
+        """Screen position -> world position."""
+        return (pos[0] + self.left, pos[1] + self.top)
@@ -0,0 +1,89 @@
+"""
+Equivalence check of the kernel backends (kernels.py) against the NumPy
+code: randomized ArrayLayer queries, including integer positions where
+distances tie, and then whole seeded games, whose final state must hash
+the same under every backend. 'numba' is checked when Numba is installed;
+'python' (the uncompiled loops) always is, so the loops are checked even
+without it. Exits with status 1 on any difference.
+
+    python check_kernels.py --queries 2000 --games 3 --frames 300
+"""
+import argparse
+import sys
+
+import numpy as np
+
+import kernels
+from engine import Engine
+from spatial import ArrayLayer
+from world import EntityArrays
+
+
+def random_layer(rng, n, world, integer):
+    store = EntityArrays(3.0, (0, 255, 0))
+    xs, ys = rng.uniform(0, world, n), rng.uniform(0, world, n)
+    if integer: xs, ys = np.round(xs), np.round(ys)
+    store.extend(xs, ys)
+    store.radius[:n] = rng.choice([3.0, 11.0, 2.0], n)
+    layer = ArrayLayer(world, world, cell_size=int(rng.choice([25, 50, 200])))
+    layer.rebuild(store)
+    return store, layer
+
+
+def queries(backend, seed, count):
+    """Every query result under backend, for the same random layers and queries."""
+    kernels.use(backend)
+    rng = np.random.default_rng(seed)
+    results = []
+    for q in range(count):
+        if q % 100 == 0:
+            store, layer = random_layer(rng, int(rng.integers(0, 3000)), 1000.0, integer=q % 200 == 0)
+            taken = rng.random(store.count) < 0.2
+        x, y = rng.uniform(-50, 1050, 2)
+        if q % 2: x, y = float(np.round(x)), float(np.round(y))
+        radius = float(rng.choice([0.5, 5.0, 40.0, 300.0]))
+        hits, tested = layer.contacts(store, x, y, radius, taken)
+        results.append(('query', layer.query(x, y, radius).tolist()))
+        results.append(('contacts', hits.tolist(), tested))
+        results.append(('nearest', layer.nearest(store, x, y, radius).tolist()))
+        results.append(('queries', layer.queries))
+    return results
+
+
+def games(backend, seeds, frames):
+    kernels.use(backend)
+    prints = []
+    for seed in seeds:
+        engine = Engine(observe=False, ai_models={}, world_size=(3000, 2000))
+        engine.reset(seed=seed, num_cpu=60, num_food=6000, num_viruses=30)
+        for _ in range(frames): engine.step()
+        prints.append(engine.fingerprint())
+    return prints
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--games', type=int, default=3)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    backends = ['python'] + (['numba'] if kernels.use('numba') == 'numba' else [])
+    seeds = list(range(args.seed, args.seed + args.games))
+    reference_queries, reference_games = queries('numpy', args.seed, args.queries), games('numpy', seeds, args.frames)
+    failed = False
+    for backend in backends:
+        got = queries(backend, args.seed, args.queries)
+        wrong = [i for i, (a, b) in enumerate(zip(reference_queries, got)) if a != b]
+        same_games = games(backend, seeds, args.frames) == reference_games
+        print(f"{backend:>6}: {len(got) - len(wrong)}/{len(got)} query results identical, "
+              f"{args.games} games x {args.frames} frames {'identical' if same_games else 'DIFFERENT'}")
+        for i in wrong[:5]: print(f"        first differences: {reference_queries[i]} != {got[i]}")
+        failed |= bool(wrong) or not same_games
+    if 'numba' not in backends: print(" numba: not installed, not checked")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
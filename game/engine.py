@@ -0,0 +1,1120 @@
+"""
+Core Agar simulation. Everything in here runs without a pygame display, so
+the same world can be driven by the browser front-end in main.py or stepped
+headless (reset(seed) / step(actions)) for self-play and evaluation.
+
+Only what a game uses is imported: pygame once something is drawn (the
+renderer, 'screen' observations), PIL for 'screen' observations and
+onnxruntime when the first AI opponent is spawned.
+"""
+import hashlib
+import random
+import math
+import numpy as np
+from collections import deque
+
+from world import EntityArrays
+from spatial import SpatialHashGrid
+from inference import PolicyBatcher
+from raster import ObservationRasterizer, ParityStats, gray
+from replay import ActionRecorder, SPLIT, SHOOT
+from profiling import Profiler
+from scheduler import DecisionScheduler
+from rewards import RewardEngine
+from camera import Camera
+
+from models import MODEL_PATHS, ModelManager, onnxruntime, shared_models
+
+class Config:
+    SCREEN_WIDTH = 1600
+    SCREEN_HEIGHT = 1200
+    WORLD_WIDTH = 1600 # The arena; Engine(world_size=...) overrides it per game
+    WORLD_HEIGHT = 1200
+    BACKGROUND_COLOR = (10, 10, 10) 
+    FOOD_COLOR = (0, 255, 0)
+    PLAYER_COLOR = (0, 191, 255) 
+    CPU_COLOR = (255, 0, 0)
+    FONT_COLOR = (224, 224, 224)
+    VIRUS_COLOR = (0, 255, 127) 
+    MASS_COLOR = (200, 200, 200)
+    NUM_FOOD = 850
+    NUM_CPU = 14
+    NUM_VIRUSES = 14
+    PLAYER_START_RADIUS = 5
+    CPU_START_RADIUS = 4
+    FOOD_RADIUS = 3
+    VIRUS_RADIUS = 11
+    SHOOT_MASS_RADIUS = 2
+    BASE_SPEED = 2.0
+    MAX_SPEED = 8.0
+    DOMINANCE_ABS_SIZE = 250**2
+    DOMINANCE_REL_SIZE = 2.2
+    DOMINANCE_REWARD = 300.0
+    DOMINANCE_PENALTY = -155.0
+    MAX_EPISODE_FRAMES = 3600
+    OBS_SIZE = 84
+    FRAME_STACK = 4
+    FRAME_SKIP = 1 # Frames each Engine.step() advances with the same actions
+    DECISION_INTERVALS = {} # policy name -> frames between its model's decisions; FRAME_SKIP otherwise
+    TICK_RATE = 60 # Simulation frames per second of game time
+    DECISION_BUDGET_MS = 4.0 # Per-frame time for bot decisions under Engine.enable_scheduling()
+    EXPLORATION_ANNEAL_FRAMES = 50000 
+    DISTANCE_REWARD_SCALER = 0.005
+    DIRECTION_CHANGE_REWARD_SCALER = 0.015
+    STAGNATION_PENALTY_SCALER = 0.005
+    SHAPED_REWARD_ANNEAL_FRAMES = 1_000_000
+    AI_AGGRESSOR_COLOR = (255, 128, 0) 
+    AI_FARMER_COLOR = (128, 0, 128)    
+    AI_SURVIVOR_COLOR = (0, 128, 255)    
+    POLICY_VARIANTS = {} # policy name -> 'int8-dynamic'/'int8-static' from quantize.py; fp32 otherwise
+   
+
+
+
+
+
+  
+
+
+cfg = Config()
+
+class Blob:
+    # Slotted: blobs are the most numerous Python objects in a game, and
+    # without a __dict__ each is smaller and quicker for the collector.
+    __slots__ = ('x', 'y', 'radius', 'color', 'dx', 'dy', 'merge_timer', 'owner')
+    def __init__(self, x, y, radius, color, owner=None):
+        self.x, self.y, self.radius, self.color = x, y, radius, color
+        self.dx, self.dy = 0, 0
+        self.merge_timer = 0
+        self.owner = owner # The PlayerController this blob belongs to
+    def draw(self, screen, name="", override_color=None):
+        import pygame
+        from renderer import label
+        draw_color = override_color if override_color is not None else self.color
+        pygame.draw.circle(screen, draw_color, (int(self.x), int(self.y)), int(self.radius))
+        if name:
+            text = label(name, int(self.radius / 1.5), cfg.FONT_COLOR)
+            screen.blit(text, text.get_rect(center=(int(self.x), int(self.y))))
+    def move(self, world_width=cfg.WORLD_WIDTH, world_height=cfg.WORLD_HEIGHT):
+        self.x = max(self.radius, min(self.x + self.dx, world_width - self.radius))
+        self.y = max(self.radius, min(self.y + self.dy, world_height - self.radius))
+        self.dx *= 0.98; self.dy *= 0.98
+    def collides_with(self, other):
+        return math.hypot(self.x - other.x, self.y - other.y) < self.radius + other.radius
+    def copy_state(self):
+        return (self.x, self.y, self.radius, self.dx, self.dy, self.merge_timer)
+    @classmethod
+    def from_state(cls, state, owner):
+        """A blob of owner's from copy_state()."""
+        x, y, radius, dx, dy, merge_timer = state
+        blob = cls(x, y, radius, owner.color, owner=owner)
+        blob.dx, blob.dy, blob.merge_timer = dx, dy, merge_timer
+        return blob
+
+class Point:
+    """
+    A target that is not a live blob: an aim point, or where a food pellet
+    or virus was. It reads like a blob without an owner.
+    """
+    __slots__ = ('x', 'y', 'radius')
+    owner = None
+    def __init__(self, x, y, radius=1):
+        self.x, self.y, self.radius = x, y, radius
+
+class PlayerController:
+    def __init__(self, name, color, start_radius, ai_model=None,is_human=False, rng=None, world_size=None):
+        self.name, self.color, self.start_radius = name, color, start_radius
+        self.is_human = is_human
+        self.rng = rng if rng is not None else random # The owning game's RNG
+        self.world_width, self.world_height = world_size or (cfg.WORLD_WIDTH, cfg.WORLD_HEIGHT)
+        self.ai_model = ai_model
+        self.policy = None # Name of the AI policy behind ai_model
+        self.frame_stack = deque(maxlen=cfg.FRAME_STACK) if self.ai_model else None
+        self._mass = None
+        self.blobs = []; self.respawn()
+        self.state = 'wandering'; self.target = None; self.flee_from = None
+        self.wander_target = None; self.vision_range = 300
+        self.state_timer = 0  # ADD THIS LINE
+        self.decision_cooldown = 30 # ADD THIS LINE (30 frames = 0.5 sec)
+        self.lead_blob = None
+        self.aim = Point(0, 0) # The human or AI target, moved in place every frame
+        self.pending_action = None # Raw action injected through Engine.step()
+        # A model decides on frames where (frame + decision_phase) is a multiple
+        # of decision_interval and its (raw, unpacked) action is repeated in between.
+        self.decision_interval = 1; self.decision_phase = 0
+        self.repeat_action = None
+    # These are read many times per frame. The mass only changes when a
+    # blob is added, removed or resized, so it is cached until invalidate().
+    # lead_blob is always one of self.blobs or None (every place that takes
+    # a blob away also moves or clears the lead), so the centre needs no
+    # membership test.
+    @property
+    def mass(self):
+        if self._mass is None: self._mass = sum(b.radius**2 for b in self.blobs) if self.blobs else 0
+        return self._mass
+
+    @property
+    def center_x(self):
+        if self.lead_blob is not None: return self.lead_blob.x
+        # Without a lead blob, the radius-weighted mean.
+        return sum(b.x * b.radius for b in self.blobs) / sum(b.radius for b in self.blobs) if self.blobs else 0
+
+    @property
+    def center_y(self):
+        if self.lead_blob is not None: return self.lead_blob.y
+        return sum(b.y * b.radius for b in self.blobs) / sum(b.radius for b in self.blobs) if self.blobs else 0
+
+    @property
+    def total_radius(self):
+        return math.sqrt(self.mass)
+
+    def invalidate(self):
+        """Drops the cached mass; call whenever a blob is added, removed or resized."""
+        self._mass = None
+
+    def copy_state(self, refs, observations=True):
+        """
+        Everything that changes during a game, as a tuple. Blobs of any
+        controller are stored as refs[blob] (see Engine.snapshot); targets
+        that are not a live blob are stored as a Point copy. The frame stack is
+        copied only with observations.
+        """
+        def ref(blob):
+            if blob is None: return None
+            return refs.get(blob) or Point(blob.x, blob.y, blob.radius)
+        stack = np.array(self.frame_stack) if observations and self.frame_stack else None
+        return (tuple(b.copy_state() for b in self.blobs), refs.get(self.lead_blob), self.state, self.state_timer,
+                ref(self.target), ref(self.flee_from), self.wander_target, self.pending_action,
+                self.repeat_action, stack)
+
+    def set_state(self, blobs, state, resolve):
+        """Restores copy_state() with blobs already rebuilt; resolve(ref) gives back any blob."""
+        (_, lead, self.state, self.state_timer, target, flee_from, self.wander_target, self.pending_action,
+         self.repeat_action, stack) = state
+        self.blobs = blobs
+        self.lead_blob = resolve(lead)
+        self.invalidate()
+        self.target, self.flee_from = resolve(target), resolve(flee_from)
+        if stack is not None:
+            self.frame_stack.clear()
+            # Copies, since observations overwrite old frames in place.
+            self.frame_stack.extend(frame.copy() for frame in stack)
+
+    def respawn(self):
+        self.blobs = [Blob(self.rng.randint(0, self.world_width), self.rng.randint(0, self.world_height), self.start_radius, self.color, owner=self)]
+        self.lead_blob = self.blobs[0] # ADD THIS LINE
+        self.invalidate()
+                        
+
+
+
+    def decide_cpu_state(self, grid, food, viruses):
+        if not self.blobs: return
+    
+        if self.state_timer > 0:
+            self.state_timer -= 1
+            return
+            
+        current_radius = self.total_radius
+
+        if current_radius < 20:
+            vision_multiplier = 6.0
+        elif current_radius > 20:
+            vision_multiplier = 5.0
+        else:
+            # Linear interpolation between (15, 8x) and (25, 5x)
+            vision_multiplier = 5.5
+        dynamic_vision_range = current_radius * vision_multiplier
+
+        self.target, self.flee_from = None, None
+        cx, cy = self.center_x, self.center_y
+        # Range queries on the blob layer instead of scanning every blob.
+        threats = grid.blobs.nearest(cx, cy, dynamic_vision_range, exclude_owner=self, min_radius=current_radius * 1.15)
+        largest_blob_radius = max(b.radius for b in self.blobs) if self.blobs else 0
+        prey = None if threats else grid.blobs.within(cx, cy, dynamic_vision_range, exclude_owner=self, max_radius=largest_blob_radius / 1.15)
+    
+        new_state = 'wandering'
+    
+        if threats:
+            new_state = 'fleeing'
+            self.flee_from = threats[0]
+        elif prey:
+            new_state = 'hunting'
+            self.target = max(prey, key=lambda p: p.radius)
+            blocking_virus = self.find_blocking_virus(grid, viruses)
+            if blocking_virus:
+                new_state = 'clearing_virus'
+                self.target = blocking_virus
+        else:
+            nearest_food = self.find_nearest_food(grid, food, dynamic_vision_range)
+            if nearest_food:
+                new_state = 'hunting'
+                self.target = nearest_food
+    
+        if self.state != new_state:
+            self.state = new_state
+            self.state_timer = self.decision_cooldown
+            
+    def update(self, all_controllers, masses, mouse_pos=None, ai_action=None):
+        if not self.blobs: return
+        target_pos = None
+    
+        if self.is_human and mouse_pos:
+            target_pos = mouse_pos
+            self.target = self.aim; self.aim.x, self.aim.y = target_pos
+    
+        elif ai_action is not None:
+            move_action = ai_action['move']; special_action = ai_action['special']
+            raw_target_x = self.center_x + move_action[0] * 500
+            raw_target_y = self.center_y + move_action[1] * 500
+            buffer = self.blobs[0].radius if self.blobs else 20
+            target_pos = (max(buffer, min(raw_target_x, self.world_width - buffer)), max(buffer, min(raw_target_y, self.world_height - buffer)))
+            self.target = self.aim; self.aim.x, self.aim.y = target_pos
+            if special_action == 1 and self.rng.random() < 0.60: self.shoot_mass(masses)
+            if special_action == 2 and self.rng.random() < 0.05: self.split()
+    
+        elif not self.is_human and not self.ai_model:
+            if self.state == 'fleeing' and self.flee_from:
+                angle = math.atan2(self.center_y - self.flee_from.y, self.center_x - self.flee_from.x)
+                target_pos = (self.center_x + math.cos(angle) * 500, self.center_y + math.sin(angle) * 500)
+            elif self.state == 'hunting' and self.target:
+                target_pos = (self.target.x, self.target.y)
+            elif self.state == 'clearing_virus' and self.target:
+                target_pos = (self.target.x, self.target.y)
+            elif self.state == 'wandering':
+                if self.wander_target is None or math.hypot(self.center_x - self.wander_target[0], self.center_y - self.wander_target[1]) < 50:
+                    self.wander_target = (self.rng.randint(50, self.world_width - 50), self.rng.randint(50, self.world_height - 50))
+                target_pos = self.wander_target
+
+        for blob in self.blobs:
+            if target_pos:
+                angle = math.atan2(target_pos[1] - blob.y, target_pos[0] - blob.x)
+                speed = max(cfg.BASE_SPEED, cfg.MAX_SPEED - (blob.radius / 50))
+                target_dx = math.cos(angle) * speed
+                target_dy = math.sin(angle) * speed
+                lerp_factor = 0.15
+                blob.dx = blob.dx * (1 - lerp_factor) + target_dx * lerp_factor
+                blob.dy = blob.dy * (1 - lerp_factor) + target_dy * lerp_factor
+            blob.move(self.world_width, self.world_height)
+            if blob.merge_timer > 0: blob.merge_timer -= 1
+        self.merge_blobs()
+    def merge_blobs(self):
+        if len(self.blobs) > 1:
+            center_x = self.center_x
+            center_y = self.center_y
+            pull_strength = 0.18 
+        
+            for blob in self.blobs:
+                dist_x = center_x - blob.x
+                dist_y = center_y - blob.y
+                dist = math.hypot(dist_x, dist_y)
+                if dist > 1:
+                    blob.dx += (dist_x / dist) * pull_strength
+                    blob.dy += (dist_y / dist) * pull_strength
+        
+        # Part 2: Original Merge Logic (The "Fuse")
+        mergable = [b for b in self.blobs if b.merge_timer <= 0]
+        if len(mergable) < 2: return
+        # One pass over the pairs: a blob that absorbs another carries on with
+        # its new radius, one that is absorbed drops out. Overlaps a fusion
+        # creates with blobs already passed are fused on the next frame.
+        absorbed = set()
+        for i, b1 in enumerate(mergable):
+            if b1 in absorbed: continue
+            for b2 in mergable[i + 1:]:
+                if b2 in absorbed or not b1.collides_with(b2): continue
+                larger, smaller = (b1, b2) if b1.radius > b2.radius else (b2, b1)
+                if smaller is self.lead_blob:
+                    self.lead_blob = larger
+                larger.radius = math.sqrt(larger.radius**2 + smaller.radius**2)
+                absorbed.add(smaller)
+                if smaller is b1: break
+        if absorbed:
+            self.blobs = [b for b in self.blobs if b not in absorbed]
+            self.invalidate()
+# ADD THIS REPLACEMENT METHOD
+    def split(self):
+        """Splits all blobs that are large enough, creating them at an offset to prevent overlap."""
+        if len(self.blobs) >= 8: return 
+    
+        
+        for blob in self.blobs[:]:
+            if blob.radius > 14: 
+                self.blobs.remove(blob)
+                new_radius = math.sqrt(blob.radius**2 / 2)
+    
+                
+                if blob.dx == 0 and blob.dy == 0:
+                    base_angle = self.rng.uniform(0, 2 * math.pi)
+                else:
+                    base_angle = math.atan2(blob.dy, blob.dx)
+
+                for i in range(2):
+                    # The first blob goes forward (angle), the second goes backward (angle + 180 deg).
+                    split_angle = base_angle + (i * math.pi)
+    
+                    # It is placed just outside the original blob's radius.
+                    offset_x = blob.x + (new_radius) * math.cos(split_angle)
+                    offset_y = blob.y + (new_radius) * math.sin(split_angle)
+    
+                    new_blob = Blob(offset_x, offset_y, new_radius, self.color, owner=self)
+    
+                    # 5. Propel the new blob in the same direction as its offset.
+                    new_blob.dx = math.cos(split_angle) * 18
+                    new_blob.dy = math.sin(split_angle) * 18
+                    new_blob.merge_timer = 90 # Set the cooldown before they can merge again
+                    
+                    self.blobs.append(new_blob)
+                    if i == 0:
+                        self.lead_blob = new_blob
+                self.invalidate()
+    def shoot_mass(self, masses):
+        """Ejects mass from the largest blob."""
+        if not self.blobs or not self.target: return
+
+        largest_blob = max(self.blobs, key=lambda b: b.radius)
+        if largest_blob.radius > 16: # Must be big enough to shoot
+            # Lose mass from the shooter
+            new_radius_squared = largest_blob.radius**2 - cfg.SHOOT_MASS_RADIUS**2
+            if new_radius_squared < cfg.CPU_START_RADIUS**2: return # Don't shoot if it makes you too small
+            largest_blob.radius = math.sqrt(new_radius_squared)
+            self.invalidate()
+
+            # Eject in the direction of the current target
+            angle = math.atan2(self.target.y - largest_blob.y, self.target.x - largest_blob.x)
+            masses.add(
+                largest_blob.x, largest_blob.y,
+                math.cos(angle) * 25, math.sin(angle) * 25,
+                timer=180 # Frames before the ejected mass decays
+            )
+    # --- ADD THIS CODE BLOCK ---
+    def is_split_safe(self, grid):
+        """Predicts if a split would result in an immediate loss."""
+        if not self.target: return False
+
+        # Calculate where the new blob would go
+        angle = math.atan2(self.target.y - self.center_y, self.target.x - self.center_x)
+        split_dist = 7 * self.blobs[0].radius # Approximate split distance
+        projected_x = self.center_x + math.cos(angle) * split_dist
+        projected_y = self.center_y + math.sin(angle) * split_dist
+        projected_radius = math.sqrt(self.blobs[0].radius**2 / 2)
+
+        # Check if that projected position is inside a larger threat
+        if grid.blobs.covering(projected_x, projected_y, exclude_owner=self, min_radius=projected_radius * 1.15):
+            return False # Split is not safe
+        return True # No immediate threats found
+
+# In the PlayerController class:
+
+    def find_blocking_virus(self, grid, viruses):
+        """
+        Checks if a virus is geometrically between the player and the target,
+        using a segment sweep over the virus layer. Returns the blocker
+        closest to the player.
+        """
+        if not self.target or not self.blobs or not viruses.count:
+            return None
+
+        # The line segment from the player's primary blob to the target,
+        # widened by that blob's radius.
+        p_x, p_y = self.blobs[0].x, self.blobs[0].y
+        blocking = grid.viruses.segment(viruses, p_x, p_y, self.target.x, self.target.y, pad=self.blobs[0].radius)
+        if not len(blocking):
+            return None # No blocking viruses found
+        i = blocking[0]
+        return Point(viruses.x[i], viruses.y[i], viruses.radius[i])
+
+    def find_nearest_food(self, grid, food, vision_range):
+        """The closest food pellet within vision_range, or None."""
+        nearest = grid.food.nearest(food, self.center_x, self.center_y, vision_range)
+        if not len(nearest): return None
+        i = nearest[0]
+        return Point(food.x[i], food.y[i], food.radius[i])
+
+
+class GameSnapshot:
+    """
+    The simulation state of an Engine at one point in time (see
+    Engine.snapshot). Restoring copies out of it, so one snapshot can be
+    restored any number of times.
+    """
+    def __init__(self, controllers, controller_states, dead, stores, layers, blob_layer, rng_state, np_rng_state,
+                 frame, seed, settings, frame_events, reward_state):
+        self.controllers, self.controller_states, self.dead = controllers, controller_states, dead
+        self.stores, self.layers, self.blob_layer = stores, layers, blob_layer
+        self.rng_state, self.np_rng_state = rng_state, np_rng_state
+        self.frame, self.seed, self.settings, self.frame_events = frame, seed, settings, frame_events
+        self.reward_state = reward_state
+
+
+def load_ai_models(session_options=None):
+    """
+    Eagerly loads the aggressor/farmer/survivor policies with the given
+    options. Missing models are skipped with a warning. Engine uses the
+    lazy, cached models.shared_models() instead.
+    """
+    models = {}
+    ort = onnxruntime()
+    if ort is None:
+        print("--- WARNING: onnxruntime not available. AI models disabled. ---")
+        return models
+    
+    model_paths = MODEL_PATHS
+    print("--- Loading AI Models ---")
+    for name, path in model_paths.items():
+        try:
+            print(f"  > Loading '{name}' from {path}")
+            # This InferenceSession() is the FAST part
+            models[name] = ort.InferenceSession(path, sess_options=session_options)
+            print(f"  > Successfully loaded {name}.")
+        except Exception as e:
+            # This error often shows if the file wasn't fetched correctly in py-config
+            print(f"  > WARNING: Could not load ONNX model at {path}. Error: {e}")
+            print(f"  > CHECK YOUR <py-config> in index.html to ensure this file is fetched!")
+    return models
+
+
+class Engine:
+    """
+    The simulation half of the game: world state, AI controllers, collisions
+    and rewards. It never touches the display, the mouse or the clock, so it
+    can be stepped as fast as the CPU allows.
+
+    Agents are the human player (index 0) followed by every AI controller.
+    step() takes raw continuous actions keyed by agent index; AI agents that
+    are not given an action fall back to their own ONNX model. With
+    observe=False nothing is rendered and step() returns no observations,
+    which is the fast path for pure scripted or evaluation runs.
+
+    obs_mode picks how observations are made: 'raster' draws them straight
+    from entity data, 'screen' renders the agent's viewport with pygame and
+    resizes it with PIL (the original pipeline), and 'parity' feeds agents
+    the screen pipeline while recording the raster's pixel error in
+    self.parity.
+
+    world_size is the arena's (width, height) and may be far larger than
+    the screen: only what lies inside the camera (or an agent's viewport)
+    is ever drawn.
+
+    Each step() advances frame_skip frames (Config.FRAME_SKIP by default)
+    with the same actions. AI controllers run their model every
+    Config.DECISION_INTERVALS[policy] frames and repeat the action in
+    between; their frame stacks get a frame only when they decide, so the
+    stack holds frames one decision apart, as under a frame-skipping
+    training loop.
+
+    With defer_models, AI opponents whose policy has not been loaded yet
+    are left out of reset_game() and join the running game once
+    ai_models.ready() reports their session (see
+    ModelManager.load_in_background), so the first frame never waits for
+    onnxruntime. They spawn at a wall-clock dependent frame, so this is for
+    interactive play, not seeded or recorded runs.
+    """
+    def __init__(self, ai_models=None, observe=True, obs_mode='raster', world_size=None, frame_skip=None, defer_models=False):
+        self.world_width, self.world_height = world_size = tuple(world_size or (cfg.WORLD_WIDTH, cfg.WORLD_HEIGHT))
+        # Off-screen surface render() draws to by default, created on first
+        # use. Game swaps in the real display surface.
+        self._screen = None
+        self.camera = Camera(cfg.SCREEN_WIDTH, cfg.SCREEN_HEIGHT, *world_size)
+        self.grid = SpatialHashGrid(*world_size, cell_size=200)
+        # Sessions are created when the first opponent of a kind spawns and
+        # shared by every Engine in the process.
+        self.ai_models = shared_models(variants=cfg.POLICY_VARIANTS) if ai_models is None else ai_models
+        if defer_models and not isinstance(self.ai_models, ModelManager): raise ValueError("defer_models needs a ModelManager")
+        self.policy_batcher = PolicyBatcher()
+        self.observe = observe
+        self.obs_mode = obs_mode
+        self.frame_skip = frame_skip or cfg.FRAME_SKIP
+        self.rasterizer = ObservationRasterizer(cfg.OBS_SIZE, *world_size, cfg.BACKGROUND_COLOR)
+        self.parity = ParityStats()
+        self._renderer = None
+        self.defer_models = defer_models
+        self.waiting_opponents = [] # (policy name, policy index) of deferred AI opponents
+
+        self.player = None; self.all_controllers = []
+        self.food = EntityArrays(cfg.FOOD_RADIUS, cfg.FOOD_COLOR)
+        self.viruses = EntityArrays(cfg.VIRUS_RADIUS, cfg.VIRUS_COLOR)
+        self.masses = EntityArrays(cfg.SHOOT_MASS_RADIUS, cfg.MASS_COLOR)
+        # All randomness of a game goes through these two generators, both
+        # derived from self.seed in reset_game.
+        self.rng = random.Random()
+        self.np_random = np.random.default_rng()
+        self.seed = None; self.settings = {}
+        self.agents = []; self.frame = 0
+        self.dead_controllers = set()
+        self.kills = [] # (eater, eaten) controllers of the last frame, one per controller in dead_controllers
+        self.recorder = None
+        self._frame_events = 0
+        self.profiler = None
+        self.scheduler = None
+        self.reward_engine = RewardEngine(cfg)
+        self.transitions = None
+
+    # --- THIS IS YOUR ORIGINAL LOGIC FROM AGARENV, MOVED HERE ---
+    def reset_game(self, num_cpu=cfg.NUM_CPU, num_food=cfg.NUM_FOOD, num_viruses=cfg.NUM_VIRUSES, ai_opponents=None, seed=None):
+        if ai_opponents is None: ai_opponents = {'aggressor': 1, 'farmer': 1, 'survivor': 1}
+        # Without a seed, draw one so the episode can still be recorded and replayed.
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.rng.seed(self.seed)
+        self.np_random = np.random.default_rng(self.rng.getrandbits(64))
+        self.masses.clear()
+        self.food.clear()
+        width, height = self.world_width, self.world_height
+        self.food.extend(self.np_random.integers(0, width, num_food, endpoint=True),
+                         self.np_random.integers(0, height, num_food, endpoint=True))
+        self.viruses.clear(); margin = 15
+        corners = [(margin, margin), (width - margin, margin), (margin, height - margin), (width - margin, height - margin)]
+        for x, y in corners:
+            if len(self.viruses) < num_viruses: self.viruses.add(x, y)
+        for _ in range(num_viruses - len(self.viruses)):
+            self.viruses.add(self.rng.randint(100, width-100), self.rng.randint(100, height-100))
+        self.grid.food.rebuild(self.food); self.grid.viruses.rebuild(self.viruses)
+        self.grid.mass.rebuild(self.masses); self.grid.blobs.clear()
+        
+        world_size = (width, height)
+        self.player = PlayerController("Player", cfg.PLAYER_COLOR, cfg.PLAYER_START_RADIUS, is_human=True, rng=self.rng, world_size=world_size)
+        opponents, available = [], {}
+        self.waiting_opponents = []
+        # Only create AI opponents if models are available. Models are not
+        # even looked for when no AI opponent is wanted.
+        for policy, (name, count) in enumerate(ai_opponents.items()):
+            if not count: pass
+            elif name not in self.ai_models: continue
+            elif self.defer_models and not self.ai_models.ready(name): self.waiting_opponents += [(name, policy)] * count
+            else: opponents += [self._ai_opponent(name, policy) for i in range(count)]
+            available[name] = count
+        # Add regular CPU opponents
+        for i in range(num_cpu):
+            opponents.append(PlayerController(f"CPU {i+1}", cfg.CPU_COLOR, cfg.CPU_START_RADIUS, rng=self.rng, world_size=world_size))
+        self.all_controllers = [self.player] + opponents
+        self.camera.follow(self.player.center_x, self.player.center_y)
+        self.agents = [self.player] + [c for c in opponents if c.ai_model]
+        self.frame = 0
+        self.dead_controllers = set(); self.kills = []
+        self.settings = {'num_cpu': num_cpu, 'num_food': num_food, 'num_viruses': num_viruses, 'ai_opponents': available}
+        self._frame_events = 0
+        if self.recorder is not None: self.recorder.start_episode(self.seed, self._episode_header())
+
+        # The player gets a frame stack too so external policies can drive it.
+        self.player.frame_stack = deque(maxlen=cfg.FRAME_STACK)
+        if not self.observe and not any(c.ai_model for c in self.agents): return
+        self._fill_stacks(self.agents)
+
+    def _ai_opponent(self, name, policy):
+        # A checkpoint named 'farmer@v2' plays in the farmer's colour; other unknown policies in the CPUs'.
+        colors = {'aggressor': cfg.AI_AGGRESSOR_COLOR, 'farmer': cfg.AI_FARMER_COLOR, 'survivor': cfg.AI_SURVIVOR_COLOR}
+        color = colors.get(name.partition('@')[0], cfg.CPU_COLOR)
+        opponent = PlayerController(f"AI-{name.capitalize()}", color, cfg.CPU_START_RADIUS, ai_model=self.ai_models[name],
+                                    rng=self.rng, world_size=(self.world_width, self.world_height))
+        opponent.policy = name
+        # Policies decide on different frames, so their sessions take turns.
+        opponent.decision_interval = interval = cfg.DECISION_INTERVALS.get(name, cfg.FRAME_SKIP)
+        opponent.decision_phase = policy % interval
+        return opponent
+
+    def _fill_stacks(self, controllers):
+        """Fills the frame stacks of controllers with the current frame."""
+        if self.obs_mode != 'raster': self.render()
+        self._observe(controllers)
+        for controller in controllers:
+            initial_screen = controller.frame_stack[-1]
+            while len(controller.frame_stack) < controller.frame_stack.maxlen: controller.frame_stack.append(initial_screen.copy())
+
+    def _admit_opponents(self):
+        """
+        Spawns the deferred AI opponents whose policy has loaded; they join
+        the end of the agents. Those whose policy failed to load are dropped.
+        """
+        failed = self.ai_models.failed
+        if any(name in failed for name, policy in self.waiting_opponents):
+            self.waiting_opponents = [(name, policy) for name, policy in self.waiting_opponents if name not in failed]
+        ready = {name for name, policy in self.waiting_opponents if self.ai_models.ready(name)}
+        if not ready: return
+        admitted = [self._ai_opponent(name, policy) for name, policy in self.waiting_opponents if name in ready]
+        self.waiting_opponents = [(name, policy) for name, policy in self.waiting_opponents if name not in ready]
+        self.all_controllers += admitted
+        self.agents += admitted
+        self._fill_stacks(admitted)
+
+    def reset(self, seed=None, **settings):
+        """
+        Starts a new episode and returns the initial observations, one
+        (FRAME_STACK, OBS_SIZE, OBS_SIZE) uint8 stack per agent index.
+        settings are forwarded to reset_game (num_cpu, num_food, ...).
+        """
+        self.reset_game(seed=seed, **settings)
+        return self._observations()
+
+    def step(self, actions=None):
+        """
+        Advances the world by frame_skip frames, applying the same actions
+        on each.
+
+        actions maps agent index -> raw continuous action (move_x, move_y,
+        special), the same layout the ONNX policies output. Returns
+        (observations, rewards, dones, info), each keyed by agent index:
+        observations after the last frame, rewards summed over the frames
+        (self.reward_engine scores every controller; see rewards.py).
+        An agent is done when it was eaten during them; every agent is done
+        once the episode reaches MAX_EPISODE_FRAMES, which also ends the
+        skip early. With observe, every agent's stack gets one frame per
+        step, so model-driven agents should then decide every frame_skip
+        frames as well.
+
+        info also reports every controller, agent or not: 'kills' lists the
+        (eater, eaten) controller pairs of the step's frames (see
+        self.kills) and 'dominant' the set of controllers that were
+        dominant on any of them.
+        """
+        actions = actions or {}
+        prof = self.profiler
+        # Deferred opponents that are ready join before anything is scored.
+        if self.waiting_opponents: self._admit_opponents()
+        rewards = dict.fromkeys(range(len(self.agents)), 0.0)
+        dones = dict.fromkeys(range(len(self.agents)), False)
+        observing = self.observe or any(a.ai_model for a in self.agents)
+        before = self._observations() if self.transitions is not None else None
+        scorer, indexed = self.reward_engine, None
+        kills, dominant = [], set()
+        for skip in range(self.frame_skip):
+            scorer.begin(self.all_controllers)
+            self.update_game_state(actions=actions, observe=False)
+            if prof is not None: t = prof.clock()
+            truncated = self.frame >= cfg.MAX_EPISODE_FRAMES
+            last = truncated or skip == self.frame_skip - 1
+            if observing:
+                # AI models need a frame before each of their decisions even when nobody observes.
+                self._observe([a for a in self.agents if (self.observe and last) or (a.ai_model and self._decides(a))])
+            if prof is not None: prof.lap('observe', t)
+
+            # Every controller is scored; agents pick out their own.
+            reward, dominated = scorer.evaluate(self.dead_controllers)
+            kills += self.kills
+            if dominated.any(): dominant.update(scorer.controllers[j] for j in np.flatnonzero(dominated))
+            if scorer.controllers is not indexed:
+                indexed = scorer.controllers
+                position = {c: j for j, c in enumerate(indexed)}
+            for i, agent in enumerate(self.agents):
+                # Deferred opponents may have joined during the step; they are scored from the next frame.
+                j = position.get(agent)
+                if j is None: continue
+                rewards[i] = rewards.get(i, 0.0) + float(reward[j])
+                dones[i] = dones.get(i, False) or truncated or bool(dominated[j]) or agent in self.dead_controllers
+            if last: break
+        info = {'frame': self.frame, 'truncated': truncated, 'kills': kills, 'dominant': dominant}
+        if before: self._write_transitions(before, actions, rewards, dones)
+        if prof is not None: prof.end_frame(self)
+        return self._observations(), rewards, dones, info
+
+    def _observations(self):
+        if not self.observe: return {}
+        return {i: np.array(agent.frame_stack, dtype=np.uint8) for i, agent in enumerate(self.agents)}
+
+    def _write_transitions(self, observations, actions, rewards, dones):
+        """One row per agent whose action is known: given in actions or taken by its model."""
+        rows = [i for i, agent in enumerate(self.agents) if i in actions or agent.repeat_action is not None]
+        if not rows: return
+        taken = [actions[i] if i in actions else self.agents[i].repeat_action[0] for i in rows]
+        self.transitions.extend(obs=np.stack([observations[i] for i in rows]),
+                                action=np.asarray(taken, dtype=np.float32),
+                                reward=np.array([rewards[i] for i in rows], dtype=np.float32),
+                                done=np.array([dones[i] for i in rows]),
+                                agent=np.array(rows, dtype=np.int16),
+                                episode=np.full(len(rows), self.seed, dtype=np.uint64))
+
+    def collect_transitions(self, writer):
+        """
+        Makes step() append (observation, action, reward, done) rows to
+        writer, a transitions.TransitionWriter, until stop_collecting().
+        The observation is the one the action was taken on.
+        """
+        if not self.observe: raise ValueError("collecting transitions needs an Engine with observe=True")
+        self.transitions = writer
+
+    def stop_collecting(self):
+        self.transitions = None
+
+    def _decides(self, controller):
+        """Whether a model-driven controller runs its model this frame."""
+        return controller.repeat_action is None or (self.frame + controller.decision_phase) % controller.decision_interval == 0
+
+    @staticmethod
+    def _unpack_action(continuous_action):
+        move_action = continuous_action[:2]; special_action_continuous = continuous_action[2]
+        if special_action_continuous < -0.33: special_action = 0
+        elif special_action_continuous < 0.33: special_action = 1
+        else: special_action = 2
+        return {"move": move_action, "special": special_action}
+
+    def _handle_collisions(self):
+        food, masses, viruses = self.food, self.masses, self.viruses
+        eaten_food = np.zeros(food.count, dtype=bool)
+        eaten_mass = np.zeros(masses.count, dtype=bool)
+        popped_viruses = np.zeros(viruses.count, dtype=bool)
+        removed = set() # Blobs eaten or popped this frame
+        eaten_by = {} # Blob -> the controller that ate it
+        grid = self.grid
+        tested = 0 # Candidate pairs, reported to the profiler
+        # Blobs and mass move every frame; food and viruses only change when
+        # they respawn below.
+        grid.blobs.sync(self.all_controllers)
+        grid.mass.rebuild(masses)
+        for c1 in self.all_controllers:
+            for b1 in c1.blobs[:]:
+                if b1 in removed: continue
+                nearby_blobs = grid.blobs.query(b1.x, b1.y, b1.radius)
+                tested += len(nearby_blobs)
+                for b2, c2, _, _ in nearby_blobs:
+                    if b1 is b2 or not b1.collides_with(b2): continue
+                    if c1 != c2:
+                        larger, smaller = (b1, b2) if b1.radius > b2.radius else (b2, b1)
+                        larger_c = c1 if b1.radius > b2.radius else c2
+                        if smaller not in removed and larger.radius > smaller.radius * 1.1:
+                            larger.radius = math.sqrt(larger.radius**2 + smaller.radius**2)
+                            removed.add(smaller)
+                            eaten_by[smaller] = larger_c
+                # Food and ejected mass: one vectorized pass per blob.
+                for store, index, eaten in ((food, grid.food, eaten_food), (masses, grid.mass, eaten_mass)):
+                    if not store.count: continue
+                    hit, looked_at = index.contacts(store, b1.x, b1.y, b1.radius, eaten)
+                    tested += looked_at
+                    if hit.size:
+                        eaten[hit] = True
+                        b1.radius = math.sqrt(b1.radius**2 + float(np.square(store.radius[hit]).sum()))
+                if not viruses.count: continue
+                hit, looked_at = grid.viruses.contacts(viruses, b1.x, b1.y, b1.radius, popped_viruses)
+                tested += looked_at
+                hit = hit[b1.radius > viruses.radius[hit] * 1.1]
+                if hit.size:
+                    removed.add(b1); popped_viruses[hit.min()] = True
+                    self._pop(c1, b1)
+        self._settle_collisions(eaten_food, eaten_mass, popped_viruses, removed, eaten_by, tested)
+
+    def _pop(self, controller, blob):
+        """Bursts blob, which hit a virus, into fragments that fly apart; the caller removes blob itself."""
+        original_mass = blob.radius**2
+        for _ in range(self.rng.randint(6, 10)):
+            if len(controller.blobs) >= 16: break
+            angle = self.rng.uniform(0, 2 * math.pi)
+            new_blob = Blob(blob.x, blob.y, max(math.sqrt(original_mass / 10), cfg.CPU_START_RADIUS), controller.color, owner=controller)
+            new_blob.dx, new_blob.dy = math.cos(angle) * 22, math.sin(angle) * 22
+            new_blob.merge_timer = 40; controller.blobs.append(new_blob)
+
+    def _settle_collisions(self, eaten_food, eaten_mass, popped_viruses, removed, eaten_by, tested):
+        """
+        Applies what a collision pass found: respawns eaten food and popped
+        viruses, compacts eaten mass away, takes removed blobs from their
+        controllers and respawns (and records the kill of) those left with
+        none. eaten_by maps eaten blobs to the controller that ate them;
+        tested is the number of candidate pairs, for the profiler. Returns
+        the indexes of the respawned food.
+        """
+        food, masses, viruses, grid = self.food, self.masses, self.viruses, self.grid
+        # Eaten food respawns in place; eaten mass is compacted away in one go.
+        respawned = np.flatnonzero(eaten_food)
+        if respawned.size:
+            food.respawn(respawned, self.np_random.integers(0, self.world_width, respawned.size, endpoint=True),
+                         self.np_random.integers(0, self.world_height, respawned.size, endpoint=True))
+            grid.food.update(food, respawned)
+        if eaten_mass.any(): masses.remove(eaten_mass)
+        popped = np.flatnonzero(popped_viruses)
+        if popped.size:
+            viruses.respawn(popped, self.np_random.integers(100, self.world_width - 100, popped.size, endpoint=True),
+                            self.np_random.integers(100, self.world_height - 100, popped.size, endpoint=True))
+            grid.viruses.update(viruses, popped)
+        for controller in self.all_controllers:
+            # Its blobs may have grown, been eaten or popped in the pass.
+            controller.invalidate()
+            if removed and not removed.isdisjoint(controller.blobs):
+                if controller.lead_blob in removed: controller.lead_blob = None
+                lost = controller.blobs
+                controller.blobs = [b for b in lost if b not in removed]
+                if not controller.blobs:
+                    # The kill goes to whoever ate the largest of its last blobs.
+                    last = max((b for b in lost if b in eaten_by), key=lambda b: b.radius, default=None)
+                    if last is not None: self.kills.append((eaten_by[last], controller))
+                    controller.respawn()
+                    self.dead_controllers.add(controller)
+        if self.profiler is not None: self.profiler.count('collision_pairs', tested)
+        return respawned
+
+    def _viewport(self, center_on_controller):
+        """Camera centre and square viewport size an agent observes."""
+        agent_radius = center_on_controller.total_radius if center_on_controller.blobs else cfg.PLAYER_START_RADIUS
+        vision_multiplier = 6.0 if agent_radius < 20 else (4.0 if agent_radius > 20 else 5.0)
+        viewport_size = max(400, min(cfg.SCREEN_WIDTH, agent_radius * vision_multiplier * 2))
+        cam_x, cam_y = (center_on_controller.center_x, center_on_controller.center_y) if center_on_controller.blobs else (self.world_width / 2, self.world_height / 2)
+        return cam_x, cam_y, viewport_size
+
+    def _observe(self, controllers):
+        """Pushes a fresh observation onto each controller's frame stack."""
+        if self.obs_mode != 'screen':
+            blobs = sorted(((b.x, b.y, b.radius, gray(b.color)) for c in self.all_controllers for b in c.blobs), key=lambda b: b[2])
+            # The mass layer is only rebuilt inside _handle_collisions, so mass is scanned in full.
+            self.rasterizer.set_scene([self.food, self.viruses, self.masses], np.array(blobs, dtype=np.float64).reshape(-1, 4),
+                                      [self.grid.food, self.grid.viruses, None])
+        for controller in controllers:
+            stack = controller.frame_stack
+            if self.obs_mode == 'screen':
+                stack.append(self._get_processed_screen(center_on_controller=controller))
+                continue
+            # Reuse the frame that is about to fall off the stack.
+            frame = stack[0] if len(stack) == stack.maxlen else np.empty((cfg.OBS_SIZE, cfg.OBS_SIZE), dtype=np.uint8)
+            self.rasterizer.render(frame, *self._viewport(controller))
+            if self.obs_mode == 'parity':
+                reference = self._get_processed_screen(center_on_controller=controller)
+                self.parity.update(frame, reference)
+                frame = reference
+            stack.append(frame)
+
+    def _get_processed_screen(self, center_on_controller):
+        import pygame
+        from PIL import Image
+        cam_x, cam_y, viewport_size = self._viewport(center_on_controller)
+        local_view_surface = pygame.Surface((viewport_size, viewport_size))
+        source_rect_x = cam_x - viewport_size / 2
+        source_rect_y = cam_y - viewport_size / 2
+        # Draw just the viewport instead of cropping a full frame, so this
+        # works in worlds of any size.
+        self.render(local_view_surface, view=(source_rect_x, source_rect_y, viewport_size, viewport_size))
+        viewport_pixels = pygame.image.tostring(local_view_surface, "RGB")
+        pil_image = Image.frombytes("RGB", (int(viewport_size), int(viewport_size)), viewport_pixels)
+        pil_resized = pil_image.resize((cfg.OBS_SIZE, cfg.OBS_SIZE), Image.Resampling.LANCZOS).convert('L')
+        return np.array(pil_resized, dtype=np.uint8)
+
+    def update_game_state(self, mouse_pos=None, actions=None, observe=True, targets=None):
+        """
+        Advances every controller by one frame. mouse_pos steers the human
+        player; actions (agent index -> raw action) override the player and
+        any AI controller's own model. targets maps the players added with
+        add_player() to their world-space aim. With observe=False the AI
+        frame stacks are left alone because step() maintains them itself.
+        """
+        prof = self.profiler
+        if prof is not None: start = t = prof.clock()
+        actions = actions or {}
+        self.dead_controllers = set(); self.kills = []
+        if self.waiting_opponents: self._admit_opponents()
+        for index, controller in enumerate(self.agents):
+            # float32 like the model outputs, so recorded actions replay exactly.
+            if index in actions: controller.pending_action = np.asarray(actions[index], dtype=np.float32)
+
+        # Scripted bots query the blob layer, so bring it up to date first.
+        self.grid.blobs.sync(self.all_controllers)
+        # Every model-driven AI due for a decision observes first, then each
+        # shared session runs once for the whole batch. Nothing moves before
+        # all actions are known, so this matches evaluating them one by one.
+        scheduler = self.scheduler
+        deciding = [c for c in self.all_controllers if c.ai_model and c.pending_action is None
+                    and (self._decides(c) or (scheduler is not None and c in scheduler.waiting))]
+        if scheduler is not None:
+            # Bots the budget leaves out keep their state or repeat their action.
+            scripted = [c for c in self.all_controllers if not c.is_human and not c.ai_model and c.blobs and c.state_timer <= 0]
+            chosen = scheduler.plan(scripted + deciding, self.camera.view, self.grid)
+            deciding = [c for c in deciding if c in chosen]
+            if deciding: decided = scheduler.clock()
+        if observe and deciding:
+            self._observe(deciding)
+        if prof is not None: t = prof.lap('observe', t)
+        model_actions = self.policy_batcher.run(deciding) if deciding else {}
+        if prof is not None: t = prof.lap('inference', t)
+        if scheduler is not None and deciding: scheduler.measured('model', scheduler.clock() - decided, len(deciding))
+
+        applied_actions = []
+        for index, controller in enumerate(self.all_controllers):
+            action_raw, action = controller.pending_action, None
+            controller.pending_action = None
+            if action_raw is None and controller.ai_model:
+                if controller in model_actions:
+                    action_raw = model_actions[controller]
+                    controller.repeat_action = (action_raw, self._unpack_action(action_raw))
+                action_raw, action = controller.repeat_action
+            if action_raw is not None:
+                applied_actions.append((index, action_raw))
+                controller.update(self.all_controllers, self.masses, ai_action=action or self._unpack_action(action_raw))
+            elif controller.is_human:
+                aim = mouse_pos if controller is self.player else (targets or {}).get(controller)
+                controller.update(self.all_controllers, self.masses, mouse_pos=aim)
+            else: # Scripted CPU
+                if scheduler is None or controller.state_timer > 0:
+                    controller.decide_cpu_state(self.grid, self.food, self.viruses)
+                elif controller in chosen:
+                    decided = scheduler.clock()
+                    controller.decide_cpu_state(self.grid, self.food, self.viruses)
+                    scheduler.measured('scripted', scheduler.clock() - decided)
+                controller.update(self.all_controllers, self.masses)
+        if scheduler is not None: scheduler.end_frame(prof)
+        if prof is not None: t = prof.lap('controllers', t)
+        self.masses.advance(friction=0.95)
+        self.masses.remove_expired()
+        self._handle_collisions()
+        if prof is not None:
+            t = prof.lap('collisions', t)
+            prof.add('update', t - start)
+
+        if self.recorder is not None: self.recorder.record_frame(mouse_pos, self._frame_events, applied_actions)
+        self._frame_events = 0
+        self.frame += 1
+        if self.player.blobs: self.camera.follow(self.player.center_x, self.player.center_y)
+
+    def snapshot(self, observations=True):
+        """
+        A GameSnapshot of the game as it stands between frames: controllers
+        with their blobs, merge timers and bot state, food, mass, viruses,
+        their spatial indexes and both random generators. Entity stores and
+        indexes are copied as arrays and blobs as tuples, so this takes
+        microseconds rather than a deepcopy's milliseconds. With
+        observations=False the frame stacks are left out and restore()
+        leaves the current ones in place, which is enough for rollouts
+        that do not look at observations.
+        """
+        controllers = tuple(self.all_controllers)
+        refs = {blob: (i, j) for i, c in enumerate(controllers) for j, blob in enumerate(c.blobs)}
+        states = [c.copy_state(refs, observations) for c in controllers]
+        grid = self.grid
+        return GameSnapshot(controllers, states, tuple(i for i, c in enumerate(controllers) if c in self.dead_controllers),
+                            tuple((store.copy_state(), store.next_uid) for store in (self.food, self.viruses, self.masses)),
+                            (grid.food.copy_state(), grid.viruses.copy_state()), grid.blobs.copy_state(refs),
+                            self.rng.getstate(), self.np_random.bit_generator.state,
+                            self.frame, self.seed, dict(self.settings), self._frame_events,
+                            self.reward_engine.copy_state())
+
+    def restore(self, snapshot):
+        """
+        Puts the game back to snapshot, which must come from this Engine's
+        current episode or an earlier one (the controllers are reused).
+        The game then plays on exactly as it did after the snapshot was
+        taken, given the same inputs. An attached recorder is not rewound;
+        stop recording before branching.
+        """
+        controllers = snapshot.controllers
+        blobs = [[Blob.from_state(blob, c) for blob in state[0]] for c, state in zip(controllers, snapshot.controller_states)]
+        def resolve(ref):
+            return blobs[ref[0]][ref[1]] if isinstance(ref, tuple) else ref
+        for c, own, state in zip(controllers, blobs, snapshot.controller_states): c.set_state(own, state, resolve)
+        self.all_controllers = list(controllers)
+        self.player = controllers[0]
+        self.agents = [self.player] + [c for c in controllers[1:] if c.ai_model]
+        self.dead_controllers = {controllers[i] for i in snapshot.dead}
+        for store, (state, next_uid) in zip((self.food, self.viruses, self.masses), snapshot.stores): store.set_state(state, next_uid)
+        grid = self.grid
+        grid.food.set_state(snapshot.layers[0]); grid.viruses.set_state(snapshot.layers[1])
+        grid.mass.rebuild(self.masses)
+        grid.blobs.set_state(snapshot.blob_layer, lambda ref: (blobs[ref[0]][ref[1]], controllers[ref[0]]))
+        self.rng.setstate(snapshot.rng_state)
+        self.np_random.bit_generator.state = snapshot.np_rng_state
+        self.frame, self.seed, self.settings = snapshot.frame, snapshot.seed, dict(snapshot.settings)
+        self._frame_events = snapshot.frame_events
+        self.reward_engine.set_state(snapshot.reward_state)
+        if self.player.blobs: self.camera.follow(self.player.center_x, self.player.center_y)
+
+    def fingerprint(self):
+        """
+        A hash of the simulated state: blobs, food, viruses, mass, the frame
+        and both random generators. Two games that hash the same play on
+        identically, which is what the equivalence checks compare.
+        """
+        digest = hashlib.sha256(repr([[b.copy_state() for b in c.blobs] for c in self.all_controllers]).encode())
+        for store in (self.food, self.viruses, self.masses): digest.update(store.copy_state().tobytes())
+        digest.update(repr((self.frame, self.rng.getstate(), self.np_random.bit_generator.state)).encode())
+        return digest.hexdigest()
+
+    def add_player(self, name, color=cfg.PLAYER_COLOR):
+        """
+        Spawns another human-controlled cell, e.g. a network client, and
+        returns its controller. It is steered through
+        update_game_state(targets=...) and is not an agent.
+        """
+        controller = PlayerController(name, color, cfg.PLAYER_START_RADIUS, is_human=True, rng=self.rng,
+                                      world_size=(self.world_width, self.world_height))
+        self.all_controllers.append(controller)
+        return controller
+
+    def remove_player(self, controller):
+        """Takes a controller and its blobs out of the game."""
+        self.all_controllers.remove(controller)
+        if controller in self.agents: self.agents.remove(controller)
+        self.dead_controllers.discard(controller)
+
+    def player_split(self):
+        """Splits the human player's blobs; recorded with the next frame."""
+        self._frame_events |= SPLIT
+        self.player.split()
+
+    def player_shoot(self):
+        """Ejects mass from the human player; recorded with the next frame."""
+        self._frame_events |= SHOOT
+        self.player.shoot_mass(self.masses)
+
+    def enable_profiling(self, **options):
+        """Attaches a Profiler (see profiling.py for options) and returns it."""
+        self.profiler = self.policy_batcher.profiler = Profiler(**options)
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = self.policy_batcher.profiler = None
+
+    def enable_scheduling(self, budget_ms=cfg.DECISION_BUDGET_MS, **options):
+        """
+        Attaches a DecisionScheduler (see scheduler.py) that spends at most
+        budget_ms per frame on bot decisions, and returns it. Runs stop
+        being reproducible from their seed, so it cannot be combined with
+        start_recording().
+        """
+        if self.recorder is not None: raise ValueError("decision scheduling would make the recording unreplayable")
+        self.scheduler = DecisionScheduler(budget_ms, **options)
+        return self.scheduler
+
+    def disable_scheduling(self):
+        self.scheduler = None
+
+    def start_recording(self, stream):
+        """
+        Logs the current episode and every later one to stream (a binary
+        file object) in the compact format from replay.py. Call it right
+        after a reset: frames already played are not in the log. Scheduled
+        decisions depend on the wall clock, so the engine must not have a
+        scheduler.
+        """
+        if self.scheduler is not None: raise ValueError("recording needs an Engine without a decision scheduler")
+        self.recorder = ActionRecorder(stream)
+        self.recorder.start_episode(self.seed, self._episode_header())
+        return self.recorder
+
+    def _episode_header(self):
+        return dict(self.settings, world_size=[self.world_width, self.world_height])
+
+    def stop_recording(self):
+        if self.recorder is not None: self.recorder.close()
+        self.recorder = None
+
+    @property
+    def screen(self):
+        if self._screen is None:
+            import pygame
+            self._screen = pygame.Surface((cfg.SCREEN_WIDTH, cfg.SCREEN_HEIGHT))
+        return self._screen
+
+    @screen.setter
+    def screen(self, surface):
+        self._screen = surface
+
+    @property
+    def renderer(self):
+        if self._renderer is None:
+            import pygame
+            from renderer import Renderer
+            pygame.font.init()
+            self._renderer = Renderer(cfg.BACKGROUND_COLOR, cfg.FONT_COLOR, (self.world_width, self.world_height))
+        return self._renderer
+
+    def render(self, surface=None, view=None):
+        """
+        Draws the world onto surface (defaults to self.screen). view is the
+        visible (left, top, width, height) in world units, the camera's by
+        default; entities outside it are skipped.
+        """
+        surface = surface if surface is not None else self.screen
+        if view is None: view = self.camera.view
+        self.renderer.render(surface, (self.food, self.viruses), (self.grid.food, self.grid.viruses),
+                             (self.masses,), self.all_controllers, view)
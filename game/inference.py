@@ -0,0 +1,46 @@
+"""
+Batched policy inference. Every AI controller that shares an ONNX
+InferenceSession is evaluated in a single run() call per frame instead of
+one call per controller.
+"""
+import numpy as np
+
+
+class PolicyBatcher:
+    """
+    Groups controllers by their ai_model session, stacks their frame stacks
+    into one (N, FRAME_STACK, OBS_SIZE, OBS_SIZE) float32 tensor and runs
+    each session once.
+    """
+    def __init__(self):
+        self._input_names = {}
+        self.profiler = None
+
+    def input_name(self, session):
+        """The session's input name, looked up once per session."""
+        name = self._input_names.get(id(session))
+        if name is None:
+            name = self._input_names[id(session)] = session.get_inputs()[0].name
+        return name
+
+    def run(self, controllers):
+        """Returns {controller: raw continuous action} for every controller given."""
+        groups = {}
+        for controller in controllers:
+            groups.setdefault(id(controller.ai_model), []).append(controller)
+
+        actions = {}
+        for group in groups.values():
+            session = group[0].ai_model
+            # Normalize to [0, 1] range, one row per controller.
+            obs = np.stack([np.asarray(c.frame_stack, dtype=np.float32) for c in group]) / np.float32(255.0)
+            if self.profiler is not None:
+                start = self.profiler.clock()
+                outputs = session.run(None, {self.input_name(session): obs})
+                self.profiler.lap('model_run', start)
+                self.profiler.count('model_runs'); self.profiler.count('model_rows', len(group))
+            else:
+                outputs = session.run(None, {self.input_name(session): obs})
+            for controller, action_raw in zip(group, outputs[0]):
+                actions[controller] = action_raw
+        return actions
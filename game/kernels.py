@@ -0,0 +1,113 @@
+"""
+Compiled inner loops over the array-backed stores. An ArrayLayer query
+walks its grid cells in Python and then runs a handful of small NumPy
+operations on the candidates; per blob and per bot that overhead, not the
+arithmetic, is what costs. The kernels here are the same queries written
+as plain loops over the layer's and the store's arrays:
+
+    gather      the entities bucketed in a box of cells (ArrayLayer._gather)
+    contacts    the untaken entities a circle overlaps (ArrayLayer.contacts)
+    nearest     the closest entity within a radius (ArrayLayer.nearest, k=1)
+
+They cover the food and ejected-mass queries only: the collision pass
+against food, mass and viruses, and the scripted bots' food scan
+(find_nearest_food). Blob movement, blob-on-blob collisions, merging and
+the bots' threat and prey scans work on Blob objects through ObjectLayer
+and stay in Python whatever the backend.
+
+Backends, chosen once at startup with AGAR_KERNELS (or later with use()):
+
+    numpy   ArrayLayer's own vectorized code; the loops are not used (default)
+    numba   the loops compiled by Numba; numpy, with a warning, without Numba
+    python  the loops run by the interpreter; what check_kernels.py checks
+
+The loops do the same float64 arithmetic in the same order as the NumPy
+code and visit candidates in query order, so every backend gives identical
+results (check_kernels.py compares them).
+"""
+import os
+
+
+def gather(counts, buckets, grid_width, grid_height, cell_size, left, top, right, bottom, out):
+    """
+    Writes the entities of the cells overlapping the box into out, cell by
+    cell, and returns how many there are; out is left incomplete when it
+    is too small, so the caller can grow it and ask again.
+    """
+    min_x = max(0, int(left // cell_size)); max_x = min(grid_width - 1, int(right // cell_size))
+    min_y = max(0, int(top // cell_size)); max_y = min(grid_height - 1, int(bottom // cell_size))
+    k = 0
+    for row in range(min_y, max_y + 1):
+        for cell in range(row * grid_width + min_x, row * grid_width + max_x + 1):
+            n = counts[cell]
+            if k + n <= len(out):
+                for j in range(n): out[k + j] = buckets[cell, j]
+            k += n
+    return k
+
+
+def contacts(counts, buckets, grid_width, grid_height, cell_size, xs, ys, radii, taken, x, y, radius, reach, out):
+    """
+    Writes the entities that are not taken and whose circles overlap
+    (x, y, radius) into out in query order, looking at the cells within
+    reach. Returns (hits, candidates looked at); out is left incomplete
+    when it is too small, as in gather().
+    """
+    min_x = max(0, int((x - reach) // cell_size)); max_x = min(grid_width - 1, int((x + reach) // cell_size))
+    min_y = max(0, int((y - reach) // cell_size)); max_y = min(grid_height - 1, int((y + reach) // cell_size))
+    k = tested = 0
+    for row in range(min_y, max_y + 1):
+        for cell in range(row * grid_width + min_x, row * grid_width + max_x + 1):
+            n = counts[cell]
+            tested += n
+            for j in range(n):
+                i = buckets[cell, j]
+                if taken[i]: continue
+                dx = xs[i] - x; dy = ys[i] - y; r = radii[i] + radius
+                if dx * dx + dy * dy < r * r:
+                    if k < len(out): out[k] = i
+                    k += 1
+    return k, tested
+
+
+def nearest(counts, buckets, grid_width, grid_height, cell_size, xs, ys, x, y, radius):
+    """The entity closest to (x, y) within radius, the first in query order among equals; -1 if none."""
+    min_x = max(0, int((x - radius) // cell_size)); max_x = min(grid_width - 1, int((x + radius) // cell_size))
+    min_y = max(0, int((y - radius) // cell_size)); max_y = min(grid_height - 1, int((y + radius) // cell_size))
+    best, best_d2 = -1, radius * radius
+    for row in range(min_y, max_y + 1):
+        for cell in range(row * grid_width + min_x, row * grid_width + max_x + 1):
+            for j in range(counts[cell]):
+                i = buckets[cell, j]
+                dx = xs[i] - x; dy = ys[i] - y
+                d2 = dx * dx + dy * dy
+                if d2 < best_d2: best, best_d2 = i, d2
+    return best
+
+
+LOOPS = {'gather': gather, 'contacts': contacts, 'nearest': nearest}
+BACKENDS = ('numpy', 'numba', 'python')
+
+backend = 'numpy'
+loops = None # name -> kernel of the active backend, None for numpy
+_compiled = {}
+
+
+def use(name):
+    """Switches every ArrayLayer to the kernels of backend name and returns the backend in use."""
+    global backend, loops
+    if name not in BACKENDS: raise ValueError(f"unknown kernel backend {name!r}, expected one of {BACKENDS}")
+    if name == 'numba' and not _compiled:
+        try:
+            import numba
+        except ImportError:
+            print("WARNING: numba not available. Using the NumPy kernels.")
+            name = 'numpy'
+        else:
+            _compiled.update({key: numba.njit(cache=True, nogil=True)(kernel) for key, kernel in LOOPS.items()})
+    backend = name
+    loops = {'numpy': None, 'numba': _compiled, 'python': LOOPS}[name]
+    return backend
+
+
+use(os.environ.get('AGAR_KERNELS', 'numpy'))
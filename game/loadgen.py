@@ -0,0 +1,220 @@
+"""
+Load generator for server.py: N scripted players that acknowledge every
+delta and split and shoot now and then. --decoders of them are full
+clients: they apply each delta to their own EntityState (so any delta
+that does not fit is counted) and steer towards the nearest food they
+see. The rest only read the delta header and wander, which keeps 200
+players affordable on the same machine as the server; to the server the
+two kinds are the same. Reports traffic per client and, with
+--spawn-server, the server's own tick and network timings.
+
+    python loadgen.py --players 200 --decoders 20 --seconds 30 --spawn-server
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import protocol
+
+try:
+    from websockets.asyncio.client import connect as websocket_connect
+except ImportError:
+    websocket_connect = None
+
+
+class Bot:
+    """One simulated player."""
+    def __init__(self, name, rng, decode=True):
+        self.name, self.rng, self.decode = name, rng, decode
+        self.states = {0: protocol.EntityState.empty()}
+        self.owner = None; self.scale = 1; self.world = (1, 1)
+        self.aim = (0.0, 0.0)
+        self.bytes = self.deltas = self.errors = self.full = 0
+        self.visible = []
+
+    def on_delta(self, payload):
+        """Applies a delta; returns its tick, or None if it could not be applied."""
+        tick, base, removed, added, updated = protocol.parse_delta(payload)
+        self.deltas += 1
+        if base == 0: self.full += 1
+        if not self.decode:
+            if self.rng.random() < 0.02: self.aim = (self.rng.uniform(0, self.world[0]), self.rng.uniform(0, self.world[1]))
+            return tick
+        state = self.states.get(base)
+        if state is None:
+            self.errors += 1
+            return None
+        try:
+            state = state.apply(removed, added, updated)
+        except ValueError:
+            self.errors += 1
+            return None
+        # The server never goes back to a base older than one it used, except
+        # to the empty state 0 when the client acknowledged too long ago.
+        for old in [t for t in self.states if 0 < t < base]: del self.states[old]
+        self.states[tick] = state
+        self.visible.append(len(state))
+        self.steer(state)
+        return tick
+
+    def steer(self, state):
+        kinds = state.keys >> protocol.KIND_SHIFT
+        mine = state.owner == self.owner
+        if not mine.any(): return
+        x, y = state.values[mine, :2].mean(axis=0) / self.scale
+        food = state.values[kinds == protocol.FOOD, :2] / self.scale
+        if len(food) and self.rng.random() < 0.9:
+            self.aim = tuple(food[np.argmin(((food - (x, y)) ** 2).sum(axis=1))])
+        elif self.rng.random() < 0.05:
+            self.aim = (x + self.rng.uniform(-600, 600), y + self.rng.uniform(-600, 600))
+
+    def flags(self):
+        roll = self.rng.random()
+        return protocol.SPLIT if roll < 0.003 else protocol.SHOOT if roll < 0.01 else 0
+
+    def handle(self, payload, send):
+        self.bytes += len(payload)
+        kind = payload[:1]
+        if kind == protocol.WELCOME:
+            self.owner, width, height, _, self.scale = protocol.parse_welcome(payload)
+            self.world = (width, height)
+        elif kind == protocol.DELTA:
+            tick = self.on_delta(payload)
+            if tick is not None: send(protocol.input_message(tick, *self.aim, self.flags()))
+
+    async def run_stream(self, host, port, stop):
+        for attempt in range(20):
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                break
+            except OSError:
+                # The accept backlog is full while many players connect at once.
+                await asyncio.sleep(0.1 * (attempt + 1))
+        else:
+            return
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send = lambda payload: writer.write(protocol.frame(payload))
+        send(protocol.hello(self.name))
+        try:
+            while not stop.is_set():
+                payload = await protocol.read_frame(reader)
+                if payload is None: break
+                self.handle(payload, send)
+        finally:
+            writer.close()
+
+    async def run_websocket(self, url, stop):
+        async with websocket_connect(url, compression=None) as websocket:
+            pending = set()
+            def send(payload):
+                task = asyncio.ensure_future(websocket.send(payload))
+                pending.add(task); task.add_done_callback(pending.discard)
+            send(protocol.hello(self.name))
+            while not stop.is_set():
+                try:
+                    payload = await websocket.recv()
+                except Exception:
+                    break
+                self.handle(payload, send)
+
+
+async def run_bots(args):
+    stop = asyncio.Event()
+    bots = [Bot(f"bot{i}", random.Random(args.seed + i), decode=i < args.decoders) for i in range(args.players)]
+    tasks = []
+    for bot in bots:
+        if args.websocket: tasks.append(asyncio.create_task(bot.run_websocket(f"ws://{args.host}:{args.websocket}", stop)))
+        else: tasks.append(asyncio.create_task(bot.run_stream(args.host, args.port, stop)))
+        # Ramp up rather than connecting everyone in the same instant.
+        await asyncio.sleep(args.ramp / max(1, args.players))
+    deadline = time.perf_counter() + 30
+    while any(bot.owner is None for bot in bots) and time.perf_counter() < deadline: await asyncio.sleep(0.1)
+    counted = [(bot.bytes, bot.deltas) for bot in bots]
+    start = time.perf_counter()
+    await asyncio.sleep(args.seconds)
+    elapsed = time.perf_counter() - start
+    rates = [((bot.bytes - sent) / elapsed, (bot.deltas - deltas) / elapsed) for bot, (sent, deltas) in zip(bots, counted)]
+    stop.set()
+    for task in tasks: task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return bots, rates, elapsed
+
+
+def wait_for_port(host, port, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5): return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"server did not come up on {host}:{port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--decoders', type=int, default=20, help="players that decode every delta; the rest only acknowledge")
+    parser.add_argument('--seconds', type=float, default=30.0, help="measured time, after every player connected")
+    parser.add_argument('--ramp', type=float, default=5.0, help="seconds over which players connect")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--websocket', type=int, help="connect over WebSocket to this port instead")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spawn-server', action='store_true', help="start server.py for the run and report its statistics")
+    parser.add_argument('server_args', nargs=argparse.REMAINDER, help="extra server.py arguments after --")
+    args = parser.parse_args()
+    if args.websocket and websocket_connect is None: raise SystemExit("--websocket needs the websockets package: pip install websockets")
+
+    server, stats_path = None, None
+    if args.spawn_server:
+        stats_path = os.path.join(tempfile.mkdtemp(), 'server.json')
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py'),
+                   '--host', args.host, '--port', str(args.port), '--stats', stats_path]
+        if args.websocket: command += ['--websocket', str(args.websocket)]
+        command += [a for a in args.server_args if a != '--']
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        wait_for_port(args.host, args.port)
+
+    bots, rates, elapsed = asyncio.run(run_bots(args))
+    if server is not None:
+        server.send_signal(signal.SIGINT)
+        server.wait()
+
+    traffic, deltas = [rate for rate, _ in rates], [rate for _, rate in rates]
+    visible = [v for b in bots for v in b.visible] or [0]
+    connected = sum(bot.owner is not None for bot in bots)
+    print(f"{connected}/{args.players} players for {elapsed:.1f} s ({'WebSocket' if args.websocket else 'TCP'}), "
+          f"{min(args.decoders, args.players)} decoding")
+    print(f"  per client: {statistics.fmean(traffic) / 1024:.1f} KiB/s mean, {max(traffic) / 1024:.1f} KiB/s max, "
+          f"{statistics.fmean(deltas):.1f} deltas/s")
+    print(f"  entities in view: {statistics.fmean(visible):.0f} mean, {max(visible)} max; "
+          f"full states {sum(b.full for b in bots)}, undecodable deltas {sum(b.errors for b in bots)}")
+    if stats_path and os.path.exists(stats_path):
+        with open(stats_path) as f: stats = json.load(f)
+        timings, counters = stats['timings_ms'], stats['counters']
+        for name in ('frame', 'update', 'collisions', 'controllers', 'network'):
+            if name in timings:
+                t = timings[name]
+                print(f"  server {name:<12} {t['mean']:6.2f} ms mean, p50 {t['p50']:6.2f}, p99 {t['p99']:6.2f}")
+        clients = counters.get('clients', {}).get('max', 0)
+        if 'network' in timings and clients:
+            per_send = timings['network']['mean'] * stats['send_every']
+            print(f"  server network per client per send: {per_send / clients * 1000:.1f} us; "
+                  f"{stats['tick'] / stats['seconds']:.1f} ticks/s of {stats['tick_rate']}, dropped {stats['dropped_ticks']}")
+        if 'skipped_sends' in counters:
+            print(f"  skipped sends (client buffer full): {counters['skipped_sends']['mean'] * stats['tick_rate']:.1f}/s")
+
+
+if __name__ == '__main__':
+    main()
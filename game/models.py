@@ -0,0 +1,305 @@
+"""
+ONNX policy sessions. ModelManager creates each policy's InferenceSession
+on first use, tuned for our core budget, and keeps the graph that
+onnxruntime optimized on disk so later starts can skip optimization. The
+shared_models() instance is reused by every Engine in the process, so
+resets and new games never reload a model.
+
+A policy can also run as one of the reduced-precision variants that
+quantize.py writes to quantized/ next to the models. A variant is only
+used while its measured drift from the fp32 policy, as recorded in
+quantized/report.json for the current model file, is within DRIFT_LIMITS;
+otherwise the manager loads the fp32 model.
+"""
+import hashlib
+import json
+import os
+import platform
+import threading
+import time
+from collections.abc import Mapping
+
+_ort = False # Not imported yet; None once the import has failed
+
+
+def onnxruntime():
+    """
+    The onnxruntime module, or None if it is not available. It is imported
+    on first use, so games without AI opponents never pay for it.
+    """
+    global _ort
+    if _ort is False:
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            try:
+                # Try alternative import name
+                import onnxruntime_web as ort
+            except ImportError:
+                print("WARNING: onnxruntime not available. AI models will not work.")
+                ort = None
+        _ort = ort
+    return _ort
+
+
+MODEL_PATHS = {"aggressor": "aggressor.onnx", "farmer": "farmer.onnx", "survivor": "survivor.onnx"}
+VARIANTS = ('int8-dynamic', 'int8-static')
+# Largest drift from the fp32 actions a variant may show (see quantize.py):
+# 99th percentile of the move difference, share of flipped special actions.
+DRIFT_LIMITS = {'move_p99': 0.05, 'special_flip_rate': 0.01}
+
+
+def default_threads():
+    """intra-op threads for a game process: half the cores, leaving the rest to the simulation."""
+    threads = os.environ.get("AGAR_ORT_THREADS")
+    return int(threads) if threads else max(1, (os.cpu_count() or 1) // 2)
+
+
+def variants_dir(model_path):
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), 'quantized')
+
+
+def variant_path(model_path, variant):
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(variants_dir(model_path), f"{stem}.{variant}.onnx")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''): digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelManager(Mapping):
+    """
+    name -> InferenceSession, loaded lazily. `name in manager` only checks
+    that the model file exists; the session is created by the first
+    manager[name]. A model that fails to load is reported once and then
+    treated as missing.
+
+    intra_op_threads/inter_op_threads size onnxruntime's thread pools
+    (defaults: default_threads() and 1, since the policies are small and
+    sequential). With cache_dir set (the default is .onnx_cache next to the
+    model), the first load saves the fully optimized graph there under the
+    model's SHA-256, and later loads open that file with optimization off.
+
+    variants maps a policy name to one of VARIANTS; the variant is loaded
+    instead of the fp32 model only if it passes the drift gate against
+    drift_limits (default DRIFT_LIMITS).
+    """
+    def __init__(self, model_paths=None, intra_op_threads=None, inter_op_threads=1, cache_dir=None, use_cache=True,
+                 variants=None, drift_limits=None):
+        self.model_paths = dict(MODEL_PATHS if model_paths is None else model_paths)
+        self.variants = dict(variants or {})
+        self.drift_limits = dict(DRIFT_LIMITS if drift_limits is None else drift_limits)
+        self.loaded_variants = {} # name -> variant actually in use ('fp32' after a fallback)
+        self.intra_op_threads = default_threads() if intra_op_threads is None else intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.cache_dir, self.use_cache = cache_dir, use_cache
+        self.sessions = {}
+        self.failed = set()
+        self.load_stats = {} # name -> {'seconds', 'cached'}
+        self._lock = threading.RLock()
+
+    def __contains__(self, name):
+        return (onnxruntime() is not None and name in self.model_paths and name not in self.failed
+                and (name in self.sessions or os.path.exists(self.model_paths[name])))
+
+    def __getitem__(self, name):
+        session = self.sessions.get(name)
+        if session is None:
+            with self._lock: # A background load of name may be under way
+                session = self.sessions.get(name)
+                if session is None:
+                    if name not in self: raise KeyError(name)
+                    session = self._load(name)
+                    if session is None: raise KeyError(name)
+        return session
+
+    def __iter__(self):
+        return (name for name in self.model_paths if name in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def session_options(self, optimize=True):
+        ort = onnxruntime()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = (ort.GraphOptimizationLevel.ORT_ENABLE_ALL if optimize
+                                            else ort.GraphOptimizationLevel.ORT_DISABLE_ALL)
+        return options
+
+    def _cache_dir(self, path):
+        return self.cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), '.onnx_cache')
+
+    def cache_path(self, name, variant='fp32'):
+        """Where the optimized graph of name (or of its variant) is cached; keyed by model hash, runtime and machine."""
+        path = self.model_paths[name]
+        cache_dir = self._cache_dir(path)
+        if variant != 'fp32': path, name = variant_path(path, variant), f"{name}.{variant}"
+        key = f"{self._model_hash(cache_dir, path)[:16]}-ort{onnxruntime().__version__}-{platform.machine()}"
+        return os.path.join(cache_dir, f"{name}-{key}.onnx")
+
+    def resolve(self, name):
+        """
+        (variant, path) to load for name: the configured variant if it
+        passes the drift gate, else ('fp32', the model path).
+        """
+        path, variant = self.model_paths[name], self.variants.get(name, 'fp32')
+        if variant == 'fp32': return variant, path
+        reason = self._gate(name, variant)
+        if reason is None: return variant, variant_path(path, variant)
+        print(f"  > Using fp32 for '{name}': variant {variant} {reason}")
+        return 'fp32', path
+
+    def _gate(self, name, variant):
+        """Why variant of name may not be used, or None if it may."""
+        if variant not in VARIANTS: return "is unknown"
+        path = self.model_paths[name]
+        candidate = variant_path(path, variant)
+        if not os.path.exists(candidate): return f"was not found at {candidate} (run quantize.py)"
+        try:
+            with open(os.path.join(variants_dir(path), 'report.json')) as f:
+                entry = json.load(f)['policies'][name]
+        except (OSError, ValueError, KeyError):
+            return "has no quantize.py report"
+        cache_dir = self._cache_dir(path)
+        # A variant made from an older model, or rewritten since, was not measured.
+        if entry.get('model_sha256') != self._model_hash(cache_dir, path): return "was made from another model file"
+        result = entry.get('variants', {}).get(variant)
+        if result is None: return "is not in the quantize.py report"
+        if result.get('sha256') != self._model_hash(cache_dir, candidate): return "changed since it was measured"
+        drift = result['drift']
+        over = [f"{key} {drift[key]:.4g} > {limit:g}" for key, limit in self.drift_limits.items()
+                if key not in drift or drift[key] > limit]
+        return f"drifts too far ({', '.join(over)})" if over else None
+
+    @staticmethod
+    def _model_hash(cache_dir, path):
+        """
+        SHA-256 of the model file. Hashing costs about as much as the
+        optimization it saves, so hashes are remembered in the cache
+        directory by path, size and mtime.
+        """
+        index_path = os.path.join(cache_dir, 'hashes.json')
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        try:
+            with open(index_path) as f: index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        entry = index.get(os.path.abspath(path))
+        if entry and entry[:2] == stamp: return entry[2]
+        digest = file_hash(path)
+        index[os.path.abspath(path)] = stamp + [digest]
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(index_path + f'.{os.getpid()}.tmp', 'w') as f: json.dump(index, f)
+            os.replace(index_path + f'.{os.getpid()}.tmp', index_path)
+        except OSError:
+            pass
+        return digest
+
+    def _load(self, name):
+        start = time.perf_counter()
+        variant, path = self.resolve(name)
+        print(f"  > Loading '{name}' from {path}")
+        try:
+            session, cached = self._open(name, variant, path)
+        except Exception as e:
+            if variant == 'fp32':
+                # This error often shows if the file wasn't fetched correctly in py-config
+                print(f"  > WARNING: Could not load ONNX model at {path}. Error: {e}")
+                print("  > CHECK YOUR <py-config> in index.html to ensure this file is fetched!")
+                self.failed.add(name)
+                return None
+            print(f"  > Using fp32 for '{name}': variant {variant} failed to load ({e})")
+            self.variants[name] = 'fp32'
+            return self._load(name)
+        self.sessions[name] = session
+        self.loaded_variants[name] = variant
+        self.load_stats[name] = {'seconds': time.perf_counter() - start, 'cached': cached, 'variant': variant}
+        print(f"  > Successfully loaded {name}{f' ({variant})' if variant != 'fp32' else ''}"
+              f"{' (optimized graph from cache)' if cached else ''}.")
+        return session
+
+    def _open(self, name, variant, path):
+        ort = onnxruntime()
+        cached, session = False, None
+        cache_path = self.cache_path(name, variant) if self.use_cache else None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                session = ort.InferenceSession(cache_path, sess_options=self.session_options(optimize=False))
+                cached = True
+            except Exception as e:
+                print(f"  > Ignoring unreadable optimized model {cache_path}: {e}")
+        if session is None and cache_path:
+            options = self.session_options()
+            if self._prepare_cache(options, cache_path):
+                try:
+                    session = ort.InferenceSession(path, sess_options=options)
+                    self._commit_cache(cache_path)
+                except Exception as e:
+                    print(f"  > Could not cache the optimized graph of {name}: {e}")
+        if session is None:
+            session = ort.InferenceSession(path, sess_options=self.session_options())
+        return session, cached
+
+    @staticmethod
+    def _prepare_cache(options, cache_path):
+        # onnxruntime writes the optimized graph while building the session;
+        # write it aside and rename, so a crash never leaves half a file.
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        except OSError:
+            return False # Read-only location: just run without the cache
+        options.optimized_model_filepath = cache_path + f'.{os.getpid()}.tmp'
+        # Saving an ENABLE_ALL graph logs a warning that it is tied to this
+        # machine, which the cache key already accounts for.
+        options.log_severity_level = 3
+        return True
+
+    @staticmethod
+    def _commit_cache(cache_path):
+        try:
+            os.replace(cache_path + f'.{os.getpid()}.tmp', cache_path)
+        except OSError:
+            pass
+
+    def load_all(self):
+        """Creates every available session now instead of on first use."""
+        return {name: self[name] for name in self}
+
+    def ready(self, name):
+        """Whether name's session exists, i.e. self[name] returns at once."""
+        return name in self.sessions
+
+    def load_in_background(self, names=None):
+        """
+        Creates the sessions of names (default: every model) on a daemon
+        thread and returns the thread, or None where no thread can be
+        started (Pyodide); ready() tells when each is in. Missing or
+        failing models are skipped as in self[name].
+        """
+        names = list(self.model_paths if names is None else names)
+        thread = threading.Thread(target=lambda: [self.get(name) for name in names], name='model-loader', daemon=True)
+        try:
+            thread.start()
+        except RuntimeError:
+            return None
+        return thread
+
+
+_shared = {}
+
+
+def shared_models(**options):
+    """The process-wide ModelManager for these options (see ModelManager)."""
+    key = tuple(sorted((k, v if not isinstance(v, dict) else tuple(sorted(v.items()))) for k, v in options.items()))
+    manager = _shared.get(key)
+    if manager is None: manager = _shared[key] = ModelManager(**options)
+    return manager
@@ -0,0 +1,160 @@
+"""
+Frame profiler. The engine only calls into it when a Profiler is attached
+(engine.profiler is None otherwise), so a disabled profiler costs one
+attribute check per instrumented section.
+
+Per frame it collects section timings, counters (grid queries, collision
+candidates tested, model runs, ...), gauges (entities per grid cell) and
+allocation stats, and keeps the last `window` frames of each as rolling
+series. summary() turns them into percentiles and histograms, hud_lines()
+into a few lines of text for the in-game overlay, and with snapshot_path
+set the summary is written out as JSON every snapshot_every seconds.
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+# Histogram bucket edges for section timings, in milliseconds.
+HISTOGRAM_EDGES_MS = (0.0, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.7, 33.3, float('inf'))
+
+
+class RollingSeries:
+    """Fixed-size ring buffer of per-frame values."""
+    def __init__(self, window):
+        self.values = np.zeros(window)
+        self.count = 0
+
+    def push(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def recent(self):
+        return self.values[:min(self.count, len(self.values))]
+
+
+class Profiler:
+    """
+    Collects one frame at a time: add()/lap() accumulate section times and
+    count() accumulates counters until end_frame() pushes them into the
+    rolling series. Sections or counters missing from a frame count as 0.
+    """
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, window=600, snapshot_path=None, snapshot_every=5.0, track_allocations=False):
+        self.window = window
+        self.snapshot_path, self.snapshot_every = snapshot_path, snapshot_every
+        self.timings, self.counters = {}, {}
+        self.frames = 0
+        self._times, self._counts = {}, {}
+        self._frame_start = self.clock()
+        self._last_snapshot = self._frame_start
+        self._gc_collections = self._collections()
+        self.track_allocations = track_allocations
+        if track_allocations and not tracemalloc.is_tracing(): tracemalloc.start()
+        self._traced = tracemalloc.get_traced_memory()[0] if track_allocations else 0
+
+    def add(self, name, seconds):
+        self._times[name] = self._times.get(name, 0.0) + seconds
+
+    def lap(self, name, since):
+        """Books the time since `since` to name and returns the current clock."""
+        now = self.clock()
+        self._times[name] = self._times.get(name, 0.0) + now - since
+        return now
+
+    def count(self, name, n=1):
+        self._counts[name] = self._counts.get(name, 0) + n
+
+    @staticmethod
+    def _collections():
+        return sum(stats['collections'] for stats in gc.get_stats())
+
+    def _push(self, table, name, value):
+        series = table.get(name)
+        if series is None:
+            series = table[name] = RollingSeries(self.window)
+            # A section that first shows up now was 0 in every earlier frame.
+            series.count = min(self.frames, self.window)
+        series.push(value)
+
+    def end_frame(self, engine=None):
+        """Closes the frame; with an engine, also samples its grid occupancy."""
+        now = self.clock()
+        self._times['frame'] = now - self._frame_start
+        self._frame_start = now
+
+        collections = self._collections()
+        self._counts['gc_collections'] = collections - self._gc_collections
+        self._gc_collections = collections
+        if self.track_allocations:
+            traced, peak = tracemalloc.get_traced_memory()
+            self._counts['alloc_kb'] = (traced - self._traced) / 1024
+            self._counts['traced_kb'] = traced / 1024
+            self._counts['peak_kb'] = peak / 1024
+            self._traced = traced
+        if engine is not None: self._sample_grid(engine.grid)
+
+        for name in self.timings.keys() - self._times.keys(): self._times[name] = 0.0
+        for name in self.counters.keys() - self._counts.keys(): self._counts[name] = 0
+        for name, seconds in self._times.items(): self._push(self.timings, name, seconds * 1000)
+        for name, value in self._counts.items(): self._push(self.counters, name, value)
+        self._times.clear(); self._counts.clear()
+        self.frames += 1
+
+        if self.snapshot_path and now - self._last_snapshot >= self.snapshot_every:
+            self._last_snapshot = now
+            self.write_snapshot(self.snapshot_path)
+
+    def _sample_grid(self, grid):
+        queries = 0
+        for name in ('blobs', 'food', 'mass', 'viruses'):
+            layer = getattr(grid, name)
+            queries += layer.queries - layer.reported_queries
+            layer.reported_queries = layer.queries
+        self._counts['grid_queries'] = queries
+        occupied = grid.food.counts[grid.food.counts > 0]
+        self._counts['food_per_cell_mean'] = float(occupied.mean()) if occupied.size else 0.0
+        self._counts['food_per_cell_max'] = int(occupied.max()) if occupied.size else 0
+        self._counts['blobs_per_cell_max'] = max(map(len, grid.blobs.cells))
+
+    def summary(self):
+        """Percentiles and histograms over the rolling window, JSON-ready."""
+        timings = {}
+        for name, series in self.timings.items():
+            values = series.recent()
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            timings[name] = {'mean': float(values.mean()), 'p50': float(p50), 'p90': float(p90),
+                             'p99': float(p99), 'max': float(values.max()),
+                             'histogram': np.histogram(values, HISTOGRAM_EDGES_MS)[0].tolist()}
+        counters = {name: {'mean': float(series.recent().mean()), 'max': float(series.recent().max())}
+                    for name, series in self.counters.items()}
+        return {'frames': self.frames, 'window': min(self.frames, self.window),
+                'histogram_edges_ms': list(HISTOGRAM_EDGES_MS[:-1]),
+                'timings_ms': timings, 'counters': counters}
+
+    def write_snapshot(self, path):
+        snapshot = dict(self.summary(), time=time.time())
+        # Written aside and renamed, so readers never see half a file.
+        with open(path + '.tmp', 'w') as f: json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def hud_lines(self, sections=('frame', 'update', 'observe', 'inference', 'controllers', 'decisions', 'collisions', 'draw')):
+        """Short text lines for the overlay: mean and p99 per section plus key counters."""
+        lines = []
+        frame = self.timings.get('frame')
+        if frame is not None and frame.count:
+            lines.append(f"fps {1000 / max(frame.recent().mean(), 1e-6):5.1f}")
+        for name in sections:
+            series = self.timings.get(name)
+            if series is None or not series.count: continue
+            values = series.recent()
+            lines.append(f"{name:<11} {values.mean():6.2f} ms  p99 {np.percentile(values, 99):6.2f}")
+        for name in ('grid_queries', 'collision_pairs', 'model_runs', 'deferred_decisions', 'budget_overruns', 'gc_collections', 'alloc_kb'):
+            series = self.counters.get(name)
+            if series is not None and series.count:
+                lines.append(f"{name:<15} {series.recent().mean():8.1f}/frame")
+        return lines
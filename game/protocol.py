@@ -0,0 +1,185 @@
+"""
+Wire format of the multiplayer server (server.py). Every message is one
+binary frame; over a plain socket each frame is preceded by its u32
+length, over a WebSocket it is one binary message. All integers are
+little-endian.
+
+Client -> server:
+    'H' u8 n, n bytes of name (UTF-8)                   -- hello, once
+    'I' u32 ack, f32 aim_x, f32 aim_y, u8 flags         -- input + ack
+
+Server -> client:
+    'W' u16 owner, u16 world_w, u16 world_h, u16 rate, u8 scale
+                                                        -- welcome
+    'N' u16 n, n * (u16 owner, u8 len, name)            -- owner names
+    'D' u32 tick, u32 base, u16 removed, u16 added, u16 updated,
+        removed * u32 key,
+        added * (u32 key, u16 x, u16 y, u16 r, 3 * u8 rgb, u16 owner),
+        updated * (u32 key, i16 dx, i16 dy, i16 dr)     -- state delta
+
+A delta applies to the state the client had at tick `base` (base 0 is
+the empty state), which is always a tick the client acknowledged. Keys
+are kind << 28 | id. Positions are world units * scale, radii world units
+* RADIUS_SCALE, both rounded; owner is NO_OWNER for food, mass and
+viruses. An added key the client already has replaces its entry.
+"""
+import asyncio
+import struct
+
+import numpy as np
+
+HELLO, INPUT, WELCOME, NAMES, DELTA = b'H', b'I', b'W', b'N', b'D'
+SPLIT, SHOOT = 1, 2
+FOOD, VIRUS, MASS, BLOB = 0, 1, 2, 3
+KIND_SHIFT, ID_MASK = 28, (1 << 28) - 1
+RADIUS_SCALE = 8
+NO_OWNER = 0xFFFF
+# Largest position/radius change an update record can carry; beyond it the entity is sent again.
+MAX_STEP = 32767
+
+_LENGTH = struct.Struct('<I')
+_INPUT = struct.Struct('<cIffB')
+_WELCOME = struct.Struct('<cHHHHB')
+_DELTA = struct.Struct('<cIIHHH')
+_NAMES = struct.Struct('<cH')
+_NAME = struct.Struct('<HB')
+
+ADD = np.dtype([('key', '<u4'), ('x', '<u2'), ('y', '<u2'), ('r', '<u2'), ('rgb', 'u1', 3), ('owner', '<u2')])
+UPDATE = np.dtype([('key', '<u4'), ('dx', '<i2'), ('dy', '<i2'), ('dr', '<i2')])
+REMOVE = np.dtype('<u4')
+
+
+def keys(kind, ids):
+    return (np.uint32(kind) << np.uint32(KIND_SHIFT)) | (np.asarray(ids) & ID_MASK).astype(np.uint32)
+
+
+def position_scale(world_width, world_height):
+    """The finest scale at which every position of the world fits in a u16."""
+    scale = 0xFFFF // max(world_width, world_height)
+    if scale < 1: raise ValueError(f"worlds larger than {0xFFFF} units cannot be streamed")
+    return min(scale, 8)
+
+
+# --- Framing over byte streams ---
+
+def frame(payload):
+    return _LENGTH.pack(len(payload)) + payload
+
+
+async def read_frame(reader, limit=1 << 20):
+    """The next frame from an asyncio StreamReader, or None at end of stream."""
+    try:
+        (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+        if size > limit: raise ValueError(f"frame of {size} bytes")
+        return await reader.readexactly(size)
+    except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError):
+        return None
+
+
+# --- Messages ---
+
+def hello(name):
+    data = name.encode()[:255]
+    return HELLO + bytes((len(data),)) + data
+
+
+def parse_hello(payload):
+    if payload[:1] != HELLO or len(payload) < 2: raise ValueError("expected a hello")
+    return payload[2:2 + payload[1]].decode(errors='replace')
+
+
+def input_message(ack, aim_x, aim_y, flags=0):
+    return _INPUT.pack(INPUT, ack, aim_x, aim_y, flags)
+
+
+def parse_input(payload):
+    """(ack, aim_x, aim_y, flags)"""
+    if len(payload) != _INPUT.size: raise ValueError(f"input of {len(payload)} bytes, expected {_INPUT.size}")
+    return _INPUT.unpack(payload)[1:]
+
+
+def welcome(owner, world_width, world_height, rate, scale):
+    return _WELCOME.pack(WELCOME, owner, world_width, world_height, rate, scale)
+
+
+def parse_welcome(payload):
+    """(owner, world_width, world_height, rate, scale)"""
+    return _WELCOME.unpack(payload)[1:]
+
+
+def names(entries):
+    """entries: (owner, name) pairs."""
+    parts = [_NAMES.pack(NAMES, len(entries))]
+    for owner, name in entries:
+        data = name.encode()[:255]
+        parts.append(_NAME.pack(owner, len(data)) + data)
+    return b''.join(parts)
+
+
+def parse_names(payload):
+    (_, n), pos, entries = _NAMES.unpack_from(payload), _NAMES.size, {}
+    for _ in range(n):
+        owner, size = _NAME.unpack_from(payload, pos); pos += _NAME.size
+        entries[owner] = payload[pos:pos + size].decode(errors='replace'); pos += size
+    return entries
+
+
+def delta_header(tick, base, n_removed, n_added, n_updated):
+    """The start of a delta; the removed keys, add and update records follow in that order."""
+    return _DELTA.pack(DELTA, tick, base, n_removed, n_added, n_updated)
+
+
+def parse_delta(payload):
+    """(tick, base, removed keys, ADD records, UPDATE records)"""
+    _, tick, base, n_removed, n_added, n_updated = _DELTA.unpack_from(payload)
+    pos = _DELTA.size
+    removed = np.frombuffer(payload, REMOVE, n_removed, pos); pos += n_removed * REMOVE.itemsize
+    added = np.frombuffer(payload, ADD, n_added, pos); pos += n_added * ADD.itemsize
+    updated = np.frombuffer(payload, UPDATE, n_updated, pos)
+    return tick, base, removed, added, updated
+
+
+def add_records(keys, values, rgb, owner):
+    """ADD records for keys with their quantized (x, y, r) values, rgb and owner."""
+    records = np.empty(len(keys), ADD)
+    records['key'] = keys
+    records['x'], records['y'], records['r'] = values.T
+    records['rgb'], records['owner'] = rgb, owner
+    return records
+
+
+# --- Entity state ---
+
+class EntityState:
+    """
+    What a client knows: keys in ascending order, their quantized (x, y, r)
+    as an (n, 3) int32 array, and the rgb and owner from the add records.
+    """
+    def __init__(self, keys, values, rgb, owner):
+        self.keys, self.values, self.rgb, self.owner = keys, values, rgb, owner
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, np.uint32), np.zeros((0, 3), np.int32), np.zeros((0, 3), np.uint8), np.zeros(0, np.uint16))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def apply(self, removed, added, updated):
+        """The state after a delta; raises ValueError if the delta does not fit this state."""
+        keep = ~np.isin(self.keys, removed, assume_unique=True)
+        if len(added): keep &= ~np.isin(self.keys, added['key'])
+        keys, values = self.keys[keep], self.values[keep].copy()
+        rgb, owner = self.rgb[keep], self.owner[keep]
+        if len(updated):
+            at = np.searchsorted(keys, updated['key'])
+            if (at >= len(keys)).any() or (keys[np.minimum(at, len(keys) - 1)] != updated['key']).any():
+                raise ValueError("update for an entity the client does not have")
+            values[at] += np.column_stack((updated['dx'], updated['dy'], updated['dr']))
+        if len(added):
+            keys = np.concatenate((keys, added['key']))
+            values = np.concatenate((values, np.column_stack((added['x'], added['y'], added['r'])).astype(np.int32)))
+            rgb, owner = np.concatenate((rgb, added['rgb'])), np.concatenate((owner, added['owner']))
+            order = np.argsort(keys, kind='stable')
+            keys, values, rgb, owner = keys[order], values[order], rgb[order], owner[order]
+        return EntityState(keys, values, rgb, owner)
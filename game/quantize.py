@@ -0,0 +1,247 @@
+"""
+Builds reduced-precision variants of the policies and the report that
+gates them in the game:
+
+    int8-dynamic   Gemm weights stored as int8, activations quantized at run
+                   time (the convolutions stay fp32: onnxruntime's dynamic
+                   ConvInteger is several times slower than the fp32 conv)
+    int8-static    weights and activations int8 (QDQ, per-channel weights),
+                   activation ranges calibrated on recorded observations
+
+Observation stacks are recorded from games the fp32 policies play against
+each other, one set for calibration and another, from different seeds, for
+evaluation. For every variant the report has its latency at batch 1 and at
+--batch, its file size and the memory a loaded session adds, and how far
+its actions drift from fp32 after Engine._unpack_action: the difference in
+the move vector and how often the special action (none/shoot/split) flips.
+
+Variants go to quantized/ next to the models together with report.json,
+which ModelManager checks before using a variant set in
+Config.POLICY_VARIANTS. Needs the onnx package (pip install onnx), the
+game itself does not.
+
+    python quantize.py --games 4 --frames 600 --every 3
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from engine import Engine, cfg
+from models import DRIFT_LIMITS, MODEL_PATHS, VARIANTS, ModelManager, file_hash, onnxruntime, shared_models, variant_path, variants_dir
+
+try:
+    import onnx
+    from onnx import version_converter
+    from onnxruntime import quantization
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+except ImportError:
+    onnx = None
+
+ort = onnxruntime() # Everything here needs it
+
+# Per-channel QDQ weights need DequantizeLinear's axis attribute (opset 13).
+QUANT_OPSET = 13
+
+
+def record_observations(names, games, frames, every, seed):
+    """
+    Plays `games` games of the fp32 policies against each other and keeps
+    every `every`-th frame stack of each AI opponent, grouped by policy.
+    """
+    models = shared_models()
+    policy_of = {id(models[name]): name for name in names}
+    stacks = {name: [] for name in names}
+    engine = Engine(ai_models=models, observe=False)
+    for game in range(games):
+        engine.reset(seed=seed + game, ai_opponents={name: 2 for name in names})
+        for frame in range(frames):
+            engine.step()
+            if frame % every: continue
+            alive = [c for c in engine.agents if c.ai_model and c.blobs]
+            if not alive: break
+            for controller in alive:
+                stacks[policy_of[id(controller.ai_model)]].append(np.array(controller.frame_stack, dtype=np.uint8))
+    return {name: np.stack(s) if s else np.empty((0, cfg.FRAME_STACK, cfg.OBS_SIZE, cfg.OBS_SIZE), np.uint8)
+            for name, s in stacks.items()}
+
+
+def load_observations(path, names, args):
+    """{'calibration': {name: stacks}, 'evaluation': {...}}, recorded now or read back from path."""
+    if path and os.path.exists(path):
+        with np.load(path) as data:
+            return {split: {name: data[f'{split}/{name}'] for name in names} for split in ('calibration', 'evaluation')}
+    print(f"Recording observations: {args.games} + {args.games} games of {args.frames} frames...")
+    observations = {'calibration': record_observations(names, args.games, args.frames, args.every, args.seed),
+                    'evaluation': record_observations(names, args.games, args.frames, args.every, args.seed + args.games)}
+    if path:
+        np.savez_compressed(path, **{f'{split}/{name}': stacks for split, per_policy in observations.items()
+                                     for name, stacks in per_policy.items()})
+    return observations
+
+
+def normalized(stacks):
+    """The float32 input PolicyBatcher feeds the models."""
+    return stacks.astype(np.float32) / np.float32(255.0)
+
+
+class StackReader(quantization.CalibrationDataReader if onnx is not None else object):
+    """Feeds calibration stacks to quantize_static in batches."""
+    def __init__(self, input_name, stacks, batch=16):
+        self.batches = iter([{input_name: normalized(stacks[i:i + batch])} for i in range(0, len(stacks), batch)])
+
+    def get_next(self):
+        return next(self.batches, None)
+
+
+def build_variants(name, model_path, calibration, workdir):
+    """Writes every variant of one policy; returns {variant: path}."""
+    base = os.path.join(workdir, f"{name}.base.onnx")
+    model = version_converter.convert_version(onnx.load(model_path), QUANT_OPSET)
+    onnx.save(model, base)
+    quant_pre_process(base, base, skip_symbolic_shape=True)
+    input_name = model.graph.input[0].name
+    os.makedirs(variants_dir(model_path), exist_ok=True)
+    paths = {}
+    for variant in VARIANTS:
+        path = paths[variant] = variant_path(model_path, variant)
+        if variant == 'int8-dynamic':
+            quantization.quantize_dynamic(base, path, weight_type=quantization.QuantType.QInt8,
+                                          op_types_to_quantize=['Gemm', 'MatMul'])
+        elif variant == 'int8-static':
+            quantization.quantize_static(base, path, StackReader(input_name, calibration),
+                                         quant_format=quantization.QuantFormat.QDQ, per_channel=True,
+                                         activation_type=quantization.QuantType.QUInt8,
+                                         weight_type=quantization.QuantType.QInt8)
+    return paths
+
+
+def run_all(session, stacks, batch=64):
+    input_name = session.get_inputs()[0].name
+    return np.concatenate([session.run(None, {input_name: normalized(stacks[i:i + batch])})[0]
+                           for i in range(0, len(stacks), batch)])
+
+
+def drift(reference, actions):
+    """How far actions stray from the fp32 reference once unpacked the way the engine does."""
+    unpacked = [Engine._unpack_action(a) for a in reference], [Engine._unpack_action(a) for a in actions]
+    moves = [np.array([u['move'] for u in side]) for side in unpacked]
+    specials = [np.array([u['special'] for u in side]) for side in unpacked]
+    move = np.abs(moves[0] - moves[1]).max(axis=1)
+    # The engine aims 500 px along the move vector.
+    target = np.hypot(*(moves[0] - moves[1]).T) * 500
+    flips = specials[0] != specials[1]
+    return {'move_mean': float(move.mean()), 'move_p99': float(np.percentile(move, 99)), 'move_max': float(move.max()),
+            'target_px_p99': float(np.percentile(target, 99)),
+            'special_flips': int(flips.sum()), 'special_flip_rate': float(flips.mean())}
+
+
+def latency(session, stacks, batch, iterations):
+    """Median milliseconds per run() at this batch size."""
+    feed = {session.get_inputs()[0].name: normalized(stacks[:batch])}
+    for _ in range(10): session.run(None, feed)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        session.run(None, feed)
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def session_memory(path, batch):
+    """Resident memory (MB) a session for path adds to a fresh interpreter, running one batch included."""
+    output = subprocess.run([sys.executable, __file__, '--memory', path, '--batch', str(batch)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])['rss_mb']
+
+
+def resident_mb():
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        # Elsewhere only the peak is available (kilobytes on Linux, bytes on macOS).
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def measure_memory(path, batch):
+    before = resident_mb()
+    session = ort.InferenceSession(path, sess_options=ModelManager(use_cache=False).session_options())
+    session.run(None, {session.get_inputs()[0].name: np.zeros((batch, cfg.FRAME_STACK, cfg.OBS_SIZE, cfg.OBS_SIZE), np.float32)})
+    return resident_mb() - before
+
+
+def evaluate(path, evaluation, reference, args):
+    session = ort.InferenceSession(path, sess_options=ModelManager(use_cache=False).session_options())
+    actions = run_all(session, evaluation)
+    return {'file_bytes': os.path.getsize(path),
+            'latency_ms': {'1': latency(session, evaluation, 1, args.iterations),
+                           str(args.batch): latency(session, evaluation, args.batch, args.iterations)},
+            'rss_mb': session_memory(path, args.batch),
+            'drift': drift(reference, actions) if reference is not None else None}, actions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--policies', nargs='+', default=list(MODEL_PATHS))
+    parser.add_argument('--games', type=int, default=4, help="games recorded for calibration, and again for evaluation")
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--every', type=int, default=3, help="keep every n-th frame stack")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--observations', help="npz to reuse recorded observations from (written if missing)")
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--batch', type=int, default=6)
+    parser.add_argument('--memory', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.memory:
+        print(json.dumps({'rss_mb': measure_memory(args.memory, args.batch)}))
+        return
+    if ort is None: raise SystemExit("onnxruntime is not available.")
+    if onnx is None: raise SystemExit("quantize.py needs the onnx package: pip install onnx")
+
+    names = [name for name in args.policies if os.path.exists(MODEL_PATHS[name])]
+    observations = load_observations(args.observations, names, args)
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'onnxruntime': ort.__version__, 'drift_limits': DRIFT_LIMITS,
+              'observations': {split: {name: len(s) for name, s in per_policy.items()} for split, per_policy in observations.items()},
+              'policies': {}}
+    report_path = os.path.join(variants_dir(MODEL_PATHS[names[0]]), 'report.json') if names else None
+
+    print(f"\n{'policy':<10} {'variant':<13} | {'ms @1':>6} | {f'ms @{args.batch}':>6} | {'file MB':>7} | {'RSS MB':>6} | "
+          f"{'move p99':>8} | {'move max':>8} | {'aim px p99':>10} | {'special flips':>13} | gate")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            model_path = MODEL_PATHS[name]
+            calibration, evaluation = observations['calibration'][name], observations['evaluation'][name]
+            if not len(calibration) or not len(evaluation):
+                print(f"{name:<10} no observations recorded (the policy never survived a sampled frame)")
+                continue
+            paths = build_variants(name, model_path, calibration, workdir)
+            fp32, reference = evaluate(model_path, evaluation, None, args)
+            entry = report['policies'][name] = {'model_sha256': file_hash(model_path), 'fp32': fp32, 'variants': {}}
+            rows = [('fp32', fp32, None)]
+            for variant, path in paths.items():
+                result, _ = evaluate(path, evaluation, reference, args)
+                result['sha256'] = file_hash(path)
+                result['passed'] = all(result['drift'][key] <= limit for key, limit in DRIFT_LIMITS.items())
+                entry['variants'][variant] = result
+                rows.append((variant, result, result['passed']))
+            for variant, result, passed in rows:
+                d = result['drift']
+                drift_columns = (f"{d['move_p99']:8.4f} | {d['move_max']:8.4f} | {d['target_px_p99']:10.2f} | "
+                                 f"{d['special_flips']:>5} ({d['special_flip_rate']:5.2%})") if d else f"{'':8} | {'':8} | {'':10} | {'':13}"
+                print(f"{name:<10} {variant:<13} | {result['latency_ms']['1']:6.3f} | {result['latency_ms'][str(args.batch)]:6.3f} | "
+                      f"{result['file_bytes'] / 1e6:7.2f} | {result['rss_mb']:6.1f} | {drift_columns} | "
+                      f"{'' if passed is None else 'pass' if passed else 'FAIL'}")
+    if report_path:
+        with open(report_path, 'w') as f: json.dump(report, f, indent=2)
+        print(f"\nEvaluated on {sum(report['observations']['evaluation'].values())} held-out stacks; report in {report_path}")
+
+
+if __name__ == '__main__':
+    main()
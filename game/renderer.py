@@ -0,0 +1,154 @@
+"""
+World renderer. Entities are blitted from cached circle sprites with one
+Surface.blits() call per entity type and radius, name labels and fonts are
+rendered once per (name, size) and reused, and anything outside the
+visible rectangle is skipped. Outside the world is black, as in the
+observations.
+
+Food and viruses barely change from one frame to the next, so together
+with the background they are kept pre-rendered in a world-sized layer.
+Each frame only the rectangles around entities that respawned are
+redrawn, and the layer is then copied out in a single blit. When too much
+changed at once (a feeding frenzy) they are drawn directly instead and the
+layer is rebuilt once things calm down. The output is pixel-identical to
+drawing every circle with pygame.draw.circle.
+"""
+from functools import lru_cache
+from itertools import repeat
+
+import numpy as np
+import pygame
+
+_COLORKEY = (255, 0, 255)
+# Past this many dirty squares, drawing directly is cheaper than patching the layer.
+_MAX_DIRTY = 200
+# Worlds larger than this (in pixels) are not cached in a layer.
+_MAX_LAYER_PIXELS = 16_000_000
+# Bigger blobs are drawn directly rather than caching a sprite per size.
+_MAX_SPRITE_RADIUS = 40
+
+
+@lru_cache(maxsize=64)
+def font(size):
+    return pygame.font.SysFont(None, size)
+
+
+@lru_cache(maxsize=2048)
+def label(text, size, color):
+    return font(size).render(text, True, color)
+
+
+@lru_cache(maxsize=1024)
+def circle_sprite(color, radius):
+    """A (2r+1)-pixel square sprite of the circle pygame.draw.circle draws at radius r."""
+    key = _COLORKEY if tuple(color) != _COLORKEY else (0, 0, 0)
+    sprite = pygame.Surface((2 * radius + 1, 2 * radius + 1))
+    sprite.fill(key)
+    pygame.draw.circle(sprite, color, (radius, radius), radius)
+    sprite.set_colorkey(key, pygame.RLEACCEL)
+    return sprite
+
+
+def draw_store(surface, store, left, top, right, bottom, origin=(0, 0)):
+    """Blits every entity of store that overlaps [left, right) x [top, bottom), shifted by -origin."""
+    n = store.count
+    if not n: return
+    xs, ys = store.x[:n].astype(np.intp), store.y[:n].astype(np.intp)
+    radii = store.radius[:n].astype(np.intp)
+    visible = (xs + radii >= left) & (xs - radii < right) & (ys + radii >= top) & (ys - radii < bottom)
+    if not visible.all(): xs, ys, radii = xs[visible], ys[visible], radii[visible]
+    sizes = np.unique(radii).tolist()
+    for radius in sizes:
+        if radius <= 0: continue
+        same = slice(None) if len(sizes) == 1 else radii == radius
+        sprite = circle_sprite(store.color, radius)
+        corners = zip((xs[same] - (origin[0] + radius)).tolist(), (ys[same] - (origin[1] + radius)).tolist())
+        surface.blits(zip(repeat(sprite), corners), doreturn=False)
+
+
+class Renderer:
+    """
+    Draws an Engine's world. static stores (food, viruses) go through the
+    cached layer, dynamic ones (mass) and player blobs are drawn on top
+    every frame. Each static store comes with its spatial index (an
+    ArrayLayer, kept current by the engine) for patching the layer.
+    """
+    def __init__(self, background, font_color, world_size):
+        self.background, self.font_color = background, font_color
+        self.world_size = world_size
+        self._layer = None
+        self._drawn = None # (x, y, radius) of every static entity as last drawn into the layer
+
+    def _refresh_layer(self, stores, indexes):
+        """Brings the layer up to date; returns False when it is not worth it this frame."""
+        snapshot = [np.column_stack((s.xs, s.ys, s.radii)) for s in stores]
+        if self._drawn is not None and all(old.shape == new.shape for old, new in zip(self._drawn, snapshot)):
+            changed = [np.concatenate((old[moved], new[moved])) for old, new in zip(self._drawn, snapshot)
+                       for moved in [np.flatnonzero((old != new).any(axis=1))]]
+            dirty = np.concatenate(changed).astype(np.intp)
+            if len(dirty) > _MAX_DIRTY: return False
+            if len(dirty): self._patch(stores, indexes, dirty)
+            self._drawn = snapshot
+            return True
+        if self._drawn is not None and self._layer is not None:
+            # Entities were added or removed: wait for a quiet frame to rebuild.
+            self._drawn = None
+            return False
+        if self._layer is None: self._layer = pygame.Surface(self.world_size)
+        self._layer.fill(self.background)
+        width, height = self.world_size
+        for store in stores: draw_store(self._layer, store, 0, 0, width, height)
+        self._drawn = snapshot
+        return True
+
+    def _patch(self, stores, indexes, dirty):
+        """
+        Redraws the (x, y, r) bounding squares in dirty, one clipped square
+        at a time, finding what overlaps each through the stores' spatial
+        indexes.
+        """
+        layer, background = self._layer, self.background
+        for x, y, r in dirty.tolist():
+            left, top, size = x - r, y - r, 2 * r + 1
+            layer.set_clip((left, top, size, size))
+            layer.fill(background)
+            for store, index in zip(stores, indexes):
+                # The clip rectangle discards whatever a candidate draws outside the square.
+                nearby = index.query(x, y, r + 1)
+                for cx, cy, cr in zip(store.x[nearby].tolist(), store.y[nearby].tolist(), store.radius[nearby].tolist()):
+                    cx, cy, cr = int(cx), int(cy), int(cr)
+                    if cr > 0: layer.blit(circle_sprite(store.color, cr), (cx - cr, cy - cr))
+        layer.set_clip(None)
+
+    def draw_blobs(self, surface, controllers, left, top, right, bottom):
+        visible = [b for c in controllers for b in c.blobs
+                   if b.x + b.radius >= left and b.x - b.radius < right and b.y + b.radius >= top and b.y - b.radius < bottom]
+        visible.sort(key=lambda b: b.radius)
+        font_color = self.font_color
+        for blob in visible:
+            x, y, radius = int(blob.x) - left, int(blob.y) - top, int(blob.radius)
+            if radius <= _MAX_SPRITE_RADIUS: surface.blit(circle_sprite(blob.color, radius), (x - radius, y - radius))
+            else: pygame.draw.circle(surface, blob.color, (x, y), radius)
+            owner = blob.owner
+            # Only whole (unsplit) cells carry the name, as before.
+            if owner is not None and len(owner.blobs) == 1 and int(blob.radius / 1.5) > 0:
+                text = label(owner.name, int(blob.radius / 1.5), font_color)
+                surface.blit(text, text.get_rect(center=(x, y)))
+
+    def render(self, surface, static, static_indexes, dynamic, controllers, view=None):
+        """view is the visible (left, top, width, height) in world units, the whole surface by default."""
+        left, top, width, height = view if view is not None else (0, 0, *surface.get_size())
+        left, top = int(left), int(top)
+        right, bottom = left + width, top + height
+        world_width, world_height = self.world_size
+        beyond = left < 0 or top < 0 or right > world_width or bottom > world_height
+        if beyond: surface.fill((0, 0, 0))
+        if world_width * world_height <= _MAX_LAYER_PIXELS and self._refresh_layer(static, static_indexes):
+            surface.blit(self._layer, (max(0, -left), max(0, -top)), (max(0, left), max(0, top), width, height))
+        else:
+            if beyond: surface.fill(self.background, (-left, -top, world_width, world_height))
+            else: surface.fill(self.background)
+            for store in static: draw_store(surface, store, left, top, right, bottom, origin=(left, top))
+        for store in dynamic: draw_store(surface, store, left, top, right, bottom, origin=(left, top))
+        self.draw_blobs(surface, controllers, left, top, right, bottom)
+
@@ -0,0 +1,156 @@
+"""
+Compact action logs. A log holds only what cannot be re-derived: each
+episode's seed and settings, then per frame the mouse position, the
+player's split/shoot events and every raw action fed through
+_unpack_action (model outputs included). Re-simulating a log needs no
+rendering and no inference.
+
+Layout (little-endian):
+    b'AGARLOG1'
+    b'E' u64 seed, u32 n, n bytes of settings JSON      -- starts an episode
+    b'F' u8 flags, [f64 mouse_x, f64 mouse_y], u16 n,
+         n * (u16 controller index, 3 * f32 action)     -- one frame
+
+    python replay.py match.agarlog --frame 1800
+"""
+import argparse
+import json
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b'AGARLOG1'
+SPLIT, SHOOT, MOUSE = 1, 2, 4
+
+_EPISODE = struct.Struct('<QI')
+_FRAME = struct.Struct('<B')
+_MOUSE = struct.Struct('<dd')
+_COUNT = struct.Struct('<H')
+_ACTION = struct.Struct('<Hfff')
+
+
+class ActionRecorder:
+    """Appends episodes and frames to a binary stream opened for writing."""
+    def __init__(self, stream):
+        self.stream = stream
+        stream.write(MAGIC)
+
+    def start_episode(self, seed, settings):
+        payload = json.dumps(settings, sort_keys=True).encode()
+        self.stream.write(b'E' + _EPISODE.pack(seed, len(payload)) + payload)
+
+    def record_frame(self, mouse_pos, events, actions):
+        """actions: list of (controller index, raw action) applied this frame."""
+        flags = events | (MOUSE if mouse_pos is not None else 0)
+        parts = [b'F', _FRAME.pack(flags)]
+        if mouse_pos is not None: parts.append(_MOUSE.pack(*mouse_pos))
+        parts.append(_COUNT.pack(len(actions)))
+        parts.extend(_ACTION.pack(index, *map(float, action)) for index, action in actions)
+        self.stream.write(b''.join(parts))
+
+    def close(self):
+        self.stream.flush()
+
+
+class ActionLog:
+    """A parsed log: a list of episodes, each {'seed', 'settings', 'frames'}."""
+    def __init__(self, episodes):
+        self.episodes = episodes
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as stream:
+            return cls.parse(stream.read())
+
+    @classmethod
+    def parse(cls, data):
+        if not data.startswith(MAGIC): raise ValueError("not an action log")
+        view, pos, episodes = memoryview(data), len(MAGIC), []
+        while pos < len(data):
+            tag = data[pos:pos + 1]; pos += 1
+            if tag == b'E':
+                seed, size = _EPISODE.unpack_from(view, pos); pos += _EPISODE.size
+                settings = json.loads(bytes(view[pos:pos + size])); pos += size
+                episodes.append({'seed': seed, 'settings': settings, 'frames': []})
+            elif tag == b'F':
+                if not episodes: raise ValueError("frame record before any episode")
+                (flags,), pos = _FRAME.unpack_from(view, pos), pos + _FRAME.size
+                mouse = None
+                if flags & MOUSE:
+                    mouse = _MOUSE.unpack_from(view, pos); pos += _MOUSE.size
+                (count,), pos = _COUNT.unpack_from(view, pos), pos + _COUNT.size
+                actions = []
+                for _ in range(count):
+                    index, *action = _ACTION.unpack_from(view, pos); pos += _ACTION.size
+                    actions.append((index, np.array(action, dtype=np.float32)))
+                episodes[-1]['frames'].append((flags & (SPLIT | SHOOT), mouse, actions))
+            else:
+                raise ValueError(f"corrupt action log at byte {pos - 1}")
+        return cls(episodes)
+
+
+class _RecordedPolicy:
+    """Stands in for an ONNX session during replay; every action comes from the log."""
+    def get_inputs(self):
+        raise RuntimeError("replay reached a frame without a recorded model action")
+    run = get_inputs
+
+
+class Replayer:
+    """Re-simulates one episode of a log headless, with seeking to any frame."""
+    def __init__(self, log, episode=0):
+        from engine import Engine
+        self.episode = log.episodes[episode]
+        self.settings = dict(self.episode['settings'])
+        world_size = self.settings.pop('world_size', None)
+        policies = {name: _RecordedPolicy() for name in self.settings.get('ai_opponents', {})}
+        self.engine = Engine(ai_models=policies, observe=False, world_size=world_size)
+        self.restart()
+
+    def __len__(self):
+        return len(self.episode['frames'])
+
+    def restart(self):
+        self.engine.reset(seed=self.episode['seed'], **self.settings)
+        self.frame = 0
+
+    def step(self):
+        engine = self.engine
+        events, mouse, actions = self.episode['frames'][self.frame]
+        if events & SPLIT: engine.player_split()
+        if events & SHOOT: engine.player_shoot()
+        for index, action in actions:
+            engine.all_controllers[index].pending_action = action
+        engine.update_game_state(mouse_pos=mouse, observe=False)
+        self.frame += 1
+
+    def seek(self, frame):
+        """Moves to frame (clamped to the log), re-simulating from the start when going back."""
+        frame = max(0, min(frame, len(self)))
+        if frame < self.frame: self.restart()
+        while self.frame < frame: self.step()
+        return self.engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log')
+    parser.add_argument('--episode', type=int, default=0)
+    parser.add_argument('--frame', type=int, default=None, help="stop at this frame (default: the end)")
+    args = parser.parse_args()
+
+    log = ActionLog.load(args.log)
+    replayer = Replayer(log, args.episode)
+    target = len(replayer) if args.frame is None else args.frame
+    start = time.perf_counter()
+    engine = replayer.seek(target)
+    elapsed = time.perf_counter() - start
+    print(f"episode {args.episode}: frame {replayer.frame}/{len(replayer)} in {elapsed:.2f}s "
+          f"({replayer.frame / max(elapsed, 1e-9):.0f} frames/s)")
+    for controller in engine.all_controllers:
+        print(f"  {controller.name:>14}: mass {controller.mass:10.1f}, blobs {len(controller.blobs)}")
+
+
+if __name__ == '__main__':
+    main()
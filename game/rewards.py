@@ -0,0 +1,115 @@
+"""
+Reward shaping, evaluated for every controller at once. Each frame a
+controller earns
+
+    growth       sqrt(mass) - sqrt(mass before the frame)
+    distance     DISTANCE_REWARD_SCALER * how far its centre moved
+    direction    DIRECTION_CHANGE_REWARD_SCALER * (1 - cos of the turn
+                 between this frame's movement and the last one's)
+    stagnation   -STAGNATION_PENALTY_SCALER * seconds it has stood still
+    dominance    DOMINANCE_REWARD on the frame it reaches DOMINANCE_ABS_SIZE
+                 or DOMINANCE_REL_SIZE times the largest other controller
+                 (again only after it has dropped below both)
+
+or just DOMINANCE_PENALTY on a frame it was eaten. The shaped terms
+(distance, direction, stagnation) fade out linearly over the first
+SHAPED_REWARD_ANNEAL_FRAMES scored frames; the direction term, an
+exploration bonus, also fades over EXPLORATION_ANNEAL_FRAMES.
+"""
+import numpy as np
+
+STILL_SPEED = 0.5 # World units per frame below which a controller counts as standing still
+TERMS = ('growth', 'distance', 'direction', 'stagnation', 'dominance')
+
+
+class RewardEngine:
+    """
+    Holds the state the terms need (centre and mass before the frame, last
+    movement, frames spent still, dominance on the last frame) as arrays
+    aligned with self.controllers.
+    Call begin() before a frame and evaluate() after it. frames counts the
+    frames scored so far, across episodes, and drives the annealing; set it
+    to carry annealing over from an earlier run.
+    """
+    def __init__(self, config):
+        self.cfg = config
+        self.frames = 0
+        self.controllers = ()
+        self.mass = self.x = self.y = self.move_x = self.move_y = np.zeros(0)
+        self.still = np.zeros(0, dtype=np.int64)
+        self.dominant = np.zeros(0, dtype=bool)
+        self.terms = {} # Last frame's terms by name, aligned with controllers
+
+    @staticmethod
+    def _measure(controllers):
+        return np.array([(c.mass, c.center_x, c.center_y) for c in controllers], dtype=np.float64).reshape(-1, 3).T
+
+    def begin(self, controllers):
+        """Records every controller's mass and centre before a frame."""
+        controllers = tuple(controllers)
+        if controllers != self.controllers: self._align(controllers)
+        self.mass, self.x, self.y = self._measure(controllers)
+
+    def _align(self, controllers):
+        """Carries movement state over to a changed controller list; newcomers start still and not dominant."""
+        old = {c: i for i, c in enumerate(self.controllers)}
+        source = np.array([old.get(c, -1) for c in controllers], dtype=np.intp)
+        known = source >= 0
+        for name in ('move_x', 'move_y', 'still', 'dominant'):
+            values = getattr(self, name)
+            aligned = np.zeros(len(controllers), dtype=values.dtype)
+            aligned[known] = values[source[known]]
+            setattr(self, name, aligned)
+        self.controllers = controllers
+
+    def evaluate(self, eaten=()):
+        """
+        Scores the frame since begin(); eaten holds the controllers eaten
+        during it. Returns (reward, dominated) arrays aligned with
+        self.controllers. The individual terms are left in self.terms.
+        """
+        cfg = self.cfg
+        mass, x, y = self._measure(self.controllers)
+        move_x, move_y = x - self.x, y - self.y
+        moved = np.hypot(move_x, move_y)
+        before = np.hypot(self.move_x, self.move_y)
+        cos = np.divide(move_x * self.move_x + move_y * self.move_y, moved * before,
+                        out=np.ones_like(moved), where=(moved > 0) & (before > 0))
+        self.still = np.where(moved < STILL_SPEED, self.still + 1, 0)
+
+        shaped = max(0.0, 1.0 - self.frames / cfg.SHAPED_REWARD_ANNEAL_FRAMES)
+        exploring = shaped * max(0.0, 1.0 - self.frames / cfg.EXPLORATION_ANNEAL_FRAMES)
+        growth = np.sqrt(mass) - np.sqrt(self.mass)
+        distance = shaped * cfg.DISTANCE_REWARD_SCALER * moved
+        direction = exploring * cfg.DIRECTION_CHANGE_REWARD_SCALER * (1.0 - cos)
+        stagnation = -shaped * cfg.STAGNATION_PENALTY_SCALER * self.still / cfg.TICK_RATE
+
+        # The largest other mass: the top mass, or the runner-up's for the top controller.
+        largest_other = np.zeros_like(mass)
+        if len(mass) > 1:
+            top = int(np.argmax(mass))
+            largest_other[:] = mass[top]
+            largest_other[top] = np.partition(mass, -2)[-2]
+        dominated = (mass >= cfg.DOMINANCE_ABS_SIZE) | ((largest_other > 0) & (mass >= largest_other * cfg.DOMINANCE_REL_SIZE))
+        dominance = np.where(dominated & ~self.dominant, cfg.DOMINANCE_REWARD, 0.0)
+        reward = growth + distance + direction + stagnation + dominance
+
+        lost = np.array([c in eaten for c in self.controllers], dtype=bool)
+        if lost.any():
+            # Eaten controllers have respawned; their movement starts over.
+            reward[lost] = cfg.DOMINANCE_PENALTY
+            dominated &= ~lost
+            move_x[lost] = move_y[lost] = 0.0
+            self.still[lost] = 0
+        self.move_x, self.move_y, self.dominant = move_x, move_y, dominated
+        self.terms = dict(zip(TERMS, (growth, distance, direction, stagnation, dominance)))
+        self.frames += 1
+        return reward, dominated
+
+    def copy_state(self):
+        return (self.frames, self.controllers, self.move_x.copy(), self.move_y.copy(), self.still.copy(), self.dominant.copy())
+
+    def set_state(self, state):
+        frames, self.controllers, move_x, move_y, still, dominant = state
+        self.frames, self.move_x, self.move_y, self.still = frames, move_x.copy(), move_y.copy(), still.copy()
+        self.dominant = dominant.copy()
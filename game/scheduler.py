@@ -0,0 +1,105 @@
+"""
+Time-budgeted bot decisions. Re-deciding is the expensive part of a bot's
+frame: a scripted CPU runs its grid queries in decide_cpu_state() once its
+state_timer cooldown is over, and an AI opponent needs an observation and
+a model run. DecisionScheduler caps what an Engine spends on them per
+frame. The bots due for a decision are ranked and taken in order while
+their estimated cost fits the budget; the rest keep their state (scripted)
+or repeat their last action (AI) and are due again the next frame.
+
+Ranks, most urgent first:
+    0  must decide now: an AI opponent without a first action, or a bot
+       that has already waited max_delay frames
+    1  on the player's screen or in a fight: fleeing, chasing another
+       cell, or (AI) another cell within fight_range of its radius
+    2  everyone else
+and within a rank, the bot that has waited longest goes first.
+
+Costs are running means of the measured times (per scripted decision and
+per model row, observation included), so the plan adapts to the machine.
+The plan keeps the running mean error of its estimates as headroom, so
+that ordinary noise does not push half the frames over. Rank 0 is taken
+even past the budget. A frame whose decisions took longer
+than the budget is an overrun, counted in stats and in the profiler's
+budget_overruns counter.
+
+Which bots decide depends on wall-clock time, so an Engine with a
+scheduler is not reproducible from its seed; seeded runs, recordings and
+the server leave Engine.scheduler at None.
+"""
+import time
+
+
+class DecisionScheduler:
+    """
+    Use plan() before a frame's decisions, measured() for each one made
+    and end_frame() after them. waiting maps each bot that was passed over
+    to the frames it has waited.
+    """
+    clock = staticmethod(time.perf_counter)
+    SMOOTHING = 0.1 # Weight of a new measurement in the running means
+
+    def __init__(self, budget_ms=4.0, max_delay=30, fight_range=4.0):
+        self.budget = budget_ms / 1000
+        self.max_delay, self.fight_range = max_delay, fight_range
+        self.cost = {'scripted': None, 'model': None} # Seconds per decision, unknown until measured
+        self.waiting = {}
+        self.spent = self.estimate = 0.0
+        self.error = 0.0 # Running mean of |spent - estimate|
+        self.stats = {'frames': 0, 'decisions': 0, 'deferred': 0, 'overruns': 0, 'worst_delay': 0}
+
+    def _rank(self, controller, view, grid):
+        if controller.ai_model and controller.repeat_action is None: return 0
+        if self.waiting.get(controller, 0) >= self.max_delay: return 0
+        left, top, width, height = view
+        x, y = controller.center_x, controller.center_y
+        if left <= x < left + width and top <= y < top + height: return 1
+        if controller.ai_model:
+            reach = controller.total_radius * self.fight_range
+            return 1 if grid.blobs.within(x, y, reach, exclude_owner=controller) else 2
+        target = controller.target
+        return 1 if controller.state == 'fleeing' or (target is not None and target.owner is not None) else 2
+
+    def plan(self, due, view, grid):
+        """
+        The set of controllers in due (scripted CPUs past their cooldown and
+        AI opponents due a model decision) that decide this frame. view is
+        the player's camera (left, top, width, height).
+        """
+        self.spent = 0.0
+        ranks = {c: self._rank(c, view, grid) for c in due}
+        chosen, estimate, limit = set(), 0.0, self.budget - self.error
+        for controller in sorted(due, key=lambda c: (ranks[c], -self.waiting.get(c, 0))):
+            cost = self.cost['model' if controller.ai_model else 'scripted'] or 0.0
+            if ranks[controller] and estimate + cost > limit: continue
+            chosen.add(controller)
+            estimate += cost
+        self.estimate = estimate
+        self.waiting = {c: self.waiting.get(c, 0) + 1 for c in due if c not in chosen}
+        self.stats['decisions'] += len(chosen)
+        self.stats['deferred'] += len(self.waiting)
+        if self.waiting: self.stats['worst_delay'] = max(self.stats['worst_delay'], max(self.waiting.values()))
+        return chosen
+
+    def measured(self, kind, seconds, n=1):
+        """Books n decisions of kind ('scripted' or 'model') that took seconds together."""
+        self.spent += seconds
+        per = seconds / n
+        cost = self.cost[kind]
+        self.cost[kind] = per if cost is None else cost + self.SMOOTHING * (per - cost)
+
+    def end_frame(self, profiler=None):
+        overrun = self.spent > self.budget
+        self.error += self.SMOOTHING * (abs(self.spent - self.estimate) - self.error)
+        self.stats['frames'] += 1
+        self.stats['overruns'] += overrun
+        if profiler is not None:
+            profiler.add('decisions', self.spent)
+            profiler.count('deferred_decisions', len(self.waiting))
+            profiler.count('budget_overruns', int(overrun))
+
+    def summary(self):
+        frames = max(self.stats['frames'], 1)
+        return (f"{self.stats['decisions'] / frames:.1f} decisions/frame, {self.stats['deferred'] / frames:.1f} deferred, "
+                f"{self.stats['overruns']} overruns in {self.stats['frames']} frames (budget {self.budget * 1000:g} ms), "
+                f"longest wait {self.stats['worst_delay']} frames")
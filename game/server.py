@@ -0,0 +1,430 @@
+"""
+Authoritative multiplayer server. One Engine runs the world at a fixed
+tick; any number of human clients connect over TCP, a Unix socket or a
+WebSocket (needs the websockets package), send their aim and split/shoot
+input, and receive the world as binary deltas (see protocol.py).
+
+The world is divided into interest cells (cell_size units square). Each
+send, every entity is encoded once, grouped by cell, and each distinct
+acknowledged base tick is diffed once against it, cell by cell. A client
+gets the cells its camera overlaps: for cells it already had, the diff
+from its own acknowledged tick; for cells that came into view, their
+whole contents; for cells that left it, their keys as removals. Per
+client that is a few byte slices per cell in view, so neither its CPU
+nor its bandwidth grows with the number of players, and a client whose
+socket buffer is still full simply misses sends until it drains.
+
+    python server.py --port 8765 --world 6000 6000 --food 10000 --cpu 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+import protocol
+from engine import Engine, cfg
+from timestep import FixedTimestep
+
+try:
+    from websockets.asyncio.server import serve as websocket_serve
+    from websockets.exceptions import ConnectionClosed
+except ImportError:
+    websocket_serve = None
+
+
+class StreamConnection:
+    """A client on an asyncio stream: length-prefixed frames."""
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+
+    async def recv(self):
+        return await protocol.read_frame(self.reader)
+
+    def send(self, payload):
+        self.writer.write(protocol.frame(payload))
+
+    def buffered(self):
+        return self.writer.transport.get_write_buffer_size()
+
+    def close(self):
+        self.writer.close()
+
+
+class WebSocketConnection:
+    """A client on a WebSocket: one binary message per frame."""
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._sending = None
+
+    async def recv(self):
+        try:
+            message = await self.websocket.recv()
+        except ConnectionClosed:
+            return None
+        return message if isinstance(message, bytes) else None
+
+    def send(self, payload):
+        self._sending = asyncio.ensure_future(self.websocket.send(payload))
+        self._sending.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    def buffered(self):
+        # A send still in flight counts as a full buffer.
+        if self._sending is not None and not self._sending.done(): return 1 << 30
+        return self.websocket.transport.get_write_buffer_size()
+
+    def close(self):
+        asyncio.ensure_future(self.websocket.close())
+
+
+class CellState:
+    """
+    Every streamed entity at one send tick, ordered by interest cell and then
+    by key, with the add records and keys already encoded: what a client is
+    sent is a handful of byte slices out of these.
+    """
+    def __init__(self, keys, values, rgb, owner, cells, n_cells):
+        order = np.lexsort((keys, cells))
+        self.keys, self.values, self.cells = keys[order], values[order], cells[order]
+        self.records = protocol.add_records(self.keys, self.values, rgb[order], owner[order])
+        bounds = np.searchsorted(self.cells, np.arange(n_cells + 1)).tolist()
+        self.added = self.records.tobytes(), bounds, protocol.ADD.itemsize
+        self.removed = self.keys.astype(protocol.REMOVE).tobytes(), bounds, protocol.REMOVE.itemsize
+        owned = np.flatnonzero(self.records['owner'] != protocol.NO_OWNER)
+        self.owners = {}
+        for cell, owner in zip(self.cells[owned].tolist(), self.records['owner'][owned].tolist()):
+            self.owners.setdefault(cell, set()).add(owner)
+
+
+class CellDelta:
+    """
+    The change of every interest cell between two CellStates, as encoded
+    removed keys, add records and update records grouped by cell.
+    """
+    def __init__(self, base, now, n_cells):
+        _, i_now, i_base = np.intersect1d(now.keys, base.keys, assume_unique=True, return_indices=True)
+        step = now.values[i_now] - base.values[i_base]
+        # An entity that changes cell leaves the old one and enters the new
+        # one; so does one that moved too far for an update record.
+        kept = (now.cells[i_now] == base.cells[i_base]) & ~(np.abs(step) > protocol.MAX_STEP).any(axis=1)
+        gone = np.ones(len(base.keys), dtype=bool); gone[i_base[kept]] = False
+        new = np.ones(len(now.keys), dtype=bool); new[i_now[kept]] = False
+        moved = kept & step.any(axis=1)
+        order = np.argsort(i_now[moved])
+        changed = i_now[moved][order]
+        updates = np.empty(len(changed), protocol.UPDATE)
+        updates['key'] = now.keys[changed]
+        updates['dx'], updates['dy'], updates['dr'] = step[moved][order].T
+        cells = np.arange(n_cells + 1)
+        self.removed = (base.keys[gone].astype(protocol.REMOVE).tobytes(),
+                        np.searchsorted(base.cells[gone], cells).tolist(), protocol.REMOVE.itemsize)
+        self.added = now.records[new].tobytes(), np.searchsorted(now.cells[new], cells).tolist(), protocol.ADD.itemsize
+        self.updated = updates.tobytes(), np.searchsorted(now.cells[changed], cells).tolist(), protocol.UPDATE.itemsize
+
+
+def _take(parts, counts, index, chunk, cell):
+    data, bounds, size = chunk
+    n = bounds[cell + 1] - bounds[cell]
+    if n:
+        parts[index].append(data[bounds[cell] * size:bounds[cell + 1] * size])
+        counts[index] += n
+
+
+class ClientSession:
+    """One connected player: its controller, latest input and acknowledged state."""
+    def __init__(self, connection, controller, owner):
+        self.connection, self.controller, self.owner = connection, controller, owner
+        self.aim = None; self.flags = 0
+        # The client's state at the acknowledged tick is every entity of base_cells at that tick.
+        self.acked, self.base_cells = 0, frozenset()
+        self.history = {} # tick -> cells sent but not yet acknowledged
+        self.known_owners = set()
+        self.center = (0.0, 0.0)
+        self.bytes_sent = self.skipped = 0
+
+    def acknowledge(self, tick):
+        cells = self.history.get(tick)
+        if cells is None or tick <= self.acked: return
+        self.acked, self.base_cells = tick, cells
+        for old in [t for t in self.history if t <= tick]: del self.history[old]
+
+    def forget(self):
+        """Starts over from the empty state."""
+        self.acked, self.base_cells = 0, frozenset()
+        self.history.clear()
+
+
+class GameServer:
+    """
+    Runs the simulation and the connections on one event loop. Input is
+    applied at the next tick; states go out every send_every ticks.
+    """
+    def __init__(self, world_size=(6000, 6000), tick_rate=60, send_every=2, num_food=10000, num_cpu=20,
+                 num_viruses=60, ai_opponents=None, view=(cfg.SCREEN_WIDTH, cfg.SCREEN_HEIGHT), cell_size=400,
+                 max_buffer=256 * 1024, history=32, stats_path=None):
+        self.tick_rate, self.send_every = tick_rate, send_every
+        self.half_view = (view[0] / 2, view[1] / 2)
+        self.cell_size = cell_size
+        self.grid_size = (-(-world_size[0] // cell_size), -(-world_size[1] // cell_size))
+        self.max_buffer, self.history = max_buffer, history
+        self.scale = protocol.position_scale(*world_size)
+        ai_opponents = ai_opponents or {}
+        self.engine = Engine(ai_models=None if ai_opponents else {}, observe=False, world_size=world_size)
+        self.engine.reset_game(num_cpu=num_cpu, num_food=num_food, num_viruses=num_viruses, ai_opponents=ai_opponents)
+        # Every human is a client; the engine's own player is not needed.
+        self.engine.remove_player(self.engine.player)
+        self.engine.enable_profiling(snapshot_path=stats_path)
+        self.sessions = {}
+        self.tick = 0
+        self.states = {} # send tick -> CellState, as long as a client may still use it as a base
+        self._views = {}
+        self._owners, self._names, self._next_owner = {}, {}, 0
+        self._blob_ids, self._next_blob = {}, 0
+        self.dropped_ticks = 0
+
+    def owner_id(self, controller):
+        owner = self._owners.get(controller)
+        if owner is None:
+            owner = self._owners[controller] = self._next_owner
+            self._names[owner] = controller.name
+            self._next_owner = (self._next_owner + 1) % protocol.NO_OWNER
+        return owner
+
+    # --- Connections ---
+
+    async def handle(self, connection):
+        payload = await connection.recv()
+        try:
+            name = protocol.parse_hello(payload or b'')
+        except ValueError:
+            connection.close()
+            return
+        controller = self.engine.add_player(name or f"Player {len(self.sessions) + 1}")
+        session = self.sessions[controller] = ClientSession(connection, controller, self.owner_id(controller))
+        engine = self.engine
+        connection.send(protocol.welcome(session.owner, engine.world_width, engine.world_height,
+                                         self.tick_rate // self.send_every, self.scale))
+        try:
+            while True:
+                payload = await connection.recv()
+                if payload is None: break
+                if payload[:1] != protocol.INPUT: continue
+                try:
+                    ack, aim_x, aim_y, flags = protocol.parse_input(payload)
+                except ValueError:
+                    continue # A malformed input is dropped like an unknown message
+                session.acknowledge(ack)
+                session.aim = (aim_x, aim_y)
+                session.flags |= flags
+        finally:
+            del self.sessions[controller]
+            self._names.pop(self._owners.pop(controller, None), None)
+            engine.remove_player(controller)
+            connection.close()
+
+    async def _handle_stream(self, reader, writer):
+        await self.handle(StreamConnection(reader, writer))
+
+    async def _handle_websocket(self, websocket):
+        await self.handle(WebSocketConnection(websocket))
+
+    async def listen(self, host='127.0.0.1', port=None, unix_path=None, websocket_port=None):
+        servers = []
+        if port is not None: servers.append(await asyncio.start_server(self._handle_stream, host, port, backlog=1024))
+        if unix_path is not None: servers.append(await asyncio.start_unix_server(self._handle_stream, unix_path, backlog=1024))
+        if websocket_port is not None:
+            if websocket_serve is None: raise SystemExit("WebSocket clients need the websockets package: pip install websockets")
+            servers.append(await websocket_serve(self._handle_websocket, host, websocket_port, compression=None))
+        return servers
+
+    async def close(self, timeout=1.0):
+        """Disconnects every client and waits (up to timeout) for their handlers to finish."""
+        for session in list(self.sessions.values()): session.connection.close()
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self.sessions and asyncio.get_running_loop().time() < deadline: await asyncio.sleep(0.01)
+
+    # --- Simulation ---
+
+    async def run(self, duration=None, speed=1.0):
+        """
+        Ticks at tick_rate (times speed) until cancelled or duration wall
+        seconds have passed. Ticks more than five behind are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        timer = FixedTimestep(self.tick_rate, speed, clock=loop.time)
+        start = loop.time()
+        while duration is None or loop.time() - start < duration:
+            for _ in range(timer.frames_due()): self.step()
+            self.dropped_ticks = timer.dropped
+            await asyncio.sleep(timer.until_next())
+
+    def step(self):
+        engine, prof = self.engine, self.engine.profiler
+        t = prof.clock()
+        targets = {}
+        for controller, session in self.sessions.items():
+            if session.aim is not None: targets[controller] = session.aim
+            if controller.blobs and session.flags & protocol.SPLIT: controller.split()
+            if controller.blobs and session.flags & protocol.SHOOT: controller.shoot_mass(engine.masses)
+            session.flags = 0
+        # The server has no step(): the AI opponents due to decide observe here.
+        engine.update_game_state(targets=targets)
+        self.tick += 1
+        if self.tick % self.send_every == 0 and self.sessions:
+            t = prof.clock()
+            self.broadcast()
+            prof.lap('network', t)
+        prof.count('clients', len(self.sessions))
+        prof.end_frame(engine)
+
+    def _blob_arrays(self):
+        """Every player cell this tick as (x, y, r, key, rgb, owner) arrays."""
+        ids, next_id = {}, self._next_blob
+        rows, rgb, owners = [], [], []
+        for controller in self.engine.all_controllers:
+            owner = self.owner_id(controller)
+            for blob in controller.blobs:
+                blob_id = self._blob_ids.get(blob)
+                if blob_id is None: blob_id, next_id = next_id, next_id + 1
+                ids[blob] = blob_id
+                rows.append((blob.x, blob.y, blob.radius, blob_id)); rgb.append(blob.color); owners.append(owner)
+        self._blob_ids, self._next_blob = ids, next_id
+        rows = np.array(rows, dtype=np.float64).reshape(-1, 4)
+        return (rows[:, 0], rows[:, 1], rows[:, 2], protocol.keys(protocol.BLOB, rows[:, 3].astype(np.int64)),
+                np.array(rgb, dtype=np.uint8).reshape(-1, 3), np.array(owners, dtype=np.uint16))
+
+    @staticmethod
+    def _store_arrays(kind, store, indices=None):
+        """(x, y, r, key, rgb, owner) arrays of a store's entities (all live ones by default)."""
+        if indices is None: indices = np.arange(store.count)
+        n = len(indices)
+        return (store.x[indices], store.y[indices], store.radius[indices], protocol.keys(kind, store.uid[indices]),
+                np.broadcast_to(np.array(store.color, dtype=np.uint8), (n, 3)), np.full(n, protocol.NO_OWNER, np.uint16))
+
+    def cell_state(self):
+        """A CellState of every player cell, food, virus and mass this tick."""
+        engine = self.engine
+        parts = [self._blob_arrays(), self._store_arrays(protocol.MASS, engine.masses),
+                 self._store_arrays(protocol.FOOD, engine.food), self._store_arrays(protocol.VIRUS, engine.viruses)]
+        xs, ys, rs, keys, rgb, owner = [np.concatenate(columns) for columns in zip(*parts)]
+        grid_w, grid_h = self.grid_size
+        cells = (np.clip((ys // self.cell_size).astype(np.int64), 0, grid_h - 1) * grid_w
+                 + np.clip((xs // self.cell_size).astype(np.int64), 0, grid_w - 1))
+        values = np.column_stack((xs * self.scale, ys * self.scale, rs * protocol.RADIUS_SCALE))
+        values = np.clip(np.rint(values), 0, 0xFFFF).astype(np.int32)
+        return CellState(keys, values, rgb, owner, cells, grid_w * grid_h)
+
+    def view_cells(self, center):
+        """The interest cells a camera at center overlaps."""
+        grid_w, grid_h = self.grid_size
+        (cx, cy), (hw, hh), size = center, self.half_view, self.cell_size
+        bounds = (max(0, int((cx - hw) // size)), min(grid_w - 1, int((cx + hw) // size)),
+                  max(0, int((cy - hh) // size)), min(grid_h - 1, int((cy + hh) // size)))
+        cells = self._views.get(bounds)
+        if cells is None:
+            x0, x1, y0, y1 = bounds
+            cells = self._views[bounds] = frozenset(y * grid_w + x for y in range(y0, y1 + 1) for x in range(x0, x1 + 1))
+        return cells
+
+    def broadcast(self):
+        prof = self.engine.profiler
+        now = self.states[self.tick] = self.cell_state()
+        oldest = self.tick - self.history * self.send_every
+        for tick in [t for t in self.states if t < oldest]: del self.states[tick]
+        n_cells = self.grid_size[0] * self.grid_size[1]
+        deltas = {} # base tick -> CellDelta, shared by every client on that base
+        for session in self.sessions.values():
+            connection = session.connection
+            if connection.buffered() > self.max_buffer:
+                session.skipped += 1; prof.count('skipped_sends')
+                continue
+            if session.controller.blobs: session.center = (session.controller.center_x, session.controller.center_y)
+            if session.acked and session.acked not in self.states:
+                # Acknowledged too long ago: the client starts over from nothing.
+                session.forget()
+            base = self.states.get(session.acked)
+            delta = deltas.get(session.acked)
+            if delta is None and base is not None: delta = deltas[session.acked] = CellDelta(base, now, n_cells)
+            cells, base_cells = self.view_cells(session.center), session.base_cells
+            parts, counts, owners = ([], [], []), [0, 0, 0], set()
+            for cell in cells:
+                if cell in base_cells:
+                    _take(parts, counts, 0, delta.removed, cell)
+                    _take(parts, counts, 1, delta.added, cell)
+                    _take(parts, counts, 2, delta.updated, cell)
+                else:
+                    _take(parts, counts, 1, now.added, cell)
+                if cell in now.owners: owners |= now.owners[cell]
+            for cell in base_cells - cells: _take(parts, counts, 0, base.removed, cell)
+            if len(session.history) >= self.history:
+                # The client stopped acknowledging: forget the oldest unacknowledged send.
+                del session.history[min(session.history)]
+            session.history[self.tick] = cells
+
+            new_owners = owners - session.known_owners
+            if new_owners:
+                connection.send(protocol.names([(owner, self._names[owner]) for owner in new_owners]))
+                session.known_owners |= new_owners
+            payload = b''.join((protocol.delta_header(self.tick, session.acked, *counts), *parts[0], *parts[1], *parts[2]))
+            connection.send(payload)
+            session.bytes_sent += len(payload)
+            prof.count('bytes_sent', len(payload))
+            if not session.acked: prof.count('full_states')
+
+    def stats(self):
+        """The profiler summary plus per-client traffic."""
+        summary = self.engine.profiler.summary()
+        sent = [s.bytes_sent for s in self.sessions.values()]
+        summary.update(tick=self.tick, tick_rate=self.tick_rate, send_every=self.send_every, dropped_ticks=self.dropped_ticks,
+                       clients=len(self.sessions), client_bytes_sent=sent,
+                       client_skipped_sends=[s.skipped for s in self.sessions.values()])
+        return summary
+
+
+async def serve(args):
+    server = GameServer(world_size=tuple(args.world), tick_rate=args.tick_rate, send_every=args.send_every,
+                        num_food=args.food, num_cpu=args.cpu, num_viruses=args.viruses,
+                        ai_opponents={name: count for name, count in zip(('aggressor', 'farmer', 'survivor'), args.ai)},
+                        cell_size=args.cell_size)
+    listeners = await server.listen(args.host, args.port, args.unix, args.websocket)
+    print(f"Serving on {', '.join(str(s.sockets[0].getsockname()) for s in listeners)} at {args.tick_rate} ticks/s", flush=True)
+    started = time.perf_counter()
+    try:
+        await server.run(args.duration, args.speed)
+    finally:
+        if args.stats:
+            stats = dict(server.stats(), seconds=time.perf_counter() - started)
+            with open(args.stats + '.tmp', 'w') as f: json.dump(stats, f)
+            os.replace(args.stats + '.tmp', args.stats)
+        for listener in listeners: listener.close()
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help="TCP port (length-prefixed frames)")
+    parser.add_argument('--unix', help="also listen on this Unix socket path")
+    parser.add_argument('--websocket', type=int, help="also accept WebSocket clients on this port")
+    parser.add_argument('--tick-rate', type=int, default=60)
+    parser.add_argument('--send-every', type=int, default=2, help="ticks between state sends")
+    parser.add_argument('--speed', type=float, default=1.0, help="game seconds per wall second")
+    parser.add_argument('--world', type=int, nargs=2, default=[6000, 6000])
+    parser.add_argument('--food', type=int, default=10000)
+    parser.add_argument('--cpu', type=int, default=20)
+    parser.add_argument('--viruses', type=int, default=60)
+    parser.add_argument('--ai', type=int, nargs=3, default=[0, 0, 0], metavar=('AGGRESSOR', 'FARMER', 'SURVIVOR'))
+    parser.add_argument('--cell-size', type=int, default=400, help="side of the interest cells, in world units")
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--stats', help="write the server's statistics here as JSON on exit")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+"""
+Spatially sharded collisions for very large arenas. The arena is cut into
+vertical strips, one per worker process. Each frame the coordinator (a
+ShardedEngine) writes blob, mass and virus positions into shared memory,
+food only where it respawned. Every worker finds the contacts of the
+blobs centred in its strip, reading the entities of neighbouring strips
+within a halo of its borders from the same shared arrays. A blob that
+crosses a border belongs to the neighbouring worker from the next frame
+on. Only the contact lists travel back through the pipes.
+
+The coordinator then resolves the contacts in exactly the order
+Engine._handle_collisions does: controller by controller, blob by blob,
+and query order within a blob. So who eats whom, the RNG draws of virus
+pops and the food respawns are bit-identical to a single-process game, for
+any world size and worker count. Workers search with the radius grown by
+GROWTH, so blobs that gain mass earlier in the frame are still covered; a
+blob that outgrows even that is looked up in the coordinator's own grid.
+
+Controller decisions and movement stay on the coordinator: they draw from
+the game's single RNG stream in controller order.
+"""
+import math
+import multiprocessing as mp
+
+import numpy as np
+
+from engine import Engine
+from spatial import ArrayLayer
+from vecenv import SharedArrays
+from world import touching
+
+# Workers look for contacts within radius * GROWTH + SLACK. Eating a blob
+# grows one by at most sqrt(1 + 1 / 1.1**2) ~ 1.35x, food by far less.
+GROWTH, SLACK = 1.4, 4.0
+SMALL_BOUND = 32.0 # Blobs whose search radius is at most this share a fine index
+CELL_SIZE = 50 # Of the food, mass and virus indexes, as in SpatialHashGrid
+
+
+class Rows:
+    """
+    EntityArrays-shaped view (x, y, radius, count) of a (3, capacity) block,
+    so ArrayLayer and touching() work on it.
+    """
+    def __init__(self, block, count=0):
+        self.x, self.y, self.radius = block[0], block[1], block[2]
+        self.count = count
+
+    @property
+    def xs(self): return self.x[:self.count]
+    @property
+    def ys(self): return self.y[:self.count]
+    @property
+    def radii(self): return self.radius[:self.count]
+
+
+def contacts(layer, store, xs, ys, reach):
+    """
+    (i, entity) pairs for every entity of store whose circle comes closer
+    than reach[i] to (xs[i], ys[i]), grouped by i in increasing order. One
+    vectorized pass does what a layer.query() per point would.
+    """
+    size, width, height = layer.cell_size, layer.grid_width, layer.grid_height
+    span = reach + layer.max_radius
+    x0 = np.clip((xs - span) // size, 0, width - 1).astype(np.intp)
+    x1 = np.clip((xs + span) // size, 0, width - 1).astype(np.intp)
+    y0 = np.clip((ys - span) // size, 0, height - 1).astype(np.intp)
+    y1 = np.clip((ys + span) // size, 0, height - 1).astype(np.intp)
+    # Every (point, cell) the points' squares cover, then every entity in those cells.
+    nx = x1 - x0 + 1
+    spans = nx * (y1 - y0 + 1)
+    point = np.repeat(np.arange(len(xs)), spans)
+    offset = np.arange(len(point)) - np.repeat(np.cumsum(spans) - spans, spans)
+    cell = x0[point] + offset % nx[point] + (y0[point] + offset // nx[point]) * width
+    counts = layer.counts[cell]
+    point, cell = np.repeat(point, counts), np.repeat(cell, counts)
+    slot = np.arange(len(point)) - np.repeat(np.cumsum(counts) - counts, counts)
+    entity = layer.buckets[cell, slot]
+    near = store.radius[entity] + reach[point]
+    close = (store.x[entity] - xs[point]) ** 2 + (store.y[entity] - ys[point]) ** 2 < near * near
+    return point[close], entity[close]
+
+
+class Region:
+    """
+    One strip of the arena, left <= x < right. contacts() lists, for every
+    blob centred in it, the other players' blobs and the food, mass and
+    viruses it may touch this frame. The food index follows respawns
+    incrementally; everything else moves and is indexed from scratch.
+    """
+    def __init__(self, left, right, width, height):
+        self.left, self.right = left, right
+        self.width, self.height = width, height
+        self.food_index = ArrayLayer(width, height, CELL_SIZE)
+        self.mass_index = ArrayLayer(width, height, CELL_SIZE)
+        self.virus_index = ArrayLayer(width, height, CELL_SIZE)
+        self.small_index = ArrayLayer(width, height, 2 * SMALL_BOUND)
+        self.large_index = ArrayLayer(width, height, 4 * SMALL_BOUND)
+        self.arrays = None; self.food = None
+
+    def attach(self, arrays):
+        """Switches to new (or grown) shared arrays; their food is already indexed."""
+        self.arrays = arrays
+        self.food = Rows(arrays['food'], self.food.count if self.food else 0)
+
+    def load_food(self, count):
+        self.food.count = count
+        self.food_index.rebuild(self.food)
+
+    def contacts(self, counts, moved_food=None):
+        """
+        For each kind, the contacts of the blobs this region owns as arrays
+        of blob index and partner index. Food, mass and virus contacts come
+        with a third array: whether they touch at the blob's current radius.
+        """
+        if moved_food is not None: self.food_index.update(self.food, moved_food)
+        x, y, radius, bound, owner = self.arrays['blobs'][:, :counts['blobs']]
+        own = np.flatnonzero((x >= self.left) & (x < self.right))
+        found = {'blobs': self._blob_pairs(x, y, bound, owner, own)}
+        ox, oy, oradius, obound = x[own], y[own], radius[own], bound[own]
+        for name, index in (('food', self.food_index), ('mass', self.mass_index), ('viruses', self.virus_index)):
+            store = self.food
+            if name != 'food':
+                store = Rows(self.arrays[name], counts[name])
+                index.rebuild(store)
+            i, entity = contacts(index, store, ox, oy, obound)
+            # touching() at the current radius, with the same arithmetic.
+            reach = store.radius[entity] + oradius[i]
+            hit = (store.x[entity] - ox[i]) ** 2 + (store.y[entity] - oy[i]) ** 2 < reach * reach
+            found[name] = (own[i], entity, hit)
+        return found
+
+    def _blob_pairs(self, x, y, bound, owner, own):
+        """(i, j) for each owned blob i and other player's blob j closer than bound[i] + bound[j]."""
+        if not len(own): return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        halo = 2 * float(bound.max())
+        near = np.flatnonzero((x >= self.left - halo) & (x < self.right + halo))
+        large = bound[near] > SMALL_BOUND
+        small, big = near[~large], near[large]
+        owned = np.zeros(len(x), dtype=bool); owned[own] = True
+        # Small blobs find each other through a fine index...
+        rows = Rows(np.stack((x[small], y[small], bound[small])), len(small))
+        self.small_index.rebuild(rows)
+        queries = own[bound[own] <= SMALL_BOUND]
+        i, j = contacts(self.small_index, rows, x[queries], y[queries], bound[queries])
+        pairs = [(queries[i], small[j])]
+        # ...and the few large ones search both indexes, so their pairs with
+        # small blobs are recorded from both sides.
+        if len(big):
+            pairs.append(self._search(self.small_index, rows, small, x, y, bound, big, owned, both_ways=True))
+            cell_size = max(4 * SMALL_BOUND, 2 ** math.ceil(math.log2(2 * float(bound[big].max()))))
+            rows = Rows(np.stack((x[big], y[big], bound[big])), len(big))
+            self.large_index.rebuild(rows, cell_size)
+            pairs.append(self._search(self.large_index, rows, big, x, y, bound, big, owned))
+        i, j = (np.concatenate(column) for column in zip(*pairs))
+        keep = owner[i] != owner[j]
+        return i[keep], j[keep]
+
+    @staticmethod
+    def _search(index, rows, members, x, y, bound, queries, owned, both_ways=False):
+        i, j = contacts(index, rows, x[queries], y[queries], bound[queries])
+        i, j = queries[i], members[j]
+        if both_ways: i, j = np.concatenate((i, j)), np.concatenate((j, i))
+        return i[owned[i]], j[owned[i]]
+
+
+def _worker(conn, bounds, world_size, spec, names):
+    shared = SharedArrays(spec, names)
+    region = Region(*bounds, *world_size)
+    region.attach(shared.arrays)
+    try:
+        while True:
+            command, *args = conn.recv()
+            if command == 'close': break
+            if command == 'attach':
+                old, shared = shared, SharedArrays(*args)
+                region.attach(shared.arrays)
+                old.close()
+                conn.send(True)
+            else:
+                conn.send(getattr(region, command)(*args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shared.close()
+
+
+def _grouped(replies, n, name):
+    """
+    One kind of contacts from every region as (starts, blob, *partner
+    columns), sorted by blob; blob k's rows are starts[k]:starts[k + 1].
+    """
+    columns = [np.concatenate(parts) for parts in zip(*(reply[name] for reply in replies))]
+    order = np.argsort(columns[0], kind='stable')
+    columns = [column[order] for column in columns]
+    return (np.searchsorted(columns[0], np.arange(n + 1)).tolist(), *columns)
+
+
+class ShardedEngine(Engine):
+    """
+    An Engine whose collision pass is spread over `workers` processes by
+    region (see the module docstring). With workers=0 the regions run in
+    this process, one after the other, which is useful as a reference.
+    Games play out exactly as on an Engine with the same seed and inputs.
+    close() (or leaving a with block) stops the workers.
+    """
+    def __init__(self, workers=2, start_method=None, **kwargs):
+        super().__init__(**kwargs)
+        edges = np.linspace(0, self.world_width, max(1, workers) + 1).tolist()
+        edges[0], edges[-1] = -math.inf, math.inf
+        bounds = list(zip(edges[:-1], edges[1:]))
+        self._edges = edges[1:-1]
+        self.region_blobs = [0] * len(bounds) # Blobs each region owned in the last frame
+        self.capacity = {'blobs': 256, 'food': 64, 'mass': 256, 'viruses': 64}
+        self._moved_food = []
+        self._shared = None; self._conns, self._processes = [], []
+        self.regions = [] if workers else [Region(*b, self.world_width, self.world_height) for b in bounds]
+        self._allocate()
+        context = mp.get_context(start_method)
+        for b in bounds[:workers]:
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker, daemon=True,
+                                      args=(child, b, (self.world_width, self.world_height), self._spec(), self._shared.names))
+            process.start()
+            child.close()
+            self._conns.append(parent); self._processes.append(process)
+        self.closed = False
+
+    def _spec(self):
+        return {name: ((5 if name == 'blobs' else 3, capacity), np.float64) for name, capacity in self.capacity.items()}
+
+    def _allocate(self):
+        """(Re)creates the arrays at the current capacity, keeping their contents, and attaches every region."""
+        spec, old = self._spec(), getattr(self, 'arrays', None)
+        if self.regions:
+            self.arrays = {name: np.zeros(shape, dtype) for name, (shape, dtype) in spec.items()}
+        else:
+            previous, self._shared = self._shared, SharedArrays(spec)
+            self.arrays = self._shared.arrays
+        if old is not None:
+            for name, array in old.items(): self.arrays[name][:, :array.shape[1]] = array
+        if self.regions:
+            for region in self.regions: region.attach(self.arrays)
+        elif old is not None:
+            self._call('attach', spec, self._shared.names)
+            previous.close(unlink=True)
+
+    def _reserve(self, counts):
+        grown = {name: 1 << (n - 1).bit_length() for name, n in counts.items() if n > self.capacity[name]}
+        if not grown: return
+        self.capacity.update(grown)
+        self._allocate()
+
+    def _call(self, command, *args):
+        """Runs a Region method in every region and returns the results in region order."""
+        if self._conns:
+            for conn in self._conns: conn.send((command,) + args)
+            return [conn.recv() for conn in self._conns]
+        return [getattr(region, command)(*args) for region in self.regions]
+
+    def _load_food(self):
+        food = self.food
+        self._reserve({'food': food.count})
+        self.arrays['food'][:, :food.count] = food.xs, food.ys, food.radii
+        self._call('load_food', food.count)
+        self._moved_food = []
+
+    def reset_game(self, *args, **kwargs):
+        super().reset_game(*args, **kwargs)
+        self._load_food()
+
+    def restore(self, snapshot):
+        super().restore(snapshot)
+        self._load_food()
+
+    def _contacts(self, blobs):
+        """Writes this frame's entities to the shared arrays and gathers every region's contacts."""
+        masses, viruses = self.masses, self.viruses
+        n = len(blobs)
+        self._reserve({'blobs': n, 'mass': masses.count, 'viruses': viruses.count})
+        rows = self.arrays['blobs']
+        if n:
+            rows[:3, :n] = np.array([(b.x, b.y, b.radius) for b in blobs]).T
+            rows[3, :n] = rows[2, :n] * GROWTH + SLACK
+            rows[4, :n] = [i for i, c in enumerate(self.all_controllers) for _ in c.blobs]
+        for name, store in (('mass', masses), ('viruses', viruses)):
+            self.arrays[name][:, :store.count] = store.xs, store.ys, store.radii
+        moved = np.concatenate(self._moved_food) if self._moved_food else None
+        self._moved_food = []
+        self.region_blobs = np.bincount(np.searchsorted(self._edges, rows[0, :n], side='right'),
+                                        minlength=len(self.region_blobs)).tolist()
+        return self._call('contacts', {'blobs': n, 'mass': masses.count, 'viruses': viruses.count}, moved)
+
+    def _handle_collisions(self):
+        # Engine._handle_collisions step for step, with the regions' contact
+        # lists in place of grid queries wherever they are known to be complete.
+        food, masses, viruses = self.food, self.masses, self.viruses
+        eaten_food = np.zeros(food.count, dtype=bool)
+        eaten_mass = np.zeros(masses.count, dtype=bool)
+        popped_viruses = np.zeros(viruses.count, dtype=bool)
+        removed = set() # Blobs eaten or popped this frame
+        eaten_by = {}
+        grid = self.grid
+        grid.blobs.sync(self.all_controllers)
+        grid.mass.rebuild(masses)
+        blobs = [b for c in self.all_controllers for b in c.blobs]
+        replies = self._contacts(blobs)
+        n = len(blobs)
+        radius0 = self.arrays['blobs'][2, :n].tolist()
+        bound = self.arrays['blobs'][3, :n].tolist()
+        blob_starts, _, partners = _grouped(replies, n, 'blobs')
+        partners = partners.tolist()
+        pellets = {}
+        for name, store, index, eaten in (('food', food, grid.food, eaten_food), ('mass', masses, grid.mass, eaten_mass),
+                                          ('viruses', viruses, grid.viruses, popped_viruses)):
+            starts, owners, near, hit = _grouped(replies, n, name)
+            hit_starts = np.searchsorted(owners[hit], np.arange(n + 1)).tolist()
+            pellets[name] = (store, index, eaten, starts, near, hit_starts, near[hit])
+        tested = len(partners) + sum(len(p[4]) for p in pellets.values())
+        layer = grid.blobs
+        position = {b: k for k, b in enumerate(blobs)}
+        overgrown = set() # Indexes of blobs that outgrew their search radius this frame
+
+        def touched(k, b1, exact, store, index, eaten, starts, near, hit_starts, hits):
+            """What touching() over a grid query would give for b1, or None for nothing."""
+            if exact:
+                nearby = index.query(b1.x, b1.y, b1.radius)
+            elif b1.radius == radius0[k]:
+                if hit_starts[k] == hit_starts[k + 1]: return None
+                hit = hits[hit_starts[k]:hit_starts[k + 1]]
+                return hit[~eaten[hit]]
+            else:
+                nearby = near[starts[k]:starts[k + 1]]
+            return touching(store, nearby[~eaten[nearby]], b1.x, b1.y, b1.radius)
+
+        for k, b1 in enumerate(blobs):
+            c1 = b1.owner
+            if b1 in removed: continue
+            exact = k in overgrown
+            if exact:
+                nearby_blobs = [e[0] for e in layer.query(b1.x, b1.y, b1.radius)]
+            else:
+                candidates = partners[blob_starts[k]:blob_starts[k + 1]]
+                if overgrown: candidates = set(candidates).union(overgrown) - {k}
+                nearby_blobs = [blobs[j] for j in candidates if layer.in_query(blobs[j], b1.x, b1.y, b1.radius)]
+                if len(nearby_blobs) > 1: nearby_blobs.sort(key=layer.order_key)
+            query_radius, i = b1.radius, 0
+            while i < len(nearby_blobs):
+                b2 = nearby_blobs[i]; i += 1
+                if b1 is b2 or not b1.collides_with(b2): continue
+                c2 = b2.owner
+                if c1 != c2:
+                    larger, smaller = (b1, b2) if b1.radius > b2.radius else (b2, b1)
+                    larger_c = c1 if b1.radius > b2.radius else c2
+                    if smaller not in removed and larger.radius > smaller.radius * 1.1:
+                        larger.radius = math.sqrt(larger.radius**2 + smaller.radius**2)
+                        removed.add(smaller)
+                        eaten_by[smaller] = larger_c
+                        if larger.radius > bound[position[larger]]:
+                            overgrown.add(position[larger])
+                            if larger is b1 and not exact:
+                                # The rest of its pairs may lie beyond what was searched:
+                                # carry on through the full query after b2.
+                                exact = True
+                                nearby_blobs = [e[0] for e in layer.query(b1.x, b1.y, query_radius)]
+                                i = nearby_blobs.index(b2) + 1
+            exact = exact or k in overgrown
+            # Food and ejected mass.
+            for name in ('food', 'mass'):
+                store, index, eaten = pellets[name][:3]
+                if not store.count: continue
+                hit = touched(k, b1, exact, *pellets[name])
+                if hit is not None and hit.size:
+                    # Query order, so the float sum matches Engine's.
+                    if hit.size > 1: hit = hit[np.lexsort((index.slot_of[hit], index.cell_of[hit]))]
+                    eaten[hit] = True
+                    b1.radius = math.sqrt(b1.radius**2 + float(np.square(store.radius[hit]).sum()))
+                    if b1.radius > bound[k]: overgrown.add(k); exact = True
+            if not viruses.count: continue
+            hit = touched(k, b1, exact, *pellets['viruses'])
+            if hit is None: continue
+            hit = hit[b1.radius > viruses.radius[hit] * 1.1]
+            if hit.size:
+                removed.add(b1); popped_viruses[hit.min()] = True
+                self._pop(c1, b1)
+        respawned = self._settle_collisions(eaten_food, eaten_mass, popped_viruses, removed, eaten_by, tested)
+        if respawned.size:
+            # The workers' food arrays follow the respawns.
+            self.arrays['food'][:2, respawned] = food.x[respawned], food.y[respawned]
+            self._moved_food.append(respawned)
+
+    def close(self):
+        if self.closed: return
+        for conn, process in zip(self._conns, self._processes):
+            try:
+                conn.send(('close',))
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=5)
+            if process.is_alive(): process.terminate()
+        if self._shared is not None:
+            self.arrays = None
+            self._shared.close(unlink=True)
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
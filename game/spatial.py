@@ -0,0 +1,387 @@
+"""
+Incremental spatial hash. The world is indexed by one layer per entity type.
+Entries are bucketed by their centre cell and only touched when the entity
+changes cell, respawns or is removed, so static food and viruses cost
+nothing per frame. Queries widen their reach by the largest radius in the
+layer and write into reusable buffers instead of allocating. With a
+compiled kernel backend (kernels.py) ArrayLayer queries run as loops.
+"""
+import math
+import numpy as np
+
+import kernels
+from world import touching
+
+
+class ArrayLayer:
+    """
+    Index over an EntityArrays store, keyed by entity index. Each cell is a
+    row of a (cells, capacity) bucket matrix; entities are swap-removed from
+    their old row and appended to the new one when they change cell.
+    """
+    def __init__(self, width, height, cell_size):
+        self.width, self.height = width, height
+        self.max_radius = 0.0
+        self._configure(cell_size)
+        self.cell_of = np.zeros(0, dtype=np.intp)
+        self.slot_of = np.zeros(0, dtype=np.intp)
+        self.count = 0
+        self._out = np.zeros(64, dtype=np.intp)
+        self._hits = np.zeros(64, dtype=np.intp)
+        self.queries = self.reported_queries = 0 # Read by the profiler
+
+    def _configure(self, cell_size):
+        self.cell_size = cell_size
+        self.grid_width = math.ceil(self.width / cell_size)
+        self.grid_height = math.ceil(self.height / cell_size)
+        self.buckets = np.zeros((self.grid_width * self.grid_height, 4), dtype=np.intp)
+        self.counts = np.zeros(self.grid_width * self.grid_height, dtype=np.intp)
+
+    def cells(self, xs, ys):
+        cx = np.clip((xs // self.cell_size).astype(np.intp), 0, self.grid_width - 1)
+        cy = np.clip((ys // self.cell_size).astype(np.intp), 0, self.grid_height - 1)
+        return cx + cy * self.grid_width
+
+    def rebuild(self, store, cell_size=None):
+        """Re-indexes every entity of store from scratch."""
+        if cell_size is not None and cell_size != self.cell_size: self._configure(cell_size)
+        n = self.count = store.count
+        cells = self.cells(store.xs, store.ys)
+        order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=len(self.counts))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sorted_cells = cells[order]
+        slots = np.arange(n) - starts[sorted_cells]
+        capacity = self.buckets.shape[1]
+        needed = int(counts.max()) if n else 0
+        if needed > capacity:
+            capacity = 1 << (needed - 1).bit_length()
+            self.buckets = np.zeros((len(self.counts), capacity), dtype=np.intp)
+        self.buckets[sorted_cells, slots] = order
+        self.counts[:] = counts
+        if len(self.cell_of) < n:
+            self.cell_of = np.zeros(len(store.x), dtype=np.intp)
+            self.slot_of = np.zeros(len(store.x), dtype=np.intp)
+        self.cell_of[:n] = cells
+        self.slot_of[order] = slots
+        self.max_radius = float(store.radii.max()) if n else 0.0
+
+    def copy_state(self):
+        """
+        A copy of the index. Restoring it rather than rebuilding keeps the
+        order of entities inside each cell, which query results follow.
+        """
+        n = self.count
+        return (self.cell_size, self.buckets.copy(), self.counts.copy(), self.cell_of[:n].copy(),
+                self.slot_of[:n].copy(), self.max_radius)
+
+    def set_state(self, state):
+        cell_size, buckets, counts, cell_of, slot_of, self.max_radius = state
+        if cell_size != self.cell_size: self._configure(cell_size)
+        if self.buckets.shape == buckets.shape: self.buckets[...] = buckets
+        else: self.buckets = buckets.copy()
+        self.counts[:] = counts
+        n = self.count = len(cell_of)
+        if len(self.cell_of) < n:
+            self.cell_of = np.zeros(n, dtype=np.intp)
+            self.slot_of = np.zeros(n, dtype=np.intp)
+        self.cell_of[:n] = cell_of
+        self.slot_of[:n] = slot_of
+
+    def update(self, store, indices):
+        """Re-buckets the given entities after they moved or respawned in place."""
+        if store.count != self.count:
+            self.rebuild(store)
+            return
+        indices = np.asarray(indices, dtype=np.intp)
+        new_cells = self.cells(store.x[indices], store.y[indices])
+        changed = new_cells != self.cell_of[indices]
+        for i, new_cell in zip(indices[changed].tolist(), new_cells[changed].tolist()):
+            self._move(i, new_cell)
+        if indices.size: self.max_radius = max(self.max_radius, float(store.radius[indices].max()))
+
+    def _move(self, i, new_cell):
+        old_cell, slot = self.cell_of[i], self.slot_of[i]
+        last = self.counts[old_cell] - 1
+        moved = self.buckets[old_cell, last]
+        self.buckets[old_cell, slot] = moved
+        self.slot_of[moved] = slot
+        self.counts[old_cell] = last
+        n = self.counts[new_cell]
+        if n == self.buckets.shape[1]:
+            self.buckets = np.concatenate((self.buckets, np.zeros_like(self.buckets)), axis=1)
+        self.buckets[new_cell, n] = i
+        self.slot_of[i] = n
+        self.counts[new_cell] = n + 1
+        self.cell_of[i] = new_cell
+
+    def query(self, x, y, reach):
+        """
+        Indices of every entity whose centre cell is within reach (+ the
+        layer's largest radius) of (x, y). The result is a view into a
+        reusable buffer that the next query overwrites.
+        """
+        reach += self.max_radius
+        return self._gather(x - reach, y - reach, x + reach, y + reach)
+
+    def within(self, store, x, y, radius):
+        """Indices of the entities whose centres lie closer than radius to (x, y)."""
+        candidates = self._gather(x - radius, y - radius, x + radius, y + radius)
+        d2 = (store.x[candidates] - x) ** 2 + (store.y[candidates] - y) ** 2
+        return candidates[d2 < radius * radius]
+
+    def contacts(self, store, x, y, radius, taken):
+        """
+        Indices of the entities of store not marked in taken whose circles
+        overlap the circle (x, y, radius), in query order, and the number
+        of candidates looked at. The indices may be a view into a reusable
+        buffer, as with query().
+        """
+        loops = kernels.loops
+        if loops is None:
+            nearby = self.query(x, y, radius)
+            return touching(store, nearby[~taken[nearby]], x, y, radius), len(nearby)
+        self.queries += 1
+        args = (self.counts, self.buckets, self.grid_width, self.grid_height, self.cell_size,
+                store.x, store.y, store.radius, taken, x, y, radius, radius + self.max_radius)
+        k, tested = loops['contacts'](*args, self._hits)
+        if k > len(self._hits):
+            self._hits = np.zeros(2 * k, dtype=np.intp)
+            loops['contacts'](*args, self._hits)
+        return self._hits[:k], tested
+
+    def nearest(self, store, x, y, radius, k=1):
+        """Up to k indices within radius of (x, y), closest first; equals keep their query order."""
+        loops = kernels.loops
+        if k == 1 and loops is not None:
+            self.queries += 1
+            i = loops['nearest'](self.counts, self.buckets, self.grid_width, self.grid_height, self.cell_size,
+                                 store.x, store.y, x, y, radius)
+            self._out[0] = i
+            return self._out[:0 if i < 0 else 1]
+        candidates = self._gather(x - radius, y - radius, x + radius, y + radius)
+        d2 = (store.x[candidates] - x) ** 2 + (store.y[candidates] - y) ** 2
+        inside = d2 < radius * radius
+        candidates, d2 = candidates[inside], d2[inside]
+        if k == 1 and len(candidates) > 1: return candidates[np.argmin(d2):][:1]
+        if len(candidates) > k:
+            keep = np.argpartition(d2, k - 1)[:k]
+            candidates, d2 = candidates[keep], d2[keep]
+        return candidates[np.argsort(d2, kind='stable')]
+
+    def segment(self, store, x0, y0, x1, y1, pad=0.0):
+        """
+        Indices of the entities whose circles, grown by pad, cross the
+        segment (x0, y0)-(x1, y1) between its end points, ordered by how far
+        along the segment they sit.
+        """
+        reach = pad + self.max_radius
+        candidates = self._gather(min(x0, x1) - reach, min(y0, y1) - reach, max(x0, x1) + reach, max(y0, y1) + reach)
+        path_x, path_y = x1 - x0, y1 - y0
+        length_sq = path_x * path_x + path_y * path_y
+        if not len(candidates) or length_sq == 0: return candidates[:0]
+        rel_x, rel_y = store.x[candidates] - x0, store.y[candidates] - y0
+        dot = rel_x * path_x + rel_y * path_y
+        along = dot / length_sq
+        dist = np.hypot(rel_x - along * path_x, rel_y - along * path_y)
+        hit = (dot >= 0) & (dot <= length_sq) & (dist < store.radius[candidates] + pad)
+        return candidates[hit][np.argsort(dot[hit], kind='stable')]
+
+    def _gather(self, left, top, right, bottom):
+        loops = kernels.loops
+        if loops is not None:
+            self.queries += 1
+            args = (self.counts, self.buckets, self.grid_width, self.grid_height, self.cell_size, left, top, right, bottom)
+            k = loops['gather'](*args, self._out)
+            if k > len(self._out):
+                self._out = np.zeros(2 * k, dtype=np.intp)
+                loops['gather'](*args, self._out)
+            return self._out[:k]
+        size = self.cell_size
+        min_x = max(0, int(left // size)); max_x = min(self.grid_width - 1, int(right // size))
+        min_y = max(0, int(top // size)); max_y = min(self.grid_height - 1, int(bottom // size))
+        self.queries += 1
+        out, k = self._out, 0
+        counts, buckets = self.counts, self.buckets
+        for row in range(min_y, max_y + 1):
+            for cell in range(row * self.grid_width + min_x, row * self.grid_width + max_x + 1):
+                n = counts[cell]
+                if not n: continue
+                if k + n > len(out):
+                    out = self._out = np.concatenate((out, np.zeros(max(len(out), n), dtype=np.intp)))
+                out[k:k + n] = buckets[cell, :n]
+                k += n
+        return out[:k]
+
+
+class ObjectLayer:
+    """
+    Index over Python objects (player blobs). Each entry is a persistent
+    [obj, owner, cell, stamp] list created once per object, so syncing a
+    frame allocates nothing for objects that already exist. Entries of
+    objects that are gone go to a free list and are reused for new ones.
+    """
+    def __init__(self, width, height, cell_size, min_cell_size=None):
+        self.width, self.height = width, height
+        self.min_cell_size = min_cell_size or cell_size
+        self.max_radius = 0.0
+        self._entries = {}
+        self._free = [] # Emptied entries, for sync() and set_state() to reuse
+        self._stamp = 0
+        self._out = []
+        self.queries = self.reported_queries = 0 # Read by the profiler
+        self._configure(cell_size)
+
+    def _configure(self, cell_size):
+        self.cell_size = cell_size
+        self.grid_width = math.ceil(self.width / cell_size)
+        self.grid_height = math.ceil(self.height / cell_size)
+        self.cells = [[] for _ in range(self.grid_width * self.grid_height)]
+        for entry in self._entries.values():
+            entry[2] = self._cell(entry[0].x, entry[0].y)
+            self.cells[entry[2]].append(entry)
+
+    def _cell(self, x, y):
+        cx = min(self.grid_width - 1, max(0, int(x // self.cell_size)))
+        cy = min(self.grid_height - 1, max(0, int(y // self.cell_size)))
+        return cx + cy * self.grid_width
+
+    def retune(self, largest_radius):
+        """
+        Keeps the cell size near twice the largest radius, so a query for a
+        blob only has to look at its own and the neighbouring cells.
+        """
+        ideal = max(self.min_cell_size, 2 * largest_radius)
+        if ideal > self.cell_size or ideal < self.cell_size / 4:
+            self._configure(ideal)
+
+    def sync(self, controllers):
+        """Brings the layer in line with every controller's current blobs."""
+        self._stamp += 1
+        stamp, entries, cells = self._stamp, self._entries, self.cells
+        largest = 0.0
+        for controller in controllers:
+            for blob in controller.blobs:
+                if blob.radius > largest: largest = blob.radius
+                entry = entries.get(id(blob))
+                cell = self._cell(blob.x, blob.y)
+                if entry is None or entry[0] is not blob:
+                    # id() can be recycled once a blob is gone; the stale entry is reused.
+                    if entry is not None: cells[entry[2]].remove(entry)
+                    else: entry = entries[id(blob)] = self._entry()
+                    entry[0] = blob; entry[1] = controller; entry[2] = cell; entry[3] = stamp
+                    cells[cell].append(entry)
+                    continue
+                entry[1] = controller; entry[3] = stamp
+                if entry[2] != cell:
+                    cells[entry[2]].remove(entry)
+                    cells[cell].append(entry)
+                    entry[2] = cell
+        if len(entries) > sum(len(c.blobs) for c in controllers):
+            for key in [k for k, e in entries.items() if e[3] != stamp]:
+                entry = entries.pop(key)
+                cells[entry[2]].remove(entry)
+                self._release(entry)
+        self.max_radius = largest
+        self.retune(largest)
+
+    def _entry(self):
+        return self._free.pop() if self._free else [None, None, 0, 0]
+
+    def _release(self, entry):
+        entry[0] = entry[1] = None # Not keeping the object alive
+        self._free.append(entry)
+
+    def clear(self):
+        for entry in self._entries.values(): self._release(entry)
+        self._entries.clear()
+        for cell in self.cells: cell.clear()
+
+    def copy_state(self, refs):
+        """
+        The cell size and, cell by cell in order, refs[obj] for every indexed
+        object that is a key of refs (objects that are gone are left out).
+        """
+        order = [(e[2], refs[e[0]]) for cell in self.cells for e in cell if e[0] in refs]
+        return self.cell_size, self.max_radius, order
+
+    def set_state(self, state, resolve):
+        """Restores copy_state(); resolve(ref) gives back the (obj, owner) for a ref."""
+        cell_size, self.max_radius, order = state
+        self.clear()
+        if cell_size != self.cell_size: self._configure(cell_size)
+        stamp, entries, cells = self._stamp, self._entries, self.cells
+        for cell, ref in order:
+            obj, owner = resolve(ref)
+            entry = entries[id(obj)] = self._entry()
+            entry[0] = obj; entry[1] = owner; entry[2] = cell; entry[3] = stamp
+            cells[cell].append(entry)
+
+    def query(self, x, y, reach):
+        """
+        [obj, owner, cell, stamp] entries near (x, y). The list is reused by
+        the next query.
+        """
+        reach += self.max_radius
+        return self._gather(x - reach, y - reach, x + reach, y + reach)
+
+    def within(self, x, y, radius, exclude_owner=None, min_radius=0.0, max_radius=math.inf):
+        """
+        Objects whose centres lie closer than radius to (x, y), skipping
+        exclude_owner's and keeping only min_radius < obj.radius < max_radius.
+        """
+        radius_sq = radius * radius
+        return [e[0] for e in self._gather(x - radius, y - radius, x + radius, y + radius)
+                if e[1] is not exclude_owner and min_radius < e[0].radius < max_radius
+                and (e[0].x - x) ** 2 + (e[0].y - y) ** 2 < radius_sq]
+
+    def nearest(self, x, y, radius, k=1, **filters):
+        """Up to k objects from within(), closest first."""
+        found = self.within(x, y, radius, **filters)
+        found.sort(key=lambda obj: (obj.x - x) ** 2 + (obj.y - y) ** 2)
+        return found[:k]
+
+    def covering(self, x, y, exclude_owner=None, min_radius=0.0):
+        """Objects whose circle contains the point (x, y), with the same filters as within()."""
+        return [e[0] for e in self.query(x, y, 0.0)
+                if e[1] is not exclude_owner and e[0].radius > min_radius
+                and (e[0].x - x) ** 2 + (e[0].y - y) ** 2 < e[0].radius ** 2]
+
+    def in_query(self, obj, x, y, reach):
+        """Whether query(x, y, reach) would return obj's entry."""
+        reach += self.max_radius
+        size, cell = self.cell_size, self._entries[id(obj)][2]
+        cx, cy = cell % self.grid_width, cell // self.grid_width
+        return (max(0, int((x - reach) // size)) <= cx <= min(self.grid_width - 1, int((x + reach) // size))
+                and max(0, int((y - reach) // size)) <= cy <= min(self.grid_height - 1, int((y + reach) // size)))
+
+    def order_key(self, obj):
+        """(cell, slot) of obj's entry; query() lists entries in increasing order of it."""
+        cell = self._entries[id(obj)][2]
+        return cell, next(i for i, entry in enumerate(self.cells[cell]) if entry[0] is obj)
+
+    def _gather(self, left, top, right, bottom):
+        size = self.cell_size
+        min_x = max(0, int(left // size)); max_x = min(self.grid_width - 1, int(right // size))
+        min_y = max(0, int(top // size)); max_y = min(self.grid_height - 1, int(bottom // size))
+        self.queries += 1
+        out = self._out
+        out.clear()
+        cells = self.cells
+        for row in range(min_y, max_y + 1):
+            for cell in range(row * self.grid_width + min_x, row * self.grid_width + max_x + 1):
+                if cells[cell]: out.extend(cells[cell])
+        return out
+
+
+class SpatialHashGrid:
+    """
+    One spatial index per entity type. Player blobs live in an ObjectLayer
+    whose cell size follows the largest blob; food, mass and viruses live in
+    ArrayLayers over their EntityArrays stores.
+    """
+    def __init__(self, width, height, cell_size=200, array_cell_size=50):
+        self.blobs = ObjectLayer(width, height, cell_size, min_cell_size=cell_size)
+        self.food = ArrayLayer(width, height, array_cell_size)
+        self.mass = ArrayLayer(width, height, array_cell_size)
+        self.viruses = ArrayLayer(width, height, array_cell_size)
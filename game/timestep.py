@@ -0,0 +1,60 @@
+"""
+Fixed-timestep driving of the simulation. Game time advances in whole
+frames of 1 / TICK_RATE seconds however often the loop around it runs, so
+the physics no longer depends on how fast frames are drawn, and a speed
+multiplier scales game time against wall time.
+"""
+import time
+
+from engine import cfg
+
+
+class FixedTimestep:
+    """
+    Turns wall-clock time into a number of simulation frames. Call
+    frames_due() once per loop iteration and advance that many frames.
+    A loop that falls more than max_frames behind drops the excess
+    (counted in dropped) instead of spiralling.
+    """
+    def __init__(self, rate=cfg.TICK_RATE, speed=1.0, max_frames=5, clock=time.perf_counter):
+        self.interval = 1.0 / rate
+        self.speed, self.max_frames, self.clock = speed, max_frames, clock
+        self.accumulator = self.interval # The first call runs a frame
+        self.last = None
+        self.dropped = 0
+
+    def frames_due(self):
+        now = self.clock()
+        if self.last is not None: self.accumulator += (now - self.last) * self.speed
+        self.last = now
+        frames = int(self.accumulator / self.interval)
+        if frames > self.max_frames:
+            self.dropped += frames - self.max_frames
+            frames = self.max_frames
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= frames * self.interval
+        return frames
+
+    def until_next(self):
+        """Wall seconds until the next frame is due."""
+        return max(0.0, (self.interval - self.accumulator) / self.speed)
+
+
+def run_headless(engine, seconds, speed=1.0):
+    """
+    Plays `seconds` of game time on an Engine without a display, at speed
+    times real time (None: as fast as possible). Returns the wall time taken.
+    """
+    frames = round(seconds * cfg.TICK_RATE)
+    start = time.perf_counter()
+    if speed is None:
+        for _ in range(frames): engine.update_game_state(observe=True)
+        return time.perf_counter() - start
+    timer = FixedTimestep(speed=speed, max_frames=max(5, int(speed * 5)))
+    while frames > 0:
+        for _ in range(min(frames, timer.frames_due())):
+            engine.update_game_state(observe=True)
+            frames -= 1
+        time.sleep(timer.until_next())
+    return time.perf_counter() - start
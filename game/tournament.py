@@ -0,0 +1,245 @@
+"""
+Policy tournaments: thousands of seeded headless matches played by a pool
+of worker processes, one per core, with per-policy statistics and 95%
+confidence intervals.
+
+A tournament is a directory. tournament.json holds its settings and every
+finished match is appended to matches.jsonl as one line, so an interrupted
+tournament resumes by running it again (python tournament.py DIR is
+enough): only the matches missing from matches.jsonl are played. A larger
+--matches extends a finished one.
+
+Match i plays roster i % len(rosters) from seed + i. A roster holds
+reset_game settings (ai_opponents, num_cpu, num_food, num_viruses); the
+human player's seat is taken out. Entrants are the AI policies by name and
+'scripted' for the PlayerController bots, and each is scored per match on
+
+    mass        final mass
+    survival    frames until it was first eaten (the match length if never)
+    kills       controllers whose last blob it ate (Engine.kills)
+    deaths      times it was eaten
+    dominance   times it became dominant, as RewardEngine scores it
+
+The table gives each entrant's mean per controller. Controllers of one
+match are not independent, so the confidence interval is taken over
+matches, each contributing the mean of the entrant's controllers in it
+(normal approximation, sound past a few dozen matches). The kill matrix
+counts who ate whom, per match.
+
+    python tournament.py runs/t1 --matches 2000 --model aggressor@v2=checkpoints/aggressor-v2.onnx \\
+        --roster '{"ai_opponents": {"aggressor": 2, "aggressor@v2": 2}, "num_cpu": 8}'
+"""
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import time
+from collections import Counter, defaultdict
+
+from engine import Engine, cfg
+from models import MODEL_PATHS, ModelManager, shared_models
+
+METRICS = ('mass', 'survival', 'kills', 'deaths', 'dominance')
+Z95 = 1.959964
+DEFAULT_ROSTER = {'ai_opponents': {'aggressor': 2, 'farmer': 2, 'survivor': 2}, 'num_cpu': 8,
+                  'num_food': cfg.NUM_FOOD, 'num_viruses': cfg.NUM_VIRUSES}
+DEFAULTS = {'matches': 1000, 'frames': cfg.MAX_EPISODE_FRAMES, 'seed': 0, 'world': [cfg.WORLD_WIDTH, cfg.WORLD_HEIGHT],
+            'rosters': [DEFAULT_ROSTER], 'models': {}}
+
+_engine = None # The worker's Engine, reused for all its matches
+
+
+def _start_worker(model_paths, world_size):
+    global _engine
+    # One process per core: each worker's onnxruntime keeps to a single thread.
+    models = shared_models(model_paths=model_paths, variants=cfg.POLICY_VARIANTS, intra_op_threads=1)
+    _engine = Engine(ai_models=models, observe=False, world_size=world_size)
+
+
+def play(match):
+    """Plays one match, (index, seed, roster index, roster, frames), and returns its record."""
+    index, seed, roster_index, roster, frames = match
+    start = time.perf_counter()
+    engine = _engine
+    engine.reset(seed=seed, **roster)
+    engine.remove_player(engine.player)
+    entrant = {c: c.policy or 'scripted' for c in engine.all_controllers}
+    kills, deaths, dominance, first_death, matrix = Counter(), Counter(), Counter(), {}, Counter()
+    dominant = set()
+    while engine.frame < frames:
+        _, _, _, info = engine.step()
+        for eater, eaten in info['kills']:
+            kills[eater] += 1; deaths[eaten] += 1
+            first_death.setdefault(eaten, engine.frame)
+            matrix[entrant[eater], entrant[eaten]] += 1
+        dominance.update(info['dominant'] - dominant)
+        dominant = info['dominant']
+        if info['truncated']: break
+    entrants = [{'policy': entrant[c], 'mass': c.mass, 'survival': first_death.get(c, engine.frame),
+                 'kills': kills[c], 'deaths': deaths[c], 'dominance': dominance[c]} for c in engine.all_controllers]
+    return {'match': index, 'seed': seed, 'roster': roster_index, 'frames': engine.frame,
+            'seconds': round(time.perf_counter() - start, 3), 'entrants': entrants,
+            'kills': [[eater, eaten, n] for (eater, eaten), n in sorted(matrix.items())]}
+
+
+class Standings:
+    """Running per-entrant sums over match records; table() and summary() read them out."""
+    def __init__(self):
+        self.matches = 0
+        self.controllers = Counter()
+        self.sums = defaultdict(lambda: dict.fromkeys(METRICS, (0, 0.0, 0.0))) # entrant -> metric -> (n, sum, sum of squares)
+        self.kills = Counter()
+
+    def add(self, record):
+        groups = defaultdict(list)
+        for scores in record['entrants']: groups[scores['policy']].append(scores)
+        for policy, group in groups.items():
+            self.controllers[policy] += len(group)
+            sums = self.sums[policy]
+            for metric in METRICS:
+                value = sum(scores[metric] for scores in group) / len(group)
+                n, total, squares = sums[metric]
+                sums[metric] = (n + 1, total + value, squares + value * value)
+        for eater, eaten, n in record['kills']: self.kills[eater, eaten] += n
+        self.matches += 1
+
+    def interval(self, policy, metric):
+        """(mean, half-width of the 95% interval); the half-width is nan below two matches."""
+        n, total, squares = self.sums[policy][metric]
+        mean = total / n
+        if n < 2: return mean, math.nan
+        variance = max(0.0, (squares - n * mean * mean) / (n - 1))
+        return mean, Z95 * math.sqrt(variance / n)
+
+    def summary(self):
+        return {'matches': self.matches,
+                'entrants': {policy: {'controllers': self.controllers[policy],
+                                      **{metric: dict(zip(('mean', 'ci95'), self.interval(policy, metric))) for metric in METRICS}}
+                             for policy in sorted(self.sums)},
+                'kills_per_match': {f"{eater} > {eaten}": n / self.matches for (eater, eaten), n in sorted(self.kills.items())}}
+
+    def table(self):
+        policies = sorted(self.sums)
+        lines = [f"{self.matches} matches", f"{'entrant':<16} | {'n':>5} | " + ' | '.join(f"{metric:>17}" for metric in METRICS)]
+        for policy in policies:
+            cells = []
+            for metric in METRICS:
+                mean, half = self.interval(policy, metric)
+                cells.append(f"{mean:>8.1f} ± {half:<6.1f}" if not math.isnan(half) else f"{mean:>8.1f}         ")
+            lines.append(f"{policy:<16} | {self.controllers[policy]:>5} | " + ' | '.join(cells))
+        if self.kills:
+            lines.append("kills per match (row ate column)")
+            lines.append(f"{'':<16} | " + ' | '.join(f"{p:>12}" for p in policies))
+            for eater in policies:
+                lines.append(f"{eater:<16} | " + ' | '.join(f"{self.kills[eater, eaten] / self.matches:>12.2f}" for eaten in policies))
+        return '\n'.join(lines)
+
+
+def read_matches(path):
+    """The records in matches.jsonl; a last line cut short by an interruption is dropped from the file."""
+    records, good = [], 0
+    if not os.path.exists(path): return records
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                if not line.endswith(b'\n'): raise ValueError("unterminated line")
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            good += len(line)
+    if good != os.path.getsize(path):
+        with open(path, 'r+b') as f: f.truncate(good)
+    return records
+
+
+def load_settings(directory, given):
+    """
+    The tournament's settings: those saved in directory, else DEFAULTS
+    updated with given (the options set on the command line). A saved
+    tournament only accepts a new match count.
+    """
+    path = os.path.join(directory, 'tournament.json')
+    if os.path.exists(path):
+        with open(path) as f: settings = json.load(f)
+        changed = [key for key, value in given.items() if key != 'matches' and settings[key] != value]
+        if changed: raise ValueError(f"{directory} was started with other {', '.join(changed)}; use a new directory")
+    else:
+        settings = dict(DEFAULTS)
+    settings.update(given)
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w') as f: json.dump(settings, f, indent=1)
+    os.replace(path + '.tmp', path)
+    return settings
+
+
+def check_models(settings):
+    """Raises ValueError if a roster has a policy without a model: reset_game would quietly leave it out."""
+    manager = ModelManager(model_paths={**MODEL_PATHS, **settings['models']})
+    default = {'aggressor': 1, 'farmer': 1, 'survivor': 1} # reset_game's, when a roster names none
+    wanted = {name for roster in settings['rosters'] for name, count in (roster.get('ai_opponents') or default).items() if count}
+    missing = sorted(name for name in wanted if name not in manager)
+    if missing: raise ValueError(f"no loadable model for {', '.join(missing)}")
+
+
+def run(directory, settings, workers=None, report_every=10.0, start_method=None):
+    """Plays the matches directory is missing, streaming the table, and returns the Standings."""
+    model_paths = {**MODEL_PATHS, **settings['models']}
+    matches_path = os.path.join(directory, 'matches.jsonl')
+    standings, done = Standings(), set()
+    for record in read_matches(matches_path):
+        if record['match'] in done: continue
+        done.add(record['match'])
+        standings.add(record)
+    rosters, seed, frames = settings['rosters'], settings['seed'], settings['frames']
+    todo = [(i, seed + i, i % len(rosters), rosters[i % len(rosters)], frames) for i in range(settings['matches']) if i not in done]
+    print(f"{len(done)} matches on file, {len(todo)} to play")
+    if not todo: return standings
+
+    workers = min(len(todo), workers or os.cpu_count() or 1)
+    context = mp.get_context(start_method)
+    reported = time.perf_counter()
+    with open(matches_path, 'a') as out, \
+         context.Pool(workers, initializer=_start_worker, initargs=(model_paths, tuple(settings['world']))) as pool:
+        try:
+            for record in pool.imap_unordered(play, todo):
+                out.write(json.dumps(record) + '\n'); out.flush()
+                standings.add(record)
+                if time.perf_counter() - reported >= report_every:
+                    print(standings.table(), flush=True)
+                    reported = time.perf_counter()
+        except KeyboardInterrupt:
+            pool.terminate()
+            print(f"Interrupted after {standings.matches} matches; run again to resume.")
+    return standings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory')
+    parser.add_argument('--matches', type=int, help=f"total matches (default {DEFAULTS['matches']})")
+    parser.add_argument('--frames', type=int, help=f"frames per match (default {DEFAULTS['frames']})")
+    parser.add_argument('--seed', type=int, help="seed of match 0")
+    parser.add_argument('--world', type=int, nargs=2)
+    parser.add_argument('--roster', type=json.loads, action='append', dest='rosters', help="JSON reset_game settings; repeatable")
+    parser.add_argument('--model', action='append', dest='models', metavar='NAME=PATH', help="extra policy, e.g. a checkpoint; repeatable")
+    parser.add_argument('--workers', type=int, help="processes (default: one per core)")
+    parser.add_argument('--report-every', type=float, default=10.0, help="seconds between tables")
+    args = parser.parse_args()
+
+    given = {key: getattr(args, key) for key in ('matches', 'frames', 'seed', 'world', 'rosters') if getattr(args, key) is not None}
+    if args.models: given['models'] = dict(model.split('=', 1) for model in args.models)
+    try:
+        settings = load_settings(args.directory, given)
+        check_models(settings)
+    except ValueError as error:
+        parser.error(str(error))
+    standings = run(args.directory, settings, args.workers, args.report_every)
+    print(standings.table())
+    summary_path = os.path.join(args.directory, 'summary.json')
+    with open(summary_path + '.tmp', 'w') as f: json.dump(standings.summary(), f, indent=1)
+    os.replace(summary_path + '.tmp', summary_path)
+
+
+if __name__ == '__main__':
+    main()
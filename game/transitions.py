@@ -0,0 +1,206 @@
+"""
+Streaming storage for training data. TransitionWriter appends rows of
+observation, action, reward and done flag to chunked .npy files that are
+memory-mapped while they fill, so collecting millions of transitions
+never holds more than one batch of rows in RAM. Each finished chunk is
+added to index.json. TransitionReader memory-maps the chunks back
+read-only, so slicing a field reads straight from the page cache without
+copying.
+
+A directory holds:
+    index.json          {"fields": {name: [shape, dtype]}, "chunks": [{"rows": n, "files": {name: file}}]}
+    00000-obs.npy, 00000-action.npy, ...    one file per field and chunk
+
+Rows keep the order they were appended in. Engine.step() appends one row
+per agent per step (Engine.collect_transitions), so an agent's next
+observation is in its next row unless done is set.
+
+    python transitions.py data/ --steps 5000 --chunk-rows 4096
+"""
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+
+def default_fields(config):
+    """The fields Engine.collect_transitions writes."""
+    return {'obs': ((config.FRAME_STACK, config.OBS_SIZE, config.OBS_SIZE), 'uint8'),
+            'action': ((3,), 'float32'), 'reward': ((), 'float32'), 'done': ((), 'bool'),
+            'agent': ((), 'int16'), 'episode': ((), 'uint64')}
+
+
+def _truncate(path, rows):
+    """
+    Shrinks a filled-in-part .npy file to its first rows in place: the
+    header is rewritten at its old length (a shorter shape only needs more
+    padding) and the unused tail is cut off.
+    """
+    with open(path, 'r+b') as f:
+        if np.lib.format.read_magic(f) != (1, 0): raise ValueError(f"{path}: unexpected .npy version")
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+        header = "{'descr': %r, 'fortran_order': %r, 'shape': %r, }" % (
+            np.lib.format.dtype_to_descr(dtype), fortran_order, (rows,) + shape[1:])
+        header = header.ljust(offset - 11) + '\n'
+        f.seek(0)
+        f.write(np.lib.format.MAGIC_PREFIX + bytes((1, 0)) + struct.pack('<H', len(header)) + header.encode('latin1'))
+        f.truncate(offset + rows * int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize)
+
+
+class TransitionWriter:
+    """
+    Appends rows to the dataset in directory, continuing an existing one
+    (whose fields must match). Rows are committed chunk by chunk: a chunk
+    becomes visible to readers once it holds chunk_rows rows, or on
+    flush()/close().
+    """
+    def __init__(self, directory, fields, chunk_rows=4096):
+        self.directory, self.chunk_rows = directory, chunk_rows
+        self.fields = {name: (tuple(shape), np.dtype(dtype)) for name, (shape, dtype) in fields.items()}
+        described = {name: [list(shape), dtype.str] for name, (shape, dtype) in self.fields.items()}
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'index.json')
+        if os.path.exists(path):
+            with open(path) as f: self.index = json.load(f)
+            if self.index['fields'] != described: raise ValueError(f"{directory} holds different fields")
+        else:
+            self.index = {'fields': described, 'chunks': []}
+        self.rows = sum(chunk['rows'] for chunk in self.index['chunks']) # Committed
+        self._chunk, self._filled = None, 0
+
+    def append(self, **row):
+        self.extend(**{name: np.asarray(value)[None] for name, value in row.items()})
+
+    def extend(self, **batch):
+        """Appends len(batch[field]) rows; every field must be given."""
+        if batch.keys() != self.fields.keys(): raise ValueError(f"expected the fields {sorted(self.fields)}")
+        n = len(next(iter(batch.values())))
+        done = 0
+        while done < n:
+            if self._chunk is None: self._open_chunk()
+            take = min(n - done, self.chunk_rows - self._filled)
+            for name, array in self._chunk.items():
+                array[self._filled:self._filled + take] = batch[name][done:done + take]
+            self._filled += take; done += take
+            if self._filled == self.chunk_rows: self._commit()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open_chunk(self):
+        number = len(self.index['chunks'])
+        self._files = {name: f"{number:05d}-{name}.npy" for name in self.fields}
+        self._chunk = {name: np.lib.format.open_memmap(self._path(self._files[name]), mode='w+', dtype=dtype,
+                                                       shape=(self.chunk_rows,) + shape)
+                       for name, (shape, dtype) in self.fields.items()}
+        self._filled = 0
+
+    def _commit(self):
+        for array in self._chunk.values(): array.flush()
+        self._chunk = None # Unmaps the files before a partial chunk is cut down
+        if self._filled < self.chunk_rows:
+            for file in self._files.values(): _truncate(self._path(file), self._filled)
+        self.index['chunks'].append({'rows': self._filled, 'files': self._files})
+        self.rows += self._filled
+        temporary = self._path('index.json.tmp')
+        with open(temporary, 'w') as f: json.dump(self.index, f)
+        os.replace(temporary, self._path('index.json'))
+
+    def flush(self):
+        """Commits the rows of the current chunk now, as a shorter chunk."""
+        if self._chunk is not None and self._filled: self._commit()
+
+    def close(self):
+        self.flush()
+        if self._chunk is not None: # Opened but empty
+            self._chunk = None
+            for file in self._files.values(): os.remove(self._path(file))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TransitionReader:
+    """
+    Read-only, memory-mapped view of a TransitionWriter directory.
+    chunks[i] maps field names to that chunk's arrays; refresh() picks up
+    chunks committed since.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.chunks = []
+        self.starts = np.zeros(1, dtype=np.int64)
+        self.refresh()
+
+    def refresh(self):
+        with open(os.path.join(self.directory, 'index.json')) as f: index = json.load(f)
+        for chunk in index['chunks'][len(self.chunks):]:
+            self.chunks.append({name: np.load(os.path.join(self.directory, file), mmap_mode='r')
+                                for name, file in chunk['files'].items()})
+        self.starts = np.concatenate(([0], np.cumsum([len(next(iter(c.values()))) for c in self.chunks]))).astype(np.int64)
+        return self
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def field(self, name):
+        """The field in every chunk, as a list of memory-mapped arrays."""
+        return [chunk[name] for chunk in self.chunks]
+
+    def take(self, rows, fields=None):
+        """
+        Copies the given global row numbers out, e.g. a random minibatch.
+        Returns a dict of arrays in the order of rows.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        chunk_of = np.searchsorted(self.starts, rows, side='right') - 1
+        out = {}
+        for name in fields or self.chunks[0]:
+            first = self.chunks[0][name]
+            result = np.empty((len(rows),) + first.shape[1:], dtype=first.dtype)
+            for c in np.unique(chunk_of):
+                picked = chunk_of == c
+                result[picked] = self.chunks[c][name][rows[picked] - self.starts[c]]
+            out[name] = result
+        return out
+
+
+def main():
+    """Collects transitions from a headless match of AI opponents."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory')
+    parser.add_argument('--steps', type=int, default=5000)
+    parser.add_argument('--chunk-rows', type=int, default=4096)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--random-player', action='store_true', help="drive the player with random actions and record them")
+    args = parser.parse_args()
+
+    from engine import Engine, cfg
+    engine = Engine()
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    with TransitionWriter(args.directory, default_fields(cfg), args.chunk_rows) as writer:
+        first = writer.rows
+        engine.collect_transitions(writer)
+        engine.reset(seed=args.seed)
+        for step in range(args.steps):
+            actions = {0: rng.uniform(-1, 1, 3).astype(np.float32)} if args.random_player else None
+            _, _, _, info = engine.step(actions)
+            if info['truncated']: engine.reset(seed=args.seed + step + 1)
+    elapsed = time.perf_counter() - start
+    reader = TransitionReader(args.directory)
+    written = len(reader) - first
+    size = sum(os.path.getsize(os.path.join(args.directory, f)) for f in os.listdir(args.directory))
+    print(f"{written} transitions in {elapsed:.1f} s ({written / elapsed:.0f}/s), "
+          f"{len(reader)} in {len(reader.chunks)} chunks, {size / 2**20:.1f} MiB on disk")
+
+
+if __name__ == '__main__':
+    main()
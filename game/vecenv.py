@@ -0,0 +1,211 @@
+"""
+Vectorized environments: N independent Engine worlds stepped by a pool of
+worker processes. Observations, rewards, dones and actions live in shared
+memory, so the pipes only ever carry tiny command tuples.
+"""
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from engine import Engine, cfg
+from models import shared_models
+
+
+def _agent_count(settings):
+    ai_opponents = settings.get('ai_opponents')
+    if ai_opponents is None: ai_opponents = {'aggressor': 1, 'farmer': 1, 'survivor': 1}
+    return 1 + sum(ai_opponents.values())
+
+
+class SharedArrays:
+    """A named set of NumPy arrays, each backed by its own SharedMemory block."""
+    def __init__(self, spec, names=None):
+        self.spec = spec
+        self._blocks = {}
+        self.arrays = {}
+        for key, (shape, dtype) in spec.items():
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            if names is None:
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(name=names[key])
+            self._blocks[key] = block
+            self.arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if names is None:
+            for array in self.arrays.values(): array.fill(0)
+
+    @property
+    def names(self):
+        return {key: block.name for key, block in self._blocks.items()}
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def close(self, unlink=False):
+        self.arrays.clear()
+        for block in self._blocks.values():
+            block.close()
+            if unlink: block.unlink()
+        self._blocks.clear()
+
+
+def _worker(conn, spec, names, env_ids, settings, seeds, engine_kwargs, inference_threads):
+    shared = SharedArrays(spec, names)
+    obs_buf, act_buf, mask_buf = shared['obs'], shared['actions'], shared['action_mask']
+    # One worker per core: keep each worker's ONNX runtime to its own share.
+    # Sessions only load once an AI opponent actually spawns.
+    threads = {'intra_op_threads': inference_threads} if inference_threads else {}
+    models = shared_models(variants=cfg.POLICY_VARIANTS, **threads)
+    engines = {i: Engine(ai_models=models, **engine_kwargs) for i in env_ids}
+    episodes = {i: 0 for i in env_ids}
+
+    def reset(i):
+        seed = seeds[i] + episodes[i] * len(seeds)
+        obs = engines[i].reset(seed=seed, **settings[i])
+        shared['agent_counts'][i] = len(engines[i].agents)
+        for a, stack in obs.items(): obs_buf[i, a] = stack
+
+    try:
+        while True:
+            command = conn.recv()
+            if command == 'reset':
+                for i in env_ids:
+                    episodes[i] = 0
+                    reset(i)
+            elif command == 'step':
+                for i in env_ids:
+                    engine = engines[i]
+                    actions = {a: act_buf[i, a] for a in range(len(engine.agents)) if mask_buf[i, a]}
+                    obs, rewards, dones, info = engine.step(actions)
+                    for a, stack in obs.items(): obs_buf[i, a] = stack
+                    for a, reward in rewards.items(): shared['rewards'][i, a] = reward
+                    for a, done in dones.items(): shared['dones'][i, a] = done
+                    shared['frames'][i] = info['frame']
+                    shared['episode_ended'][i] = info['truncated']
+                    if info['truncated']:
+                        episodes[i] += 1
+                        reset(i)
+            elif command == 'close':
+                break
+            conn.send(True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shared.close()
+
+
+class VecEnv:
+    """
+    Runs num_envs Engine instances across num_workers processes.
+
+    settings is one dict of reset_game keyword arguments (num_cpu, num_food,
+    num_viruses, ai_opponents) or a list with one dict per env. Env i starts
+    from seeds[i] (default: seed + i). Episodes that hit MAX_EPISODE_FRAMES
+    are reset automatically; episode_ended marks which envs did so.
+
+    The arrays returned by reset()/step() are views into shared memory and
+    are overwritten by the next step; copy them if you need to keep them.
+    Actions are raw (move_x, move_y, special) triples per agent. Agents whose
+    action_mask entry is False use their own ONNX model (or, for the player,
+    stand still).
+    """
+    def __init__(self, num_envs, settings=None, seed=0, seeds=None, num_workers=None,
+                 engine_kwargs=None, inference_threads=1, start_method=None):
+        settings = settings or {}
+        self.settings = list(settings) if isinstance(settings, (list, tuple)) else [dict(settings) for _ in range(num_envs)]
+        if len(self.settings) != num_envs: raise ValueError("need one settings dict per env")
+        self.seeds = list(seeds) if seeds is not None else [seed + i for i in range(num_envs)]
+        self.num_envs = num_envs
+        self.max_agents = max(_agent_count(s) for s in self.settings)
+        num_workers = min(num_envs, num_workers or os.cpu_count() or 1)
+
+        obs_shape = (num_envs, self.max_agents, cfg.FRAME_STACK, cfg.OBS_SIZE, cfg.OBS_SIZE)
+        spec = {
+            'obs': (obs_shape, np.uint8),
+            'actions': ((num_envs, self.max_agents, 3), np.float32),
+            'action_mask': ((num_envs, self.max_agents), np.bool_),
+            'rewards': ((num_envs, self.max_agents), np.float32),
+            'dones': ((num_envs, self.max_agents), np.bool_),
+            'agent_counts': ((num_envs,), np.int32),
+            'frames': ((num_envs,), np.int64),
+            'episode_ended': ((num_envs,), np.bool_),
+        }
+        self._shared = SharedArrays(spec)
+        self.obs = self._shared['obs']
+        self.rewards = self._shared['rewards']
+        self.dones = self._shared['dones']
+        self.agent_counts = self._shared['agent_counts']
+        self.episode_ended = self._shared['episode_ended']
+
+        context = mp.get_context(start_method)
+        self._conns, self._processes = [], []
+        engine_kwargs = engine_kwargs or {}
+        for w in range(num_workers):
+            env_ids = list(range(w, num_envs, num_workers))
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker, daemon=True,
+                                      args=(child, spec, self._shared.names, env_ids, self.settings,
+                                            self.seeds, engine_kwargs, inference_threads))
+            process.start()
+            child.close()
+            self._conns.append(parent); self._processes.append(process)
+        self._waiting = False
+        self.closed = False
+
+    def _broadcast(self, command):
+        for conn in self._conns: conn.send(command)
+
+    def _gather(self):
+        for conn in self._conns: conn.recv()
+
+    def reset(self):
+        """Resets every env to its starting seed; returns the observation buffer."""
+        self._broadcast('reset'); self._gather()
+        self.rewards.fill(0); self.dones.fill(False)
+        return self.obs
+
+    def step_async(self, actions=None, action_mask=None):
+        """
+        Starts a step in every worker and returns immediately. actions is
+        (num_envs, max_agents, 3); action_mask defaults to True wherever
+        actions were given.
+        """
+        if self._waiting: raise RuntimeError("step_wait() must be called before the next step_async()")
+        if actions is None:
+            self._shared['action_mask'].fill(False)
+        else:
+            self._shared['actions'][...] = actions
+            self._shared['action_mask'][...] = True if action_mask is None else action_mask
+        self._broadcast('step')
+        self._waiting = True
+
+    def step_wait(self):
+        """Blocks until the pending step finished; returns (obs, rewards, dones, agent_counts)."""
+        self._gather()
+        self._waiting = False
+        return self.obs, self.rewards, self.dones, self.agent_counts
+
+    def step(self, actions=None, action_mask=None):
+        self.step_async(actions, action_mask)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed: return
+        if self._waiting: self._gather()
+        for conn, process in zip(self._conns, self._processes):
+            try:
+                conn.send('close')
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=5)
+            if process.is_alive(): process.terminate()
+        self._shared.close(unlink=True)
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,128 @@
+"""
+Array-backed world state. Food, ejected mass and viruses are stored as
+contiguous NumPy arrays (one array per attribute) instead of one Blob object
+each, so movement, decay and eating run as vectorized passes.
+"""
+import numpy as np
+
+
+class EntityArrays:
+    """
+    Struct-of-arrays storage for one entity type. The live entities occupy
+    the first `count` slots of every array; the rest is spare capacity.
+    uid numbers entities in the order they were added, so an entity keeps
+    its uid while others are removed around it (the server streams by uid).
+    """
+    FIELDS = ('x', 'y', 'radius', 'dx', 'dy', 'timer', 'uid')
+
+    def __init__(self, radius, color, capacity=64):
+        self.default_radius = radius
+        self.color = color
+        self.count = 0
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.radius = np.zeros(capacity)
+        self.dx = np.zeros(capacity)
+        self.dy = np.zeros(capacity)
+        self.timer = np.zeros(capacity, dtype=np.int32)
+        self.uid = np.zeros(capacity, dtype=np.int64)
+        self.next_uid = 0
+
+    def __len__(self):
+        return self.count
+
+    # Views over the live slots only.
+    @property
+    def xs(self): return self.x[:self.count]
+    @property
+    def ys(self): return self.y[:self.count]
+    @property
+    def radii(self): return self.radius[:self.count]
+
+    def _reserve(self, needed):
+        capacity = len(self.x)
+        if needed <= capacity: return
+        new_capacity = max(needed, capacity * 2)
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            grown = np.zeros(new_capacity, dtype=old.dtype)
+            grown[:self.count] = old[:self.count]
+            setattr(self, name, grown)
+
+    def clear(self):
+        self.count = 0
+
+    def copy_state(self):
+        """The live entities as one (len(FIELDS), count) float64 array."""
+        n = self.count
+        return np.stack([getattr(self, name)[:n] for name in self.FIELDS])
+
+    def set_state(self, state, next_uid=None):
+        """
+        Makes the live entities those of a copy_state() array, reusing the
+        existing buffers. next_uid is the counter when the copy was taken;
+        by default uids continue after the largest live one.
+        """
+        n = state.shape[1]
+        self._reserve(n)
+        for name, values in zip(self.FIELDS, state): getattr(self, name)[:n] = values
+        self.count = n
+        self.next_uid = next_uid if next_uid is not None else int(self.uid[:n].max(initial=-1)) + 1
+
+    def add(self, x, y, dx=0.0, dy=0.0, timer=0, radius=None):
+        """Appends one entity and returns its index."""
+        self._reserve(self.count + 1)
+        i = self.count
+        self.x[i], self.y[i] = x, y
+        self.dx[i], self.dy[i] = dx, dy
+        self.radius[i] = self.default_radius if radius is None else radius
+        self.timer[i] = timer
+        self.uid[i] = self.next_uid; self.next_uid += 1
+        self.count += 1
+        return i
+
+    def extend(self, xs, ys):
+        """Appends a batch of stationary entities with the default radius."""
+        n = len(xs)
+        self._reserve(self.count + n)
+        s = slice(self.count, self.count + n)
+        self.x[s], self.y[s] = xs, ys
+        self.dx[s] = 0.0; self.dy[s] = 0.0
+        self.radius[s] = self.default_radius
+        self.timer[s] = 0
+        self.uid[s] = np.arange(self.next_uid, self.next_uid + n); self.next_uid += n
+        self.count += n
+
+    def remove(self, mask):
+        """Drops every live entity where mask is True, keeping the order of the rest."""
+        keep = ~np.asarray(mask, dtype=bool)
+        kept = int(keep.sum())
+        if kept == self.count: return
+        for name in self.FIELDS:
+            arr = getattr(self, name)
+            arr[:kept] = arr[:self.count][keep]
+        self.count = kept
+
+    def respawn(self, indices, xs, ys):
+        """Moves the given entities to new positions in place."""
+        self.x[indices] = xs
+        self.y[indices] = ys
+        self.dx[indices] = 0.0
+        self.dy[indices] = 0.0
+
+    def advance(self, friction):
+        """One frame of free movement with friction, plus decay countdown (Mass.move)."""
+        n = self.count
+        self.x[:n] += self.dx[:n]; self.y[:n] += self.dy[:n]
+        self.dx[:n] *= friction; self.dy[:n] *= friction
+        self.timer[:n] -= 1
+
+    def remove_expired(self):
+        if self.count: self.remove(self.timer[:self.count] <= 0)
+
+
+def touching(store, indices, x, y, radius):
+    """Subset of indices whose circles overlap the circle (x, y, radius)."""
+    d2 = (store.x[indices] - x) ** 2 + (store.y[indices] - y) ** 2
+    reach = store.radius[indices] + radius
+    return indices[d2 < reach * reach]